@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from alarm_processor import AlarmProcessor
+from transport import create_queue
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def run(cameras, rounds, siren_delay, port):
+    latencies = []
+    detected = {}
+    expected = cameras * rounds
+    received = asyncio.Event()
+
+    async def handle_siren(request):
+        # Сирена отвечает с задержкой, как реальное устройство
+        await asyncio.sleep(siren_delay)
+        key = (int(request.query['camera']), int(request.query['round']))
+        latencies.append((time.time() - detected[key]) * 1000)
+        if len(latencies) == expected:
+            received.set()
+        return web.Response(text='ok')
+
+    async def handle_dead(request):
+        # Зависшая сирена: отвечает дольше таймаута
+        await asyncio.sleep(60)
+        return web.Response(text='late')
+
+    app = web.Application()
+    app.router.add_get('/siren', handle_siren)
+    app.router.add_get('/dead', handle_dead)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    # Каждая камера стучится в свою сирену: 127.0.0.N - отдельный хост для пула соединений
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+
+    alarm_queue = create_queue()
+    response_queue = create_queue()
+    alarm_process = AlarmProcessor(alarm_queue, response_queue, timeout=1, retries=1, dedup_window=0)
+    alarm_process.start()
+    await asyncio.sleep(1)
+
+    start = time.time()
+    for round_number in range(rounds):
+        # Перед живыми камерами в очереди стоит тревога на зависшую сирену
+        alarm_queue.put(('alarm', f'http://127.0.0.254:{port}/dead', 0, time.time()))
+        for camera in range(1, cameras + 1):
+            detected[(camera, round_number)] = time.time()
+            alarm_queue.put(('alarm', f'http://127.0.0.{camera + 1}:{port}/siren?camera={camera}&round={round_number}',
+                             camera, detected[(camera, round_number)]))
+        await asyncio.sleep(0.5)
+    await asyncio.wait_for(received.wait(), timeout=60)
+    elapsed = time.time() - start - 0.5 * (rounds - 1)
+
+    alarm_process.running.value = False
+    while not response_queue.empty():
+        response_queue.get_nowait()
+    alarm_process.join()
+    await runner.cleanup()
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AlarmProcessor dispatch with many cameras firing at once')
+    parser.add_argument('--cameras', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--siren-delay', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=18081)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs('logs', exist_ok=True)
+    latencies, elapsed = asyncio.run(run(args.cameras, args.rounds, args.siren_delay, args.port))
+    print(f"alarms: {len(latencies)} from {args.cameras} cameras, siren delay {args.siren_delay * 1000:.0f} ms")
+    print(f"throughput: {len(latencies) / elapsed:.0f} alarms/s")
+    print(f"dispatch latency p50: {percentile(latencies, 50):.1f} ms  p99: {percentile(latencies, 99):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from alarm_processor import AlarmProcessor
+from transport import create_queue
+
+TARGET_MS = 50
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def run(alarms, interval, port):
+    latencies = []
+    detected = {}
+    received = asyncio.Event()
+
+    async def handle_alarm(request):
+        alarm_id = int(request.query['id'])
+        latencies.append((time.time() - detected[alarm_id]) * 1000)
+        if len(latencies) == alarms:
+            received.set()
+        return web.Response(text='ok')
+
+    app = web.Application()
+    app.router.add_get('/alarm', handle_alarm)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    alarm_queue = create_queue()
+    response_queue = create_queue()
+    alarm_process = AlarmProcessor(alarm_queue, response_queue)
+    alarm_process.start()
+    # Даём процессу запуститься, чтобы не мерить время старта
+    await asyncio.sleep(1)
+
+    for alarm_id in range(alarms):
+        detected[alarm_id] = time.time()
+        alarm_queue.put(('alarm', f'http://127.0.0.1:{port}/alarm?id={alarm_id}', alarm_id, detected[alarm_id]))
+        await asyncio.sleep(interval)
+    await asyncio.wait_for(received.wait(), timeout=30)
+
+    alarm_process.running.value = False
+    while not response_queue.empty():
+        response_queue.get_nowait()
+    alarm_process.join()
+    await runner.cleanup()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detection to alarm_url GET latency through AlarmProcessor')
+    parser.add_argument('--alarms', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.1)
+    parser.add_argument('--port', type=int, default=18080)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs('logs', exist_ok=True)
+    latencies = asyncio.run(run(args.alarms, args.interval, args.port))
+    p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+    print(f"alarms: {len(latencies)}")
+    print(f"p50: {p50:.1f} ms  p99: {p99:.1f} ms  max: {max(latencies):.1f} ms")
+    print(f"target < {TARGET_MS} ms: {'OK' if p99 < TARGET_MS else 'FAILED'}")
+
+
+if __name__ == '__main__':
+    main()
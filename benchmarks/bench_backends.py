@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from inference_backend import load_backend
+from inference_processor import CONF, MAX_DET
+from tools.export_models import load_frames
+
+AGREEMENT_IOU = 0.5
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def iou(a, b):
+    x1, y1 = max(a['x1'], b['x1']), max(a['y1'], b['y1'])
+    x2, y2 = min(a['x2'], b['x2']), min(a['y2'], b['y2'])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = ((a['x2'] - a['x1']) * (a['y2'] - a['y1']) + (b['x2'] - b['x1']) * (b['y2'] - b['y1']) - inter)
+    return inter / union if union > 0 else 0
+
+
+def agrees(reference, summary):
+    # Кадр совпадает, если оба бэкенда нашли (или не нашли) объект и лучшие рамки пересекаются
+    if not reference or not summary:
+        return not reference and not summary
+    return (reference[0]['class'] == summary[0]['class']
+            and iou(reference[0]['box'], summary[0]['box']) >= AGREEMENT_IOU)
+
+
+def run_backend(spec, frames, conf, max_det):
+    backend, path = spec.split(':', 1)
+    model = load_backend(backend, path)
+    # Прогрев: первый вызов выделяет буферы и компилирует граф
+    model.predict([frames[0][1]], conf, max_det)
+    latencies, summaries = [], []
+    for _, image in frames:
+        start = time.perf_counter()
+        result = model.predict([image], conf, max_det)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        summaries.append(result.summary())
+    return latencies, summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-frame latency and detection agreement between backends')
+    parser.add_argument('frames', help='folder of saved frames, e.g. video/camera_57')
+    parser.add_argument('--model', action='append', required=True,
+                        help='backend:path, the first one is the reference, '
+                             'e.g. ultralytics:models/nano_10n_st_11.pt onnx:models/nano_10n_st_11.onnx')
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--conf', type=float, default=CONF)
+    parser.add_argument('--max-det', type=int, default=MAX_DET)
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, args.limit)
+    if not frames:
+        sys.exit(f"No frames in {args.frames}")
+
+    reference = None
+    print(f"{'model':<48}{'mean ms':>9}{'p50':>9}{'p95':>9}{'detected':>10}{'agree %':>9}")
+    for spec in args.model:
+        latencies, summaries = run_backend(spec, frames, args.conf, args.max_det)
+        if reference is None:
+            reference = summaries
+        agreement = sum(agrees(r, s) for r, s in zip(reference, summaries)) / len(frames) * 100
+        detected = sum(1 for summary in summaries if summary)
+        print(f"{spec:<48}{sum(latencies) / len(latencies):>9.1f}{percentile(latencies, 50):>9.1f}"
+              f"{percentile(latencies, 95):>9.1f}{detected:>10}{agreement:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_ring import FrameRing, FrameRingReader, start_resource_tracker
+
+FRAME_SIZES = {
+    '1080p': (1080, 1920, 3),
+    '4K': (2160, 3840, 3),
+}
+
+
+def manager_consumer(frame_queue, ack_queue, frames):
+    for _ in range(frames):
+        frame = frame_queue.get()
+        ack_queue.put(int(frame[0, 0, 0]))
+
+
+def ring_consumer(descriptor_queue, ack_queue, frames):
+    reader = FrameRingReader()
+    for _ in range(frames):
+        descriptor = descriptor_queue.get()
+        frame = reader.read(descriptor)
+        ack_queue.put(int(frame[0, 0, 0]))
+        del frame
+    reader.close()
+
+
+def bench_manager(frame, frames):
+    with multiprocessing.Manager() as manager:
+        frame_queue = manager.Queue()
+        ack_queue = manager.Queue()
+        consumer = multiprocessing.Process(target=manager_consumer, args=(frame_queue, ack_queue, frames))
+        consumer.start()
+        start = time.perf_counter()
+        for i in range(frames):
+            frame[0, 0, 0] = i % 256
+            frame_queue.put(frame)
+            ack_queue.get()
+        elapsed = time.perf_counter() - start
+        consumer.join()
+    return elapsed
+
+
+def bench_ring(frame, frames):
+    descriptor_queue = multiprocessing.Queue()
+    ack_queue = multiprocessing.Queue()
+    ring = FrameRing.create('bench', frame.nbytes)
+    consumer = multiprocessing.Process(target=ring_consumer, args=(descriptor_queue, ack_queue, frames))
+    consumer.start()
+    start = time.perf_counter()
+    for i in range(frames):
+        frame[0, 0, 0] = i % 256
+        descriptor_queue.put(ring.write('bench', frame))
+        ack_queue.get()
+    elapsed = time.perf_counter() - start
+    consumer.join()
+    ring.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manager queue vs shared memory ring frame handoff')
+    parser.add_argument('--frames', type=int, default=100)
+    args = parser.parse_args()
+    start_resource_tracker()
+
+    print(f"{'size':<8}{'path':<16}{'ms/frame':>10}{'MB/s':>10}")
+    for label, shape in FRAME_SIZES.items():
+        frame = np.random.randint(0, 256, shape, dtype=np.uint8)
+        megabytes = frame.nbytes * args.frames / 1e6
+        for path, bench in (('manager queue', bench_manager), ('shm ring', bench_ring)):
+            elapsed = bench(frame, args.frames)
+            print(f"{label:<8}{path:<16}{elapsed / args.frames * 1000:>10.2f}{megabytes / elapsed:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
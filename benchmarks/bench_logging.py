@@ -0,0 +1,91 @@
+import argparse
+import glob
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from log_listener import LogListener, get_logger
+from transport import create_queue
+
+
+def old_logger(log_dir):
+    # Как было в каждом процессе: DEBUG синхронно в свой файл, ротация каждые 10 КБ
+    logger = logging.getLogger('bench-old')
+    logger.setLevel(logging.DEBUG)
+    handler = RotatingFileHandler(os.path.join(log_dir, 'camera_old.log'), maxBytes=10240, backupCount=10)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    return logger
+
+
+def log_frames(logger, frames, records, interval):
+    # Записи одного кадра камеры: отладка детекции и тревоги. Между кадрами - пауза, как у камеры
+    cycles = []
+    for frame in range(frames):
+        start = time.perf_counter()
+        for record in range(records):
+            logger.debug(f"Frame {frame} zone {record}: nano [], motion gate pass, interval 1.0 s")
+        cycles.append(time.perf_counter() - start)
+        time.sleep(interval)
+    return np.array(cycles) * 1e6
+
+
+def storm(logger, count):
+    # get_snapshot, который падает каждый кадр
+    for i in range(count):
+        logger.error(f"Error getting snapshot from camera 192.168.1.57: timed out after {i % 7 + 3} s")
+
+
+def count_lines(pattern):
+    return sum(sum(1 for _ in open(path, encoding='utf-8')) for path in glob.glob(pattern))
+
+
+def report(name, cycles):
+    print(f"{name}: per frame mean {cycles.mean():.1f} us, p50 {np.percentile(cycles, 50):.1f} us, "
+          f"p99 {np.percentile(cycles, 99):.1f} us, max {cycles.max():.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-frame logging overhead in the camera process: '
+                                                 'synchronous RotatingFileHandler vs QueueHandler and LogListener')
+    parser.add_argument('--frames', type=int, default=5000)
+    parser.add_argument('--records', type=int, default=4, help='log records per frame')
+    parser.add_argument('--interval', type=float, default=0.002, help='pause between frames, s')
+    parser.add_argument('--storm', type=int, default=1000, help='repeated errors for the storm check')
+    args = parser.parse_args()
+    log_dir = tempfile.mkdtemp(prefix='bench_logging_')
+
+    logger = old_logger(log_dir)
+    report('before, RotatingFileHandler 10 KB', log_frames(logger, args.frames, args.records, args.interval))
+    storm(logger, args.storm)
+    print(f"  files {len(glob.glob(os.path.join(log_dir, 'camera_old.log*')))}, "
+          f"lines kept {count_lines(os.path.join(log_dir, 'camera_old.log*'))} of "
+          f"{args.frames * args.records + args.storm} (older lost to rotation)")
+
+    log_queue = create_queue()
+    listener = LogListener(log_queue, log_dir=log_dir)
+    listener.start()
+    logger = get_logger('bench-new', 'camera_new.log', log_queue, camera='57')
+    report('after, QueueHandler + LogListener', log_frames(logger, args.frames, args.records, args.interval))
+    storm(logger, args.storm)
+    start = time.perf_counter()
+    listener.running.value = False
+    listener.join()
+    print(f"  listener drained the queue in {time.perf_counter() - start:.2f} s after the last record")
+    path = os.path.join(log_dir, 'camera_new.log')
+    with open(path, encoding='utf-8') as log_file:
+        errors = [line for line in log_file if 'ERROR' in line]
+    print(f"  lines kept {count_lines(path + '*')} of {args.frames * args.records + args.storm}, "
+          f"storm of {args.storm} errors written as {len(errors)} lines:")
+    print(f"  {errors[-1].strip()}")
+    print(f"logs in {log_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cascade import plot_detections
+from inference_backend import Detections, letterbox, to_tensor
+from preprocess import DEFAULT_IMGSZ, Preprocessor, decode_jpeg, decode_scale
+from zones import Zone
+
+SUMMARY = [{'name': 'person', 'class': 0, 'confidence': 0.8,
+            'box': {'x1': 100.0, 'y1': 80.0, 'x2': 180.0, 'y2': 260.0}}]
+
+
+def test_frame(width, height):
+    # Шум и крупные детали, чтобы JPEG был похож на кадр камеры по размеру
+    image = cv2.resize(np.random.randint(0, 255, (height // 8, width // 8, 3), dtype=np.uint8), (width, height))
+    cv2.rectangle(image, (width // 3, height // 4), (width // 2, height * 3 // 4), (0, 200, 255), -1)
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def frame_before(data, zone, imgsz):
+    # Как было: полный декод, letterbox и тензор в новых массивах, рисунок на каждый кадр,
+    # размеченный снимок уходит обратно в камеру через очередь
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    roi = zone.crop(image)
+    canvas = letterbox(roi, (imgsz, imgsz))[0]
+    tensor = to_tensor([canvas])
+    boxes = [[100, 80, 180, 260]]
+    plot = Detections(roi, boxes, [0.8], [0], {0: 'person'}).plot()
+    return tensor, pickle.dumps((SUMMARY, plot, None, None))
+
+
+def make_frame_after(zone, imgsz, scale, hit_share):
+    preprocessor = Preprocessor()
+    counter = [0]
+
+    def frame_after(data):
+        # Декод с уменьшением, подготовка в заранее выделенных буферах, в очередь только рамки,
+        # рисунок только для кадров, которые сохраняются или отправляются
+        image = decode_jpeg(data, scale)
+        roi = zone.crop(image, scale)
+        tensor, _ = preprocessor.run([roi], (imgsz, imgsz))
+        counter[0] += 1
+        if hit_share and counter[0] % round(1 / hit_share) == 0:
+            plot_detections(roi, SUMMARY)
+        return tensor, pickle.dumps((SUMMARY, None))
+    return frame_after
+
+
+def measure(name, frame, data, frames):
+    frame(data)
+    times = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        frame(data)
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1e6
+    # Выделения памяти numpy (в том числе массивы, которые возвращает OpenCV) за кадр
+    tracemalloc.start()
+    snapshot_count = min(frames, 50)
+    allocated = 0
+    for _ in range(snapshot_count):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        frame(data)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    print(f"{name:<44}{times.mean():>10.0f}{np.percentile(times, 50):>10.0f}{np.percentile(times, 99):>10.0f}"
+          f"{allocated / snapshot_count / 1e6:>14.2f}")
+    return times.mean()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-frame decode and preprocessing cost: full decode with '
+                                                 'fresh buffers and a plot per frame vs reduced JPEG decode, '
+                                                 'preallocated buffers and lazy plots. Preallocated buffers '
+                                                 'are only used by the onnx and openvino backends')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--area', help='zone x,y,w,h, whole frame by default')
+    parser.add_argument('--imgsz', type=int, nargs='+', default=[DEFAULT_IMGSZ, 320],
+                        help='inference sizes to compare')
+    parser.add_argument('--hits', type=float, default=0.05, help='share of frames with a plotted detection')
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+
+    data = test_frame(args.width, args.height)
+    zone = Zone(area=[int(v) for v in args.area.split(',')] if args.area else None)
+    print(f"frame {args.width}x{args.height}, JPEG {len(data) / 1024:.0f} KB, zone {zone.area or 'whole frame'}")
+    print(f"{'pipeline':<44}{'mean us':>10}{'p50':>10}{'p99':>10}{'alloc MB':>14}")
+    for imgsz in args.imgsz:
+        before = measure(f'before, imgsz {imgsz}', lambda d: frame_before(d, zone, imgsz), data, args.frames)
+        scale = decode_scale([zone.size((args.height, args.width))], imgsz)
+        after = measure(f'after, imgsz {imgsz}, decode 1/{scale}',
+                        make_frame_after(zone, imgsz, scale, args.hits), data, args.frames)
+        print(f"  {before / after:.1f}x faster per frame")
+
+
+if __name__ == '__main__':
+    main()
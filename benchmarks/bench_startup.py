@@ -0,0 +1,108 @@
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from frame_ring import start_resource_tracker
+from inference_processor import InferenceClient, InferenceProcessor, BACKEND, NANO_MODEL_PATH, HEAVY_MODEL_PATH
+from transport import create_queue
+
+MODULES = ('main', 'camera_processor', 'inference_processor')
+
+
+def import_time(module):
+    # Отдельный интерпретатор: время импорта модуля с нуля, как в новом процессе
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode:
+        return None, result.stderr.strip().splitlines()[-1]
+    return float(result.stdout.strip()), None
+
+
+def child_started(started):
+    # Модуль камеры импортируется так же, как при запуске процесса CameraProcessor
+    import camera_processor
+    started.set()
+
+
+def spawn_latency(method, count):
+    context = multiprocessing.get_context(method)
+    latencies = []
+    for _ in range(count):
+        started = context.Event()
+        process = context.Process(target=child_started, args=(started,))
+        start = time.perf_counter()
+        process.start()
+        while not started.wait(0.01):
+            if not process.is_alive():
+                raise RuntimeError(f"camera process exited with code {process.exitcode}")
+        latencies.append(time.perf_counter() - start)
+        process.join()
+    return latencies
+
+
+def time_to_first_detection(backend, nano, heavy, imgsz):
+    request_queue, result_queue = create_queue(), create_queue()
+    processor = InferenceProcessor(request_queue, {'bench': result_queue}, backend=backend,
+                                   nano_model_path=nano, heavy_model_path=heavy)
+    client = InferenceClient('bench', request_queue, result_queue, timeout=300)
+    image = np.random.randint(0, 255, (imgsz, imgsz, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    processor.start()
+    try:
+        while not processor.ready.wait(0.01):
+            if not processor.is_alive():
+                raise RuntimeError("models failed to load, see logs/inference.log")
+        ready = time.perf_counter() - start
+        client.detect(image)
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        client.detect(image)
+        second = time.perf_counter() - start
+    finally:
+        client.close()
+        processor.running.value = False
+        processor.join()
+    return ready, first, second
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup cost: module imports, camera process spawn, '
+                                                 'time to first detection')
+    parser.add_argument('--spawns', type=int, default=5)
+    parser.add_argument('--backend', default=BACKEND)
+    parser.add_argument('--nano', default=NANO_MODEL_PATH)
+    parser.add_argument('--heavy', default=HEAVY_MODEL_PATH)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--skip-detection', action='store_true')
+    args = parser.parse_args()
+    os.makedirs(os.path.join(ROOT, 'logs'), exist_ok=True)
+    os.chdir(ROOT)
+    start_resource_tracker()
+
+    for module in MODULES:
+        seconds, error = import_time(module)
+        print(f"import {module:<24}" + (f"{seconds * 1000:>9.1f} ms" if error is None else f"  failed: {error}"))
+
+    for method in ('fork', 'spawn'):
+        try:
+            latencies = spawn_latency(method, args.spawns)
+        except Exception as e:
+            print(f"camera spawn ({method}) failed: {e}")
+            continue
+        print(f"camera spawn ({method:<5})         mean {sum(latencies) / len(latencies) * 1000:>7.1f} ms, "
+              f"max {max(latencies) * 1000:.1f} ms")
+
+    if not args.skip_detection:
+        ready, first, second = time_to_first_detection(args.backend, args.nano, args.heavy, args.imgsz)
+        print(f"models loaded and warmed up ({args.backend}) {ready * 1000:>9.1f} ms")
+        print(f"time to first detection        {first * 1000:>9.1f} ms, next detection {second * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
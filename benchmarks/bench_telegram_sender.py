@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telegram_sender import TelegramSender, PRIORITY_SNAPSHOT
+
+TOKEN = 'bench'
+CHAT_ID = 1
+
+
+# Заменитель Bot API: принимает sendMessage/sendPhoto/sendMediaGroup, записывает порядок
+# и, как настоящий Telegram, отвечает 429 с retry_after при превышении лимита чата
+class StandInBotApi:
+    def __init__(self, chat_rate, port):
+        self.chat_rate = chat_rate
+        self.port = port
+        self.requests = []
+        self.rejected = 0
+        self.last_accepted = 0
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        form = await request.post()
+        now = time.monotonic()
+        if now - self.last_accepted < 1 / self.chat_rate:
+            self.rejected += 1
+            return web.json_response({'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                                      'parameters': {'retry_after': 1}}, status=429)
+        self.last_accepted = now
+        if method == 'sendMediaGroup':
+            captions = [item['caption'] for item in json.loads(form['media'])]
+        else:
+            captions = [form.get('caption') or form.get('text')]
+        self.requests.append((method, captions, now))
+        return web.json_response({'ok': True, 'result': {}})
+
+    def serve(self, started):
+        async def run():
+            app = web.Application()
+            app.router.add_post(f'/bot{TOKEN}/{{method}}', self.handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', self.port).start()
+            started.set()
+            while True:
+                await asyncio.sleep(3600)
+        asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TelegramSender against a local stand-in Bot API: '
+                                                 'priority order, media group coalescing, throughput under 429s')
+    parser.add_argument('--cameras', type=int, default=25)
+    parser.add_argument('--status', type=int, default=5)
+    parser.add_argument('--server-rate', type=float, default=2, help='messages per second the stand-in accepts')
+    parser.add_argument('--sender-rate', type=float, default=3, help='sender chat bucket rate, above server rate '
+                                                                     'to provoke 429 handling')
+    parser.add_argument('--port', type=int, default=18082)
+    args = parser.parse_args()
+
+    api = StandInBotApi(args.server_rate, args.port)
+    started = threading.Event()
+    threading.Thread(target=api.serve, args=(started,), daemon=True).start()
+    started.wait()
+
+    logger = logging.getLogger('bench')
+    sender = TelegramSender(TOKEN, CHAT_ID, logger, api_url=f'http://127.0.0.1:{args.port}',
+                            chat_rate=args.sender_rate, chat_burst=1)
+    sender.start()
+    start = time.monotonic()
+    # Всплеск: статусные сообщения, уведомления со всех камер, затем запрос снимка по /now
+    for i in range(args.status):
+        sender.send_message(f'status {i}')
+    for camera in range(args.cameras):
+        sender.send_photo(b'\xff\xd8jpeg', caption=f'camera {camera}')
+    sender.send_photo(b'\xff\xd8jpeg', caption='snapshot', priority=PRIORITY_SNAPSHOT)
+    sender.stop()
+    elapsed = time.monotonic() - start
+
+    order = [caption for _, captions, _ in api.requests for caption in captions]
+    groups = [len(captions) for method, captions, _ in api.requests if method == 'sendMediaGroup']
+    delivered_cameras = sorted(int(c.split()[1]) for c in order if c.startswith('camera'))
+    first_status = min((i for i, c in enumerate(order) if c.startswith('status')), default=None)
+    last_camera = max((i for i, c in enumerate(order) if c.startswith('camera')), default=None)
+    print(f"requests {len(api.requests)}, items {len(order)}, 429 responses {api.rejected}, "
+          f"elapsed {elapsed:.1f} s")
+    print(f"media groups {groups}")
+    print(f"snapshot first: {order[0] == 'snapshot'}")
+    print(f"notifications before status: {last_camera is not None and first_status is not None and last_camera < first_status}")
+    print(f"all notifications delivered once: {delivered_cameras == list(range(args.cameras))}")
+    print(f"sender sent {sender.sent}, failed {sender.failed}")
+
+
+if __name__ == '__main__':
+    main()
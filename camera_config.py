@@ -0,0 +1,128 @@
+import ast
+import json
+import os
+import time
+import yaml
+
+CONFIG_POLL_INTERVAL = 2
+# Эти параметры меняются в работающей камере, остальные требуют перезапуска её процесса
+LIVE_PARAMS = ('area', 'zones', 'alarm_url', 'motion_gate', 'schedule')
+
+
+def parse_cameras(text, path=''):
+    if path.endswith(('.yaml', '.yml')):
+        cameras = yaml.safe_load(text)
+    else:
+        try:
+            cameras = json.loads(text)
+        except ValueError:
+            # Старый формат CAMERA_IPS - литерал Python (True/None), без выполнения кода
+            cameras = ast.literal_eval(text)
+    if isinstance(cameras, dict):
+        cameras = cameras.get('cameras', [])
+    if not isinstance(cameras, list) or not all(isinstance(camera, dict) and 'ip' in camera
+                                                for camera in cameras):
+        raise ValueError("Camera config must be a list of objects with an ip field")
+    return cameras
+
+
+def load_cameras(path):
+    with open(path, encoding='utf-8') as config_file:
+        return parse_cameras(config_file.read(), path)
+
+
+def diff_cameras(old, new):
+    # Возвращает добавленные и удалённые ip и для изменённых камер - имена изменившихся полей
+    old = {camera['ip']: camera for camera in old}
+    new = {camera['ip']: camera for camera in new}
+    added = [ip for ip in new if ip not in old]
+    removed = [ip for ip in old if ip not in new]
+    changed = {}
+    for ip in new:
+        if ip in old:
+            fields = sorted(key for key in set(old[ip]) | set(new[ip]) if old[ip].get(key) != new[ip].get(key))
+            if fields:
+                changed[ip] = fields
+    return added, removed, changed
+
+
+# Следит за файлом конфигурации по времени изменения, без зависимостей от inotify
+class ConfigWatcher:
+    def __init__(self, path, interval=CONFIG_POLL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last_check = time.monotonic()
+        self.mtime = self.get_mtime()
+
+    def get_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def poll(self):
+        # Новый список камер, если файл изменился, иначе None
+        if time.monotonic() - self.last_check < self.interval:
+            return None
+        self.last_check = time.monotonic()
+        mtime = self.get_mtime()
+        if mtime is None or mtime == self.mtime:
+            return None
+        self.mtime = mtime
+        return load_cameras(self.path)
+
+
+# Действия главного процесса над камерами при смене конфигурации
+class CameraActions:
+    def __init__(self, add, remove, start, stop, running, update, pooled):
+        # add(ip) - очереди для новой камеры, False если их нет; remove(ip) - остановка и освобождение
+        # очередей убранной камеры; start(camera), stop(ip), running(ip); update(ip, params) - смена
+        # LIVE_PARAMS в работающей камере; pooled(ip) - камера в пуле
+        self.add = add
+        self.remove = remove
+        self.start = start
+        self.stop = stop
+        self.running = running
+        self.update = update
+        self.pooled = pooled
+
+
+def apply_camera_config(cameras, new_cameras, actions, logger):
+    # Применяет новый список камер, камеры без изменений не останавливаются и не перезапускаются.
+    # Возвращает список камер, с которыми теперь работает главный процесс
+    added, removed, changed = diff_cameras(cameras, new_cameras)
+    new = {camera['ip']: camera for camera in new_cameras}
+    waiting = set()
+    for ip in added:
+        if not actions.add(ip):
+            # Камера останется добавленной в следующий раз, когда освободится очередь
+            logger.warning(f"Camera {ip} added to config, no spare queues left, restart required to start it")
+            waiting.add(ip)
+            continue
+        logger.info(f"Camera {ip} added to config")
+        if new[ip]['track']:
+            actions.start(new[ip])
+    for ip in removed:
+        actions.remove(ip)
+        logger.info(f"Camera {ip} removed from config")
+    for ip, fields in changed.items():
+        camera = new[ip]
+        logger.info(f"Camera {ip} config changed: {fields}")
+        restart_fields = [field for field in fields if field not in LIVE_PARAMS and field != 'track']
+        if restart_fields and actions.pooled(ip):
+            logger.warning(f"Camera {ip} {restart_fields} changed, restart required for pooled camera")
+        elif restart_fields:
+            if actions.running(ip):
+                actions.stop(ip)
+            if camera['track']:
+                actions.start(camera)
+            continue
+        live_params = {field: camera.get(field) for field in fields if field in LIVE_PARAMS}
+        if live_params and (actions.pooled(ip) or actions.running(ip)):
+            actions.update(ip, live_params)
+        if 'track' in fields:
+            if camera['track'] and not actions.running(ip):
+                actions.start(camera)
+            elif not camera['track']:
+                actions.stop(ip)
+    return [camera for camera in new_cameras if camera['ip'] not in waiting]
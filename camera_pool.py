@@ -0,0 +1,248 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+import multiprocessing
+import os
+import time
+from camera_processor import (add_user_to_uri, create_onvif_camera, load_cached_uri, save_cached_uri,
+                              reconnect_delay, port, ONVIF_TIMEOUT, REFRESH_AFTER_ERRORS)
+from transport import get_message, QueueReader
+from log_listener import get_logger
+import metrics
+
+POOL_WORKERS = os.cpu_count() or 1
+FETCH_TIMEOUT = 5
+FRAME_TIMEOUT = 60
+CONNECTIONS = 100
+# Потоки для синхронных запросов ONVIF, отдельно от пула цикла asyncio
+ONVIF_THREADS = 4
+
+
+# Один asyncio процесс получает снимки всех камер пула через общую сессию
+# с keep-alive. На каждую камеру одно соединение и один кадр в обработке:
+# следующий снимок запрашивается, когда обработчик вернул время следующего кадра.
+class CameraFetcher(multiprocessing.Process):
+    def __init__(self, cameras, control_queue, worker_queues, metrics_queue=None,
+                 fetch_timeout=FETCH_TIMEOUT, connections=CONNECTIONS, log_queue=None):
+        super().__init__()
+        self.cameras = cameras
+        self.control_queue = control_queue
+        self.worker_queues = worker_queues
+        self.metrics_queue = metrics_queue
+        self.log_queue = log_queue
+        self.fetch_timeout = fetch_timeout
+        self.connections = connections
+        self.running = multiprocessing.Value('b', True)
+
+    def initialize_logger(self):
+        self.logger = get_logger('CameraFetcher', 'camera_fetcher.log', self.log_queue)
+
+    def resolve_snapshot_uri(self, camera):
+        ip = f'192.168.1.{camera["ip"]}'
+        mycam = create_onvif_camera(ip, camera.get('port', port), camera['user'], camera['passw'], ONVIF_TIMEOUT)
+        media_service = mycam.create_media_service()
+        token = media_service.GetProfiles()[0].token
+        snapshot_uri = add_user_to_uri(media_service.GetSnapshotUri({'ProfileToken': token}).Uri, camera['user'])
+        save_cached_uri(ip, snapshot_uri)
+        return snapshot_uri
+
+    async def fetch_snapshot(self, session, ip, uri):
+        with metrics.timer('snapshot_fetch', camera=ip):
+            async with session.get(uri, timeout=aiohttp.ClientTimeout(total=self.fetch_timeout)) as response:
+                if response.status != 200:
+                    raise ValueError(f"status code: {response.status}")
+                return await response.read()
+
+    async def fetch_camera(self, session, ip):
+        loop = asyncio.get_running_loop()
+        uri = load_cached_uri(f'192.168.1.{ip}')
+        failures = 0
+        seq = 0
+        while self.running.value:
+            if uri is None:
+                try:
+                    # ONVIF клиент синхронный, запросы идут в своём пуле потоков: недоступные камеры
+                    # ждут его, но не задерживают остальные камеры и чтение очереди управления
+                    uri = await loop.run_in_executor(self.onvif_executor, self.resolve_snapshot_uri,
+                                                     self.cameras[ip])
+                    self.logger.info(f"Camera {ip} initialized successfully.")
+                except Exception as e:
+                    failures += 1
+                    self.logger.error(f"Error initializing camera {ip}: {e}, retry {failures} "
+                                      f"in {reconnect_delay(failures):.0f} s")
+                    await asyncio.sleep(reconnect_delay(failures))
+                    continue
+            cycle_start = time.monotonic()
+            try:
+                data = await self.fetch_snapshot(session, ip, uri)
+            except Exception as e:
+                failures += 1
+                self.logger.error(f"Error getting snapshot from camera {ip}: {e!r}, retry {failures} "
+                                  f"in {reconnect_delay(failures):.0f} s")
+                metrics.inc('camera_errors', camera=ip)
+                # Адрес снимка по ONVIF запрашивается заново только после нескольких ошибок подряд
+                if failures >= REFRESH_AFTER_ERRORS:
+                    uri = None
+                await asyncio.sleep(reconnect_delay(failures))
+                continue
+            if failures:
+                self.logger.info(f"Camera {ip} recovered after {failures} errors")
+                failures = 0
+            seq += 1
+            future = loop.create_future()
+            self.pending[ip] = (seq, future)
+            self.worker_queues[ip].put(('frame', ip, seq, data, cycle_start))
+            try:
+                next_frame = await asyncio.wait_for(future, FRAME_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.logger.error(f"No response for frame {seq} of camera {ip}")
+                next_frame = time.monotonic()
+            finally:
+                self.pending.pop(ip, None)
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                # Событие тревоги от камеры (wake) прерывает ожидание следующего кадра
+                try:
+                    await asyncio.wait_for(self.wakeups[ip].wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeups[ip].clear()
+
+    def frame_done(self, ip, seq, next_frame):
+        pending = self.pending.get(ip)
+        # Ответ на кадр, по которому уже истёк таймаут, не относится к текущему кадру
+        if pending and pending[0] == seq and not pending[1].done():
+            pending[1].set_result(next_frame)
+
+    async def process_control(self):
+        self.pending = {}
+        self.wakeups = {ip: asyncio.Event() for ip in self.cameras}
+        tasks = {}
+        self.onvif_executor = ThreadPoolExecutor(max_workers=ONVIF_THREADS, thread_name_prefix='onvif')
+        control = QueueReader(self.control_queue, self.running)
+        control.start()
+        connector = aiohttp.TCPConnector(limit=self.connections, limit_per_host=1)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            while self.running.value:
+                message = await control.get()
+                if message is None:
+                    continue
+                command, ip, *payload = message
+                if command == 'done':
+                    self.frame_done(ip, *payload)
+                elif command == 'start':
+                    if ip not in tasks and ip in self.cameras:
+                        tasks[ip] = asyncio.create_task(self.fetch_camera(session, ip))
+                        self.logger.info(f"Camera {ip} added to pool")
+                elif command == 'wake':
+                    if ip in self.wakeups:
+                        self.wakeups[ip].set()
+                elif command == 'stop':
+                    task = tasks.pop(ip, None)
+                    if task:
+                        task.cancel()
+                        self.logger.info(f"Camera {ip} removed from pool")
+                metrics.set_gauge('pool_cameras', len(tasks))
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        # Зависшие запросы ONVIF не ждём, они завершатся по своему таймауту
+        self.onvif_executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self):
+        self.initialize_logger()
+        metrics.configure(self.metrics_queue)
+        self.logger.info("Camera fetcher starting")
+        try:
+            asyncio.run(self.process_control())
+        except Exception as e:
+            self.logger.error(f"Error in camera fetcher: {e}")
+        metrics.flush(force=True)
+        self.logger.info("Camera fetcher stopped")
+
+
+# Обработчик пула: ведёт несколько камер (не запущенные процессы CameraProcessor)
+# и обрабатывает их кадры и команды из одной очереди. Камера закреплена за одним
+# обработчиком, поэтому её состояние (фильтр изменений, планировщик) не делится.
+class CameraWorker(multiprocessing.Process):
+    def __init__(self, index, cameras, worker_queue, control_queue, metrics_queue=None, log_queue=None):
+        super().__init__()
+        self.index = index
+        self.cameras = cameras
+        self.worker_queue = worker_queue
+        self.control_queue = control_queue
+        self.metrics_queue = metrics_queue
+        self.log_queue = log_queue
+        self.running = multiprocessing.Value('b', True)
+
+    def initialize_logger(self):
+        self.logger = get_logger(f'CameraWorker-{self.index}', f'camera_worker_{self.index}.log',
+                                 self.log_queue)
+
+    def start_camera(self, camera):
+        if camera.ip_suffix in self.active:
+            camera.handle_command('start_camera')
+            return
+        camera.start_pipeline()
+        self.active.add(camera.ip_suffix)
+        self.control_queue.put(('start', camera.ip_suffix))
+        camera.logger.info(f"Camera {camera.ip} started in pool worker {self.index}")
+
+    def stop_camera(self, camera):
+        self.active.discard(camera.ip_suffix)
+        self.control_queue.put(('stop', camera.ip_suffix))
+        camera.stop_pipeline()
+        camera.logger.info(f"Camera {camera.ip} stopped in pool worker {self.index}")
+
+    def process_frame(self, camera, seq, data, cycle_start):
+        if camera.ip_suffix not in self.active:
+            return
+        try:
+            with metrics.timer('frame_cycle', camera=camera.ip_suffix):
+                snapshot = camera.decode_snapshot(data)
+                if snapshot is not None:
+                    camera.process_frame(snapshot, data)
+        except Exception as e:
+            camera.logger.error(f"Error in process_snapshot: {e}")
+        self.control_queue.put(('done', camera.ip_suffix, seq, camera.next_frame_time(cycle_start)))
+
+    def handle_message(self, message):
+        command, ip, *payload = message
+        camera = self.cameras.get(ip)
+        if camera is None:
+            self.logger.error(f"Camera {ip} is not assigned to worker {self.index}")
+            return
+        if command == 'start':
+            self.start_camera(camera)
+        elif command == 'frame':
+            self.process_frame(camera, *payload)
+        elif command == 'command':
+            if ip not in self.active:
+                if isinstance(payload[0], tuple) and payload[0][0] == 'update_config':
+                    # Остановленная камера запустится уже с новыми параметрами
+                    camera.update_config(payload[0][1])
+                else:
+                    self.logger.debug(f"Command {payload[0]} for stopped camera {ip} ignored")
+                return
+            camera.handle_command(payload[0])
+            if isinstance(payload[0], tuple) and payload[0][0] == 'boost':
+                self.control_queue.put(('wake', ip))
+            if not camera.running.value:
+                self.stop_camera(camera)
+
+    def run(self):
+        self.initialize_logger()
+        metrics.configure(self.metrics_queue)
+        self.active = set()
+        self.logger.info(f"Pool worker {self.index} started with cameras {sorted(self.cameras)}")
+        while self.running.value:
+            message = get_message(self.worker_queue)
+            if message is None:
+                continue
+            try:
+                self.handle_message(message)
+            except Exception as e:
+                self.logger.error(f"Error processing message {message[:2]}: {e}")
+        for ip in list(self.active):
+            self.stop_camera(self.cameras[ip])
+        self.logger.info(f"Pool worker {self.index} stopped")
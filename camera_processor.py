@@ -1,31 +1,95 @@
 import os
 import multiprocessing
-import cv2
-import numpy as np
 import urllib.request
 from onvif import ONVIFCamera
+from zeep.transports import Transport
 import time
-from ultralytics import YOLOv10
-import logging
-from logging.handlers import RotatingFileHandler
+from log_listener import get_logger
 from datetime import datetime, timedelta
 import threading
-from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse, quote
+from inference_processor import InferenceClient
+from transport import get_message
+from stream_reader import LatestFrameReader
+from motion_gate import MotionGate
+from image_store import ImageRingStore, ImageWriter, encode_jpeg
+from scheduler import AdaptiveScheduler
+from zones import parse_zones
+from preprocess import DEFAULT_IMGSZ, decode_jpeg, decode_scale, parse_imgsz
+from cascade import plot_detections
+import metrics
 
-MODEL_NANO = YOLOv10('models/nano_10n_st_11.pt')
-MODEL_HEAVY = YOLOv10('models/heavy_10m_st_11.pt')
-CONF = 0.35
-MAX_DET = 1
 port = 8899
 number_recorded_pictures = 1000
 DEBUG_IMAGE = True
+STREAM_READ_TIMEOUT = 5
+# Жёсткие таймауты: зависшая камера не останавливает процесс дольше этого времени
+SNAPSHOT_TIMEOUT = 5
+ONVIF_TIMEOUT = 10
+# Повтор после ошибки камеры с экспоненциальной задержкой, а не полное подключение на каждом кадре
+RECONNECT_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+# Адрес снимка запрашивается по ONVIF заново только после стольких ошибок подряд
+REFRESH_AFTER_ERRORS = 3
+URI_CACHE_DIR = 'cache'
+GATE_LOG_INTERVAL = timedelta(minutes=10)
+FPS_INTERVAL = 10
+# После тревоги детекция продолжается, но повторные тревоги не отправляются
+ALARM_COOLDOWN = 10
 
 # Ограничение на отправку сообщений
 MESSAGE_COOLDOWN = timedelta(minutes=2)
 
 
+def add_user_to_uri(uri, user):
+    parsed_url = urlparse(uri)
+    query_params = parse_qs(parsed_url.query)
+    query_params['user'] = user
+    new_query = urlencode(query_params, doseq=True)
+    return urlunparse(
+        (parsed_url.scheme, parsed_url.netloc, parsed_url.path,
+         parsed_url.params, new_query, parsed_url.fragment)
+    )
+
+
+def create_onvif_camera(ip, port, user, passw, timeout=ONVIF_TIMEOUT):
+    # Таймаут на загрузку WSDL и каждый вызов ONVIF
+    return ONVIFCamera(ip, port, user, passw, transport=Transport(timeout=timeout, operation_timeout=timeout))
+
+
+def load_cached_uri(ip):
+    # Адрес снимка, полученный по ONVIF в прошлый раз: перезапуск камеры обходится без рукопожатия ONVIF
+    try:
+        with open(os.path.join(URI_CACHE_DIR, f'snapshot_{ip}.txt')) as cache_file:
+            return cache_file.read().strip() or None
+    except OSError:
+        return None
+
+
+def save_cached_uri(ip, uri):
+    os.makedirs(URI_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(URI_CACHE_DIR, f'snapshot_{ip}.txt'), 'w') as cache_file:
+        cache_file.write(uri)
+
+
+def reconnect_delay(failures):
+    return min(RECONNECT_DELAY * 2 ** max(failures - 1, 0), RECONNECT_MAX_DELAY)
+
+
+def create_motion_gate(motion_gate):
+    # motion_gate: True - фильтр с параметрами по умолчанию, dict - свои параметры, False - выключен
+    if isinstance(motion_gate, dict):
+        return MotionGate(**motion_gate)
+    return MotionGate() if motion_gate else None
+
+
 class CameraProcessor(multiprocessing.Process):
-    def __init__(self, ip, user, passw, command_queue, response_queue, alarm_queue, alarm_url, area, port=port):
+    def __init__(self, ip, user, passw, command_queue, response_queue, alarm_queue,
+                 inference_queue, result_queue, alarm_url, area, port=port,
+                 mode='snapshot', stream_uri=None, motion_gate=True, metrics_queue=None,
+                 schedule=None, budget=None, zones=None, log_queue=None, snapshot_uri=None,
+                 snapshot_timeout=SNAPSHOT_TIMEOUT, onvif_timeout=ONVIF_TIMEOUT, imgsz=None,
+                 decode_scale='auto'):
         super().__init__()
         self.ip_suffix = ip
         self.ip = f'192.168.1.{ip}'
@@ -37,142 +101,412 @@ class CameraProcessor(multiprocessing.Process):
         self.alarm_queue = alarm_queue
         self.running = multiprocessing.Value('b', True)
         self.save_dir = f'video/camera_{ip}'
-        os.makedirs(f'video/{self.save_dir}', exist_ok=True)
-        self.model_nano = MODEL_NANO
-        self.model_heavy = MODEL_HEAVY
-        self.image_counter = 0
+        os.makedirs(self.save_dir, exist_ok=True)
+        # Размер инференса (nano, heavy) и уменьшение кадра при декодировании JPEG:
+        # 'auto' - по размеру зон и инференса, 1 - без уменьшения
+        self.imgsz = parse_imgsz(imgsz)
+        self.decode_config = decode_scale
+        self.inference = InferenceClient(ip, inference_queue, result_queue, imgsz=self.imgsz)
+        self.image_writer = None
         self.last_telegram_message_time = datetime.min
         self.alarm_url = alarm_url
         self.area = area
+        self.zone_config = zones
+        # snapshot - снимок по ONVIF на каждый кадр, stream - постоянный RTSP поток
+        self.mode = mode
+        self.stream_uri = stream_uri
+        self.stream_reader = None
+        # Явно заданный snapshot_uri (камера без ONVIF) используется как есть и не обновляется
+        self.fixed_snapshot_uri = snapshot_uri
+        self.snapshot_uri = snapshot_uri
+        self.snapshot_timeout = snapshot_timeout
+        self.onvif_timeout = onvif_timeout
+        # Клиент ONVIF создаётся один раз и переиспользуется при переподключении
+        self.media_service = None
+        self.failures = 0
+        self.reconnect_at = 0
+        # Время последнего цикла и последнего кадра (time.monotonic) для CameraWatchdog в main.py.
+        # Без блокировки: зависший процесс не должен держать её, пока main читает значение
+        self.heartbeat = multiprocessing.Value('d', time.monotonic(), lock=False)
+        self.last_frame = multiprocessing.Value('d', 0.0, lock=False)
+        self.motion_gate_config = motion_gate
+        self.set_zones()
+        self.last_gate_log_time = datetime.now()
+        self.metrics_queue = metrics_queue
+        self.log_queue = log_queue
+        # schedule - параметры AdaptiveScheduler, budget - общий на все камеры InferenceBudget
+        self.scheduler = AdaptiveScheduler(**schedule) if schedule else AdaptiveScheduler()
+        self.budget = budget
+        # Окончание паузы после тревоги, отдельно по каждой зоне
+        self.alarm_suppressed_until = {}
+        # В режиме пула кадры получает общий процесс CameraFetcher, а не сама камера
+        self.pooled = False
+        self.last_data = None
+        self.fps_frames = 0
+        self.fps_start = time.monotonic()
 
     def initialize_logger(self):
-        self.logger = logging.getLogger(f'CameraProcessor-{self.ip}')
-        self.logger.setLevel(logging.DEBUG)
-        handler = RotatingFileHandler(f'logs/camera_{self.ip}.log', maxBytes=10240, backupCount=10)
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+        self.logger = get_logger(f'CameraProcessor-{self.ip}', f'camera_{self.ip}.log', self.log_queue,
+                                 camera=self.ip_suffix)
 
     def initialize_camera(self):
+        # Явно заданный stream_uri (RTSP или локальный файл) используется без ONVIF
+        if self.mode == 'stream' and self.stream_uri:
+            self.start_stream(self.stream_uri)
+            return
+        if self.mode == 'snapshot' and self.snapshot_uri is None:
+            self.snapshot_uri = load_cached_uri(self.ip)
+            if self.snapshot_uri:
+                self.logger.info(f"Camera {self.ip} uses cached snapshot uri")
+                return
+        if self.snapshot_uri is None:
+            self.connect()
+
+    def connect(self):
+        # Ошибка подключения не останавливает процесс: следующая попытка после паузы reconnect_delay
         try:
-            self.mycam = ONVIFCamera(self.ip, self.port, self.user, self.pswd)
-            self.media_service = self.mycam.create_media_service()
-            self.profiles = self.media_service.GetProfiles()
-            self.token = self.profiles[0].token
-            self.snapshot_uri = self.media_service.GetSnapshotUri({'ProfileToken': self.token})
-            parsed_url = urlparse(self.snapshot_uri.Uri)
-            query_params = parse_qs(parsed_url.query)
-            query_params['user'] = self.user
-            new_query = urlencode(query_params, doseq=True)
-            new_url = urlunparse(
-                (parsed_url.scheme, parsed_url.netloc, parsed_url.path,
-                 parsed_url.params, new_query, parsed_url.fragment)
-            )
-            self.snapshot_uri['Uri'] = new_url
+            if self.media_service is None:
+                self.mycam = create_onvif_camera(self.ip, self.port, self.user, self.pswd, self.onvif_timeout)
+                self.media_service = self.mycam.create_media_service()
+                self.profiles = self.media_service.GetProfiles()
+                self.token = self.profiles[0].token
+            if self.mode == 'stream':
+                self.start_stream(self.get_stream_uri())
+                self.logger.info(f"Camera {self.ip} initialized successfully in stream mode.")
+                return True
+            snapshot_uri = self.media_service.GetSnapshotUri({'ProfileToken': self.token})
+            self.snapshot_uri = add_user_to_uri(snapshot_uri.Uri, self.user)
+            save_cached_uri(self.ip, self.snapshot_uri)
             self.logger.info(f"Camera {self.ip} initialized successfully.")
+            return True
         except Exception as e:
-            self.logger.error(f"Error initializing camera {self.ip}: {e}")
-            self.running.value = False
+            # Камера могла перезагрузиться: в следующий раз клиент ONVIF создаётся заново
+            self.media_service = None
+            self.camera_failed(f"Error initializing camera {self.ip}: {e}")
+            return False
+
+    def camera_failed(self, message):
+        self.failures += 1
+        delay = reconnect_delay(self.failures)
+        self.reconnect_at = time.monotonic() + delay
+        self.logger.error(f"{message}, retry {self.failures} in {delay:.0f} s")
+        metrics.inc('camera_errors', camera=self.ip_suffix)
+
+    def get_stream_uri(self):
+        stream_uri = self.media_service.GetStreamUri({
+            'StreamSetup': {'Stream': 'RTP-Unicast', 'Transport': {'Protocol': 'RTSP'}},
+            'ProfileToken': self.token})
+        parsed_url = urlparse(stream_uri.Uri)
+        netloc = f'{quote(self.user, safe="")}:{quote(self.pswd, safe="")}@{parsed_url.hostname}'
+        if parsed_url.port:
+            netloc += f':{parsed_url.port}'
+        return urlunparse(parsed_url._replace(netloc=netloc))
+
+    def start_stream(self, uri):
+        if self.stream_reader is None:
+            self.stream_reader = LatestFrameReader(uri, self.logger)
+            self.stream_reader.start()
+
+    def stop_stream(self):
+        if self.stream_reader is not None:
+            self.stream_reader.stop()
+            self.stream_reader = None
+
+    def get_stream_frame(self):
+        # Декодер сам переподключается к потоку, повторная инициализация ONVIF не нужна
+        if self.stream_reader is None:
+            # Адрес потока ещё не получен: камера была недоступна при запуске
+            if time.monotonic() >= self.reconnect_at:
+                self.connect()
+            return None, None
+        snapshot = self.stream_reader.read(timeout=STREAM_READ_TIMEOUT)
+        if snapshot is None:
+            self.logger.error(f"No new frame from stream of camera {self.ip}")
+        return snapshot, None
 
     def get_snapshot(self):
+        # Возвращает декодированный кадр и исходный JPEG камеры (в режиме stream JPEG нет)
+        if self.mode == 'stream':
+            return self.get_stream_frame()
         # image  = Image.open('test_foto.jpg')
         # return np.array(image)
+        if time.monotonic() < self.reconnect_at:
+            return None, None
+        if self.snapshot_uri is None and not self.connect():
+            return None, None
         try:
             # self.logger.debug(f"Getting snapshot from camera {self.ip}")
-            response = urllib.request.urlopen(self.snapshot_uri.Uri)
-            data = response.read()
-            image_array = np.asarray(bytearray(data), dtype="uint8")
-            snapshot = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-            return snapshot
+            data = self.fetch_snapshot_bytes(self.snapshot_uri)
         except Exception as e:
-            self.logger.error(f"Error getting snapshot from camera {self.ip}: {e}")
-            self.initialize_camera()
+            # Адрес снимка обычно не меняется: сначала повторяем его, ONVIF - после нескольких ошибок подряд
+            if self.failures + 1 >= REFRESH_AFTER_ERRORS and self.fixed_snapshot_uri is None:
+                self.snapshot_uri = None
+            self.camera_failed(f"Error getting snapshot from camera {self.ip}: {e}")
+            return None, None
+        if self.failures:
+            self.logger.info(f"Camera {self.ip} recovered after {self.failures} errors")
+            self.failures = 0
+        return self.decode_snapshot(data), data
+
+    def fetch_snapshot_bytes(self, snapshot_uri):
+        # Только запрос JPEG: без декодирования и без изменения состояния камеры
+        with metrics.timer('snapshot_fetch', camera=self.ip_suffix):
+            with urllib.request.urlopen(snapshot_uri, timeout=self.snapshot_timeout) as response:
+                return response.read()
+
+    def decode_snapshot(self, data):
+        with metrics.timer('jpeg_decode', camera=self.ip_suffix):
+            image = decode_jpeg(data, self.decode_scale)
+        if image is None:
             return None
+        if self.decode_scale == 1:
+            if image.shape != self.frame_shape:
+                self.frame_shape = image.shape
+                self.decode_scale = self.choose_decode_scale()
+                # libjpeg округляет размер уменьшенного кадра вверх
+                self.decoded_shape = (-(-image.shape[0] // self.decode_scale),
+                                      -(-image.shape[1] // self.decode_scale))
+                self.logger.info(f"Camera {self.ip} frame {image.shape[1]}x{image.shape[0]}, "
+                                 f"decoded at 1/{self.decode_scale}")
+        elif image.shape[:2] != self.decoded_shape:
+            # Камера сменила разрешение: кадр декодируется целиком, уменьшение выбирается заново
+            self.decode_scale = 1
+            return self.decode_snapshot(data)
+        return image
+
+    def choose_decode_scale(self):
+        if self.decode_config != 'auto':
+            return int(self.decode_config or 1)
+        imgsz = max(size or DEFAULT_IMGSZ for size in self.imgsz)
+        return decode_scale([zone.size(self.frame_shape) for zone in self.zones], imgsz)
+
+    def frame_scale(self, snapshot):
+        # Во сколько раз кадр меньше полного (кадры потока и уже декодированные - полные)
+        if self.frame_shape is None:
+            return 1
+        return max(1, round(self.frame_shape[1] / snapshot.shape[1]))
 
-    def process_image(self, image):
-        x, y, w, h = self.area
-        roi = image[y:y + h, x:x + w]  # Вырезаем область интереса (ROI)
-        return roi
+    def set_zones(self):
+        # Зоны (или одна area) и свой фильтр изменений для каждой зоны
+        self.zones = parse_zones(self.zone_config, self.area)
+        self.motion_gates = {zone.name: create_motion_gate(self.motion_gate_config) for zone in self.zones}
+        # Уменьшение при декодировании выбирается заново по первому полному кадру
+        self.decode_scale = 1
+        self.frame_shape = None
 
-    def check_image_with_model(self, image, model, conf, max_det):
-        # self.logger.debug(f"check_image_with_model started {self.ip}")
-        if self.area:
-            image = self.process_image(image)
+    def check_images_with_model(self, images, regions=None):
+        # Все зоны кадра проверяются одним пакетом
         try:
-            results = model.predict(image, conf=conf, max_det=max_det, stream=True, verbose=False)
-            results = next(results)
-            return results.summary(), results.plot()
+            return self.inference.detect_batch(images, regions)
         except Exception as e:
             self.logger.error(f"Error checking image with model: {e}")
-            return None, None
+            return [(None, None)] * len(images)
+
+    def save_image(self, image, model_name, data=None):
+        # Снимок пишется в кольцо на диске фоновым потоком. Если есть готовый JPEG
+        # (исходный снимок камеры), он записывается как есть, без перекодирования
+        return self.image_writer.save(image, model_name, data=data)
+
+    def send_alarm_and_notification(self, image, model_name, detected_at, zone):
+        # Тревога уходит до сохранения снимка, чтобы запись на диск не задерживала сирену
+        self.alarm_queue.put(('alarm', zone.alarm_url or self.alarm_url, self.ip_suffix, detected_at))
+        if (datetime.now() - self.last_telegram_message_time) > MESSAGE_COOLDOWN:
+            # Размеченный снимок кодируется один раз: эти же байты уходят в Telegram и на диск
+            data = encode_jpeg(image)
+            camera_name = f'{self.ip_suffix}, зона {zone.name}' if zone.name else self.ip_suffix
+            self.response_queue.put(('notification', (data, camera_name)))
+            self.last_telegram_message_time = datetime.now()
+            self.save_image(image, model_name, data=data)
+        else:
+            self.save_image(image, model_name)
 
-    def save_image(self, image, model_name):
+    def send_current_snapshot(self):
+        if self.pooled:
+            # Последний снимок, полученный через пул, без отдельного запроса к камере
+            return self.last_data
+        if self.mode == 'stream':
+            # Не забираем кадр у цикла детекции, берём последний декодированный
+            snapshot = self.stream_reader.latest() if self.stream_reader else None
+            return encode_jpeg(snapshot) if snapshot is not None else None
+        # Снимок камеры отправляется в Telegram как есть, без декодирования и записи на диск.
+        # Вызывается из потока команд: счётчик ошибок, адрес снимка и масштаб декодирования
+        # принадлежат циклу детекции и здесь не меняются
+        snapshot_uri = self.snapshot_uri
+        if snapshot_uri is None:
+            return None
         try:
-            if self.image_counter > number_recorded_pictures:
-                self.image_counter = 0
-            self.image_counter += 1
-            image_path = os.path.join(self.save_dir, f'{self.ip.split(".")[-1]}_{self.image_counter}_{model_name}.jpg')
-            cv2.imwrite(image_path, image)
-            self.logger.debug(f"Image saved to {image_path}")
-            return image_path
+            return self.fetch_snapshot_bytes(snapshot_uri)
         except Exception as e:
-            self.logger.error(f"Error saving image: {e}")
+            self.logger.error(f"Error getting snapshot for /now from camera {self.ip}: {e}")
             return None
 
-    def send_alarm_and_notification(self, image, model_name):
-        image_path = self.save_image(image, model_name)
-        if image_path:
-            self.alarm_queue.put(('alarm', self.alarm_url, self.ip_suffix))
-            if (datetime.now() - self.last_telegram_message_time) > MESSAGE_COOLDOWN:
-                self.response_queue.put(('notification', (image_path, self.ip_suffix)))
-                self.last_telegram_message_time = datetime.now()
+    def check_motion(self, zone, roi):
+        motion_gate = self.motion_gates.get(zone.name)
+        if motion_gate is None:
+            return True
+        passed = motion_gate.check(roi)
+        metrics.inc('motion_gate', camera=self.ip_suffix, result='pass' if passed else 'skip')
+        if datetime.now() - self.last_gate_log_time > GATE_LOG_INTERVAL:
+            self.logger.info(f"Motion gate stats for camera {self.ip}: {self.gate_stats()}")
+            self.last_gate_log_time = datetime.now()
+        return passed
 
-    def send_current_snapshot(self):
-        snapshot = self.get_snapshot()
-        if snapshot is not None:
-            image_path = os.path.join(self.save_dir, 'current_snapshot.jpg')
-            cv2.imwrite(image_path, snapshot)
-            return image_path
+    def gate_stats(self):
+        # Сумма счётчиков фильтров всех зон
+        stats = {'hits': 0, 'misses': 0, 'forced': 0}
+        for motion_gate in self.motion_gates.values():
+            if motion_gate is not None:
+                for key, value in motion_gate.stats().items():
+                    stats[key] += value
+        return stats
+
+    def gate_status(self):
+        if not any(self.motion_gates.values()):
+            return f'camera, {self.ip_suffix}, motion gate disabled'
+        stats = self.gate_stats()
+        checked = stats['hits'] + stats['forced']
+        total = checked + stats['misses']
+        skipped = stats['misses'] / total * 100 if total else 0
+        return (f"camera, {self.ip_suffix}, motion gate: hits {stats['hits']}, "
+                f"misses {stats['misses']}, forced {stats['forced']}, skipped {skipped:.1f}%")
+
+    def count_frame(self):
+        self.fps_frames += 1
+        metrics.inc('frames', camera=self.ip_suffix)
+        elapsed = time.monotonic() - self.fps_start
+        if elapsed >= FPS_INTERVAL:
+            metrics.set_gauge('camera_fps', round(self.fps_frames / elapsed, 3), camera=self.ip_suffix)
+            self.fps_frames = 0
+            self.fps_start = time.monotonic()
+
+    def process_detection(self, zone, roi, results, detected_at):
+        # Размеченные снимки рисуются здесь и только те, что будут сохранены или отправлены
+        results_nano, results_heavy = results
+        if DEBUG_IMAGE:
+            self.save_image(plot_detections(roi, results_nano), zone.label('nano'))
+        if not results_heavy:
+            return
+        heavy_snapshot = plot_detections(roi, results_heavy)
+        if time.monotonic() < self.alarm_suppressed_until.get(zone.name, 0):
+            self.logger.debug(f"Alarm from camera {self.ip} zone {zone.name} suppressed, cooldown")
+            metrics.inc('alarms', camera=self.ip_suffix, result='suppressed')
+            self.save_image(heavy_snapshot, zone.label('heavy'))
+            return
+        self.send_alarm_and_notification(heavy_snapshot, zone.label('heavy'), detected_at, zone)
+        self.alarm_suppressed_until[zone.name] = time.monotonic() + ALARM_COOLDOWN
+
+    def process_frame(self, snapshot, data):
+        self.count_frame()
+        self.last_frame.value = time.monotonic()
+        self.last_data = data
+        # Кадр получен и декодирован один раз, зоны вырезаются из него
+        scale = self.frame_scale(snapshot)
+        with metrics.timer('roi_crop', camera=self.ip_suffix):
+            crops = [(zone, zone.crop(snapshot, scale)) for zone in self.zones]
+        crops = [(zone, roi) for zone, roi in crops if self.check_motion(zone, roi)]
+        if not crops:
+            self.scheduler.record(motion=False, hit=False)
+            return
+        results = self.check_images_with_model([roi for _, roi in crops], [zone.name for zone, _ in crops])
+        detected_at = time.time()
+        hits = [(zone, roi, result) for (zone, roi), result in zip(crops, results) if result[0]]
+        self.scheduler.record(motion=True, hit=bool(hits))
+        if DEBUG_IMAGE and hits:
+            self.save_image(snapshot, 'row_nano', data=data)
+            if any(result[1] for _, _, result in hits):
+                self.save_image(snapshot, 'row_heavy', data=data)
+        for zone, roi, result in hits:
+            self.process_detection(zone, roi, result, detected_at)
 
     def process_snapshot(self):
-        snapshot = self.get_snapshot()
+        snapshot, data = self.get_snapshot()
         if snapshot is not None:
-            results_nano, nano_snapshot = self.check_image_with_model(snapshot, self.model_nano, CONF, MAX_DET)
-            if results_nano:
-                if DEBUG_IMAGE:
-                    self.save_image(nano_snapshot, 'nano')
-                    self.save_image(snapshot, 'row_nano')
-                results_heavy, heavy_snapshot = self.check_image_with_model(snapshot, self.model_heavy, CONF, MAX_DET)
-                if results_heavy:
-                    if DEBUG_IMAGE:
-                        self.save_image(snapshot, 'row_heavy')
-                    self.send_alarm_and_notification(heavy_snapshot, 'heavy')
-                    time.sleep(10)
+            self.process_frame(snapshot, data)
+
+    def next_frame_time(self, cycle_start):
+        interval = self.scheduler.interval()
+        metrics.set_gauge('camera_interval', interval, camera=self.ip_suffix)
+        next_frame = cycle_start + interval
+        if self.budget is not None:
+            next_frame = self.budget.reserve(next_frame)
+        return next_frame
+
+    def wait_next_frame(self, cycle_start):
+        delay = self.next_frame_time(cycle_start) - time.monotonic()
+        # Ожидание прерывается событием тревоги от камеры (команда boost)
+        if delay > 0 and self.wakeup.wait(delay):
+            self.wakeup.clear()
+
+    def boost(self, duration):
+        self.scheduler.boost(duration)
+        self.wakeup.set()
+        metrics.inc('camera_boosts', camera=self.ip_suffix)
+
+    def update_config(self, params):
+        # Параметры из обновлённого файла конфигурации, без перезапуска процесса
+        if 'area' in params:
+            self.area = params['area']
+        if 'zones' in params:
+            self.zone_config = params['zones']
+        if 'motion_gate' in params:
+            self.motion_gate_config = params['motion_gate']
+        if 'area' in params or 'zones' in params or 'motion_gate' in params:
+            self.set_zones()
+        if 'alarm_url' in params:
+            self.alarm_url = params['alarm_url']
+        if 'schedule' in params:
+            self.scheduler = AdaptiveScheduler(**params['schedule']) if params['schedule'] else AdaptiveScheduler()
+
+    def handle_command(self, command):
+        if isinstance(command, tuple) and command[0] == 'update_config':
+            self.update_config(command[1])
+            self.logger.info(f"Camera {self.ip} config updated: {sorted(command[1])}")
+        elif isinstance(command, tuple) and command[0] == 'boost':
+            self.boost(command[1])
+            self.logger.info(f"Camera {self.ip} boosted for {command[1]} s by {command[2]} event")
+        elif command == 'request_snapshot':
+            self.logger.debug(
+                f"Processing snapshot request for camera IP suffix: {self.ip_suffix}")
+            data = self.send_current_snapshot()
+            self.response_queue.put(('snapshot_done', data))
+        elif command == 'start_camera':
+            data = f'camera, {self.ip_suffix}, already run'
+            self.logger.debug(data)
+            self.response_queue.put(('camera_status', data))
+        elif command == 'gate_stats':
+            self.response_queue.put(('camera_status', self.gate_status()))
+        elif command == 'stop_camera':
+            data = f'camera, {self.ip_suffix}, camera started shutdown'
+            self.response_queue.put(('camera_status', data))
+            self.running.value = False
 
     def process_queue(self):
         while self.running.value:
             try:
-                if not self.command_queue.empty():
-                    command = self.command_queue.get()
-                    if command == 'request_snapshot':
-                        self.logger.debug(
-                            f"Processing snapshot request for camera IP suffix: {self.ip_suffix}")
-                        patch = self.send_current_snapshot()
-                        self.response_queue.put(('snapshot_done', patch))
-                    elif command == 'start_camera':
-                        data = f'camera, {self.ip_suffix}, already run'
-                        self.logger.debug(data)
-                        self.response_queue.put(('camera_status', data))
-                    elif command == 'stop_camera':
-                        data = f'camera, {self.ip_suffix}, camera started shutdown'
-                        self.response_queue.put(('camera_status', data))
-                        self.running.value = False
+                command = get_message(self.command_queue)
+                if command is not None:
+                    self.handle_command(command)
             except Exception as e:
                 self.logger.error(f"Error processing command: {e}")
-            time.sleep(1)
+
+    def start_pipeline(self):
+        # Общая часть запуска для отдельного процесса камеры и для обработчика пула
+        if not hasattr(self, 'logger'):
+            self.initialize_logger()
+        metrics.configure(self.metrics_queue)
+        self.running.value = True
+        self.wakeup = threading.Event()
+        self.image_writer = ImageWriter(
+            ImageRingStore(self.save_dir, self.ip_suffix, number_recorded_pictures), self.logger)
+        self.image_writer.start()
+
+    def stop_pipeline(self):
+        self.image_writer.stop()
+        self.inference.close()
+        metrics.flush(force=True)
 
     def run(self):
-        self.initialize_logger()
+        self.start_pipeline()
         self.logger.info(f"Process for camera {self.ip} started")
         self.initialize_camera()
         queue_thread = None
@@ -183,16 +517,22 @@ class CameraProcessor(multiprocessing.Process):
             self.logger.error(f"Error in queue_thread: {e}")
 
         while self.running.value:
+            cycle_start = time.monotonic()
+            self.heartbeat.value = cycle_start
             try:
                 # self.logger.debug(f"Started process_snapshot from camera {self.ip}")
-                self.process_snapshot()
+                with metrics.timer('frame_cycle', camera=self.ip_suffix):
+                    self.process_snapshot()
                 # self.logger.debug(f"process_snapshot from camera {self.ip} completed successfully")
-                time.sleep(1)
             except Exception as e:
                 self.logger.error(f"Error in process_snapshot: {e}")
+            # Интервал до следующего кадра задаёт планировщик, а не фиксированный sleep(1)
+            self.wait_next_frame(cycle_start)
         else:
             if queue_thread:
                 queue_thread.join()
                 self.logger.debug(f"Stop queue_thread from camera {self.ip}")
 
+        self.stop_stream()
+        self.stop_pipeline()
         self.logger.info(f"Process for camera {self.ip} stopped")
@@ -0,0 +1,154 @@
+import time
+from inference_backend import Detections
+import metrics
+
+# Область nano расширяется на долю своего размера, но не меньше MIN_CROP пикселей по стороне
+CROP_PADDING = 0.3
+MIN_CROP = 160
+# Если расширенная область занимает почти всю зону, тяжёлая модель проверяет зону целиком
+FULL_FRAME_SHARE = 0.6
+# Сколько секунд действует решение тяжёлой модели по объекту: подтверждение и отказ
+CONFIRM_TTL = 30
+REJECT_TTL = 10
+MATCH_IOU = 0.5
+# Не больше ESCALATION_RATE запусков тяжёлой модели в секунду на камеру, с запасом ESCALATION_BURST
+ESCALATION_RATE = 2
+ESCALATION_BURST = 4
+
+
+def box_of(detection):
+    box = detection['box']
+    return box['x1'], box['y1'], box['x2'], box['y2']
+
+
+def iou(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0
+    inter = width * height
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+
+def padded_region(box, shape, padding=CROP_PADDING, min_crop=MIN_CROP):
+    height, width = shape[:2]
+    x1, y1, x2, y2 = box
+    pad_x = max((x2 - x1) * padding, (min_crop - (x2 - x1)) / 2)
+    pad_y = max((y2 - y1) * padding, (min_crop - (y2 - y1)) / 2)
+    region = (max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y)),
+              min(width, int(x2 + pad_x) + 1), min(height, int(y2 + pad_y) + 1))
+    if (region[2] - region[0]) * (region[3] - region[1]) >= FULL_FRAME_SHARE * width * height:
+        return 0, 0, width, height
+    return region
+
+
+def shift_detections(detections, dx, dy):
+    shifted = []
+    for detection in detections:
+        x1, y1, x2, y2 = box_of(detection)
+        shifted.append(dict(detection, box={'x1': x1 + dx, 'y1': y1 + dy, 'x2': x2 + dx, 'y2': y2 + dy}))
+    return shifted
+
+
+def plot_detections(image, detections):
+    # Рамки тяжёлой модели рисуются на всей зоне, а не на вырезанной области
+    return Detections(image, [box_of(d) for d in detections], [d['confidence'] for d in detections],
+                      [d['class'] for d in detections], {d['class']: d['name'] for d in detections}).plot()
+
+
+# Решения тяжёлой модели по объектам камеры и зоны. Объект узнаётся по IoU рамки nano,
+# рамка обновляется при каждом совпадении, а срок - нет: раз в ttl объект проверяется заново.
+# Подтверждённые объекты хранятся относительно рамки nano, отклонённые - как None.
+class VerdictCache:
+    def __init__(self, confirm_ttl=CONFIRM_TTL, reject_ttl=REJECT_TTL, match_iou=MATCH_IOU):
+        self.confirm_ttl = confirm_ttl
+        self.reject_ttl = reject_ttl
+        self.match_iou = match_iou
+        self.entries = {}
+
+    def lookup(self, key, box, now):
+        entries = [entry for entry in self.entries.get(key, []) if entry['expires'] > now]
+        self.entries[key] = entries
+        best = max(entries, key=lambda entry: iou(entry['box'], box), default=None)
+        if best is None or iou(best['box'], box) < self.match_iou:
+            return False, None
+        best['box'] = box
+        return True, best['detections']
+
+    def store(self, key, box, detections, now):
+        ttl = self.confirm_ttl if detections else self.reject_ttl
+        if ttl > 0:
+            self.entries.setdefault(key, []).append({'box': box, 'detections': detections or None,
+                                                     'expires': now + ttl})
+
+
+# Ограничение частоты запусков тяжёлой модели по камере (token bucket), 0 - без ограничения
+class EscalationLimiter:
+    def __init__(self, rate=ESCALATION_RATE, burst=ESCALATION_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = {}
+        self.updated = {}
+
+    def allow(self, camera, now):
+        if self.rate <= 0:
+            return True
+        tokens = min(self.burst, self.tokens.get(camera, self.burst)
+                     + (now - self.updated.get(camera, now)) * self.rate)
+        self.updated[camera] = now
+        allowed = tokens >= 1
+        self.tokens[camera] = tokens - 1 if allowed else tokens
+        return allowed
+
+
+# Каскад nano -> heavy: тяжёлая модель проверяет только расширенные области, найденные nano,
+# уже проверенные объекты берутся из кэша, частота проверок ограничена по камере
+class HeavyCascade:
+    def __init__(self, padding=CROP_PADDING, min_crop=MIN_CROP, confirm_ttl=CONFIRM_TTL,
+                 reject_ttl=REJECT_TTL, match_iou=MATCH_IOU, max_rate=ESCALATION_RATE,
+                 burst=ESCALATION_BURST):
+        self.padding = padding
+        self.min_crop = min_crop
+        self.cache = VerdictCache(confirm_ttl, reject_ttl, match_iou)
+        self.limiter = EscalationLimiter(max_rate, burst)
+
+    def plan(self, images, nano, keys):
+        # keys - (камера, зона) каждого изображения. Возвращает области для тяжёлой модели
+        # и уже подтверждённые объекты по изображениям
+        now = time.monotonic()
+        requests = []
+        confirmed = [[] for _ in images]
+        for i, summary in enumerate(nano):
+            camera = keys[i][0]
+            for detection in summary or []:
+                box = box_of(detection)
+                found, detections = self.cache.lookup(keys[i], box, now)
+                if found:
+                    metrics.inc('heavy_escalations', camera=camera, result='cached')
+                    if detections:
+                        confirmed[i] += shift_detections(detections, box[0], box[1])
+                elif self.limiter.allow(camera, now):
+                    metrics.inc('heavy_escalations', camera=camera, result='run')
+                    requests.append((i, box, padded_region(box, images[i].shape, self.padding, self.min_crop)))
+                else:
+                    metrics.inc('heavy_escalations', camera=camera, result='throttled')
+        return requests, confirmed
+
+    def crops(self, images, requests):
+        return [images[i][y1:y2, x1:x2] for i, _, (x1, y1, x2, y2) in requests]
+
+    def record(self, keys, requests, summaries, confirmed):
+        now = time.monotonic()
+        for (i, box, region), summary in zip(requests, summaries):
+            detections = shift_detections(summary, region[0], region[1])
+            self.cache.store(keys[i], box, shift_detections(detections, -box[0], -box[1]), now)
+            confirmed[i] += detections
+        return confirmed
+
+
+def create_cascade(cascade):
+    # cascade: True - каскад с параметрами по умолчанию, dict - свои параметры, False - как раньше,
+    # тяжёлая модель на всей зоне при каждом срабатывании nano
+    if isinstance(cascade, dict):
+        return HeavyCascade(**cascade)
+    return HeavyCascade() if cascade else None
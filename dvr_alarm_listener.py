@@ -0,0 +1,122 @@
+import asyncio
+import multiprocessing
+import socket
+import struct
+import metrics
+from scheduler import BOOST_DURATION
+from sofia import HEADER, decode_json, parse_header
+from log_listener import get_logger
+
+LISTENER_HOST = '0.0.0.0'
+LISTENER_PORT = 15002
+READ_TIMEOUT = 30
+# Камеры адресуются последним октетом в этой подсети, как в CameraProcessor
+SUBNET = '192.168.1.'
+# События, по которым камера сразу переходит на частый опрос
+BOOST_EVENTS = ('MotionDetect', 'HumanDetect', 'FaceDetect', 'VideoMotion', 'PIRAlarm', 'LocalAlarm')
+
+
+def event_address(event):
+    # Address - IPv4 камеры как шестнадцатеричное число в порядке байт little endian,
+    # например 0x0B01A8C0 - 192.168.1.11
+    address = event.get('Address')
+    if address is None:
+        return None
+    if isinstance(address, str):
+        address = int(address, 16)
+    return socket.inet_ntoa(struct.pack('<I', address))
+
+
+def parse_packets(data):
+    # Разбор записанного потока байт на события, для проверки парсера без сети
+    events = []
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        header = parse_header(data[offset:offset + HEADER.size])
+        offset += HEADER.size
+        events.append(decode_json(data[offset:offset + header['size']]))
+        offset += header['size']
+    return events
+
+
+# Приём тревог, которые камеры и регистраторы с прошивкой XM/Sofia сами отправляют
+# на "сервер тревог" (в настройках камеры: Network - Alarm Server, порт 15002).
+# Вместо get_sound/dvr-alarm-server.pl: событие движения от камеры сразу включает
+# частый опрос соответствующей камеры командой ('boost', длительность, событие).
+class DvrAlarmListener(multiprocessing.Process):
+    def __init__(self, command_queues, host=LISTENER_HOST, port=LISTENER_PORT,
+                 boost_duration=BOOST_DURATION, metrics_queue=None, log_queue=None):
+        super().__init__()
+        self.command_queues = command_queues
+        self.host = host
+        self.port = port
+        self.boost_duration = boost_duration
+        self.metrics_queue = metrics_queue
+        self.log_queue = log_queue
+        self.running = multiprocessing.Value('b', True)
+
+    def initialize_logger(self):
+        self.logger = get_logger('DvrAlarmListener', 'dvr_alarm_listener.log', self.log_queue)
+
+    def find_camera(self, event, peer):
+        # Адрес из события надёжнее адреса соединения: регистратор может быть за NAT
+        address = event_address(event) or peer
+        if not address or not address.startswith(SUBNET):
+            return None
+        ip = address[len(SUBNET):]
+        # В конфигурации ip камеры обычно число ("ip": 11), но может быть и строкой
+        for key in (ip, int(ip) if ip.isdigit() else None):
+            if key is not None and key in self.command_queues:
+                return key
+        return None
+
+    def handle_event(self, event, peer):
+        name = event.get('Event', 'unknown')
+        status = event.get('Status')
+        ip = self.find_camera(event, peer)
+        self.logger.info(f"Event {name} {status} from {peer}, address {event.get('Address')}, "
+                         f"channel {event.get('Channel')}, camera {ip}")
+        metrics.inc('camera_events', event=name, camera=ip or 'unknown')
+        if ip is None:
+            self.logger.warning(f"No camera for event from {peer}: {event}")
+            return
+        if status == 'Start' and name in BOOST_EVENTS:
+            self.command_queues[ip].put(('boost', self.boost_duration, name))
+
+    async def handle_client(self, reader, writer):
+        peer = writer.get_extra_info('peername')[0]
+        try:
+            # Камера обычно отправляет один пакет и закрывает соединение, но читаем до конца
+            while self.running.value:
+                try:
+                    data = await asyncio.wait_for(reader.readexactly(HEADER.size), READ_TIMEOUT)
+                except asyncio.IncompleteReadError:
+                    break
+                header = parse_header(data)
+                payload = await asyncio.wait_for(reader.readexactly(header['size']), READ_TIMEOUT)
+                self.handle_event(decode_json(payload), peer)
+        except asyncio.TimeoutError:
+            self.logger.debug(f"Connection from {peer} timed out")
+        except Exception as e:
+            self.logger.error(f"Error reading alarm from {peer}: {e!r}")
+            metrics.inc('camera_events_failed')
+        finally:
+            writer.close()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.logger.info(f"DVR alarm listener on {self.host}:{self.port}")
+        async with server:
+            while self.running.value:
+                await asyncio.sleep(0.5)
+                metrics.flush()
+
+    def run(self):
+        self.initialize_logger()
+        metrics.configure(self.metrics_queue)
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            self.logger.error(f"Error in DVR alarm listener: {e}")
+        metrics.flush(force=True)
+        self.logger.info("DVR alarm listener stopped")
@@ -0,0 +1,162 @@
+from collections import namedtuple
+from multiprocessing import shared_memory, resource_tracker
+import itertools
+import os
+import time
+import numpy as np
+
+SLOT_COUNT = 4
+HEADER_FIELDS = 2
+# Сегменты разделяемой памяти POSIX видны файлами только на Linux
+SHM_DIR = '/dev/shm'
+# Кольцо, из которого инференс не читал дольше этого, отключается: камера остановлена или убрана
+RING_IDLE_TIMEOUT = 60
+PRUNE_INTERVAL = 10
+
+FrameDescriptor = namedtuple('FrameDescriptor',
+                             ['camera', 'ring', 'slot', 'seq', 'shape', 'dtype', 'timestamp'])
+
+_ring_generation = itertools.count()
+
+
+def start_resource_tracker():
+    # Вызывается в главном процессе до запуска дочерних: тогда все процессы делят один
+    # resource_tracker, и подключение к чужому кольцу не приводит к его удалению при выходе
+    if os.name == 'posix':
+        resource_tracker.ensure_running()
+
+
+def ring_prefix(camera, pid):
+    return f'dvr_frames_{camera}_{pid}_'
+
+
+def ring_linked(name):
+    # Без /dev/shm проверить нельзя, кольцо считается существующим
+    return not os.path.isdir(SHM_DIR) or os.path.exists(os.path.join(SHM_DIR, name))
+
+
+def unlink_rings(camera, pid):
+    # Кольца процесса камеры, завершённого terminate/kill: FrameRing.close() в нём не выполнился,
+    # и сегменты остались бы в /dev/shm до выхода всего сервиса. Возвращает имена удалённых
+    if not os.path.isdir(SHM_DIR):
+        return []
+    names = [name for name in os.listdir(SHM_DIR) if name.startswith(ring_prefix(camera, pid))]
+    for name in names:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+    return names
+
+
+def _attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+# Кольцевой буфер кадров фиксированного размера в разделяемой памяти.
+# Заголовок: [slot_bytes, slot_count, seq слота 0, ..., seq слота N-1]
+class FrameRing:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.name = shm.name
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.uint64, buffer=shm.buf)
+        self.slot_bytes = int(header[0])
+        self.slot_count = int(header[1])
+        self.seqs = np.ndarray((self.slot_count,), dtype=np.uint64, buffer=shm.buf,
+                               offset=HEADER_FIELDS * 8)
+        self.data_offset = (HEADER_FIELDS + self.slot_count) * 8
+        self.next_slot = 0
+
+    @classmethod
+    def create(cls, camera, slot_bytes, slot_count=SLOT_COUNT):
+        name = f'{ring_prefix(camera, os.getpid())}{next(_ring_generation)}'
+        header_bytes = (HEADER_FIELDS + slot_count) * 8
+        shm = shared_memory.SharedMemory(name=name, create=True,
+                                         size=header_bytes + slot_bytes * slot_count)
+        header = np.ndarray((HEADER_FIELDS + slot_count,), dtype=np.uint64, buffer=shm.buf)
+        header[0] = slot_bytes
+        header[1] = slot_count
+        header[HEADER_FIELDS:] = 0
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach_shared_memory(name), owner=False)
+
+    def fits(self, image):
+        return image.nbytes <= self.slot_bytes
+
+    def slot_view(self, slot, shape, dtype):
+        offset = self.data_offset + slot * self.slot_bytes
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+
+    def write(self, camera, image):
+        slot = self.next_slot
+        self.next_slot = (self.next_slot + 1) % self.slot_count
+        seq = int(self.seqs[slot]) + 1
+        self.seqs[slot] = 0
+        np.copyto(self.slot_view(slot, image.shape, image.dtype), image)
+        self.seqs[slot] = seq
+        return FrameDescriptor(camera, self.name, slot, seq, image.shape, image.dtype.str, time.time())
+
+    def read(self, descriptor):
+        # Кадр возвращается без копирования. Если слот уже перезаписан, кадр устарел.
+        if int(self.seqs[descriptor.slot]) != descriptor.seq:
+            return None
+        return self.slot_view(descriptor.slot, descriptor.shape, np.dtype(descriptor.dtype))
+
+    def close(self):
+        self.seqs = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # На буфер ещё ссылаются numpy-представления, сегмент освободится вместе с ними
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# Сторона потребителя: подключается к кольцам камер по имени из дескриптора
+class FrameRingReader:
+    def __init__(self):
+        self.rings = {}
+        self.last_read = {}
+        self.last_prune = time.monotonic()
+
+    def read(self, descriptor):
+        self.last_read[descriptor.camera] = time.monotonic()
+        ring = self.rings.get(descriptor.camera)
+        if ring is None or ring.name != descriptor.ring:
+            if ring is not None:
+                ring.close()
+            ring = FrameRing.attach(descriptor.ring)
+            self.rings[descriptor.camera] = ring
+        return ring.read(descriptor)
+
+    def prune(self, idle_timeout=RING_IDLE_TIMEOUT):
+        # Отключается от колец удалённых сегментов (процесс камеры перезапущен или остановлен)
+        # и колец, из которых давно не читали: подключение держит память сегмента после unlink
+        now = time.monotonic()
+        if now - self.last_prune < PRUNE_INTERVAL:
+            return []
+        self.last_prune = now
+        dropped = [camera for camera, ring in self.rings.items()
+                   if now - self.last_read[camera] > idle_timeout or not ring_linked(ring.name)]
+        for camera in dropped:
+            self.rings.pop(camera).close()
+            self.last_read.pop(camera)
+        return dropped
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings.clear()
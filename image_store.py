@@ -0,0 +1,126 @@
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+import metrics
+
+QUEUE_SIZE = 32
+WRITE_BATCH = 8
+JPEG_QUALITY = 90
+
+
+def encode_jpeg(image, quality=JPEG_QUALITY):
+    ok, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Can not encode image to JPEG")
+    return data.tobytes()
+
+
+# Кольцо снимков камеры фиксированного размера: не больше capacity файлов
+# в каталоге, имя файла определяется номером слота, index.json хранит,
+# что и когда записано в каждый слот, и следующий слот для записи.
+class ImageRingStore:
+    def __init__(self, directory, prefix, capacity):
+        self.directory = directory
+        self.prefix = prefix
+        self.capacity = capacity
+        self.index_path = os.path.join(directory, 'index.json')
+        os.makedirs(directory, exist_ok=True)
+        self.next_slot = 0
+        self.slots = {}
+        self.load_index()
+
+    def load_index(self):
+        try:
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+            self.next_slot = index['next_slot'] % self.capacity
+            self.slots = {int(slot): entry for slot, entry in index['slots'].items()
+                          if int(slot) < self.capacity}
+        except (OSError, ValueError, KeyError):
+            self.next_slot = 0
+            self.slots = {}
+
+    def save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as index_file:
+            json.dump({'next_slot': self.next_slot, 'slots': self.slots}, index_file)
+        os.replace(tmp_path, self.index_path)
+
+    def write(self, data, label, timestamp):
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.capacity
+        file_name = f'{self.prefix}_{slot}_{label}.jpg'
+        old_entry = self.slots.get(slot)
+        if old_entry and old_entry['file'] != file_name:
+            try:
+                os.remove(os.path.join(self.directory, old_entry['file']))
+            except FileNotFoundError:
+                pass
+        path = os.path.join(self.directory, file_name)
+        with open(path, 'wb') as image_file:
+            image_file.write(data)
+        self.slots[slot] = {'file': file_name, 'label': label, 'time': timestamp}
+        return path
+
+
+# Фоновая запись снимков: кодирование JPEG и запись на диск вне цикла детекции.
+# Очередь ограничена, при переполнении новые снимки отбрасываются.
+class ImageWriter(threading.Thread):
+    def __init__(self, store, logger, queue_size=QUEUE_SIZE, jpeg_quality=JPEG_QUALITY):
+        super().__init__(daemon=True)
+        self.store = store
+        self.logger = logger
+        self.jpeg_quality = jpeg_quality
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def save(self, image, label, on_saved=None, data=None):
+        # data - уже закодированный JPEG (снимок камеры как есть), тогда image не кодируется
+        try:
+            self.queue.put_nowait((image, data, label, time.time(), on_saved))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc('images_dropped', camera=self.store.prefix)
+            self.logger.warning(f"Image queue is full, {label} image dropped (total dropped {self.dropped})")
+            return False
+
+    def write_item(self, item):
+        image, data, label, timestamp, on_saved = item
+        with metrics.timer('image_save', camera=self.store.prefix):
+            if data is None:
+                data = encode_jpeg(image, self.jpeg_quality)
+            path = self.store.write(data, label, timestamp)
+        self.logger.debug(f"Image saved to {path}")
+        if on_saved:
+            on_saved(path)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in batch:
+                if item is None:
+                    stopping = True
+                    continue
+                try:
+                    self.write_item(item)
+                except Exception as e:
+                    self.logger.error(f"Error saving image: {e}")
+            # Индекс обновляется один раз на пачку записанных снимков
+            try:
+                self.store.save_index()
+            except Exception as e:
+                self.logger.error(f"Error saving image index: {e}")
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
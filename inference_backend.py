@@ -0,0 +1,146 @@
+import ast
+import cv2
+import numpy as np
+from preprocess import DEFAULT_IMGSZ, PAD_VALUE, Preprocessor, letterbox_geometry
+
+BACKENDS = ('ultralytics', 'onnx', 'openvino')
+
+# Загруженные в этом процессе модели: одна и та же модель не загружается дважды
+_models = {}
+
+
+def letterbox(image, imgsz):
+    # Отдельный холст на каждый вызов: для калибровки и замеров, в инференсе - Preprocessor
+    scale, pad_x, pad_y, new_w, new_h = letterbox_geometry(image.shape, imgsz)
+    canvas = np.full((imgsz[0], imgsz[1], 3), PAD_VALUE, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(
+        image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return canvas, scale, pad_x, pad_y
+
+
+def to_tensor(images):
+    # BGR HWC uint8 -> RGB CHW float32 0..1
+    batch = np.stack([image[:, :, ::-1].transpose(2, 0, 1) for image in images])
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+# Результат в том же виде, что и у ultralytics Results: summary() и plot()
+class Detections:
+    def __init__(self, image, boxes, scores, classes, names):
+        self.orig_img = image
+        self.boxes = boxes
+        self.scores = scores
+        self.classes = classes
+        self.names = names
+
+    def summary(self):
+        return [{'name': self.names.get(int(cls), str(int(cls))),
+                 'class': int(cls),
+                 'confidence': round(float(score), 5),
+                 'box': {'x1': round(float(box[0]), 5), 'y1': round(float(box[1]), 5),
+                         'x2': round(float(box[2]), 5), 'y2': round(float(box[3]), 5)}}
+                for box, score, cls in zip(self.boxes, self.scores, self.classes)]
+
+    def plot(self):
+        image = self.orig_img.copy()
+        for box, score, cls in zip(self.boxes, self.scores, self.classes):
+            x1, y1, x2, y2 = (int(v) for v in box)
+            label = f"{self.names.get(int(cls), int(cls))} {score:.2f}"
+            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 0, 255), 2)
+            cv2.putText(image, label, (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+        return image
+
+
+class UltralyticsBackend:
+    def __init__(self, path):
+        from ultralytics import YOLOv10
+        self.model = YOLOv10(path)
+
+    def predict(self, images, conf, max_det, imgsz=None):
+        # Подготовку кадров ultralytics делает сам, размер входа передаётся ему. Preprocessor
+        # с заранее выделенными буферами здесь не используется, он есть только у OnnxBackend.
+        # Без imgsz камеры ultralytics берёт размер обучения, сохранённый в весах модели
+        return self.model.predict(images, conf=conf, max_det=max_det, verbose=False,
+                                  **({'imgsz': imgsz} if imgsz else {}))
+
+
+# Экспортированная в ONNX модель YOLOv10 (FP32 или INT8) через onnxruntime.
+# YOLOv10 не требует NMS: выход (batch, 300, 6) = x1, y1, x2, y2, score, class
+class OnnxBackend:
+    def __init__(self, path, providers=('CPUExecutionProvider',)):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        available = onnxruntime.get_available_providers()
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=[p for p in providers if p in available] or ['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        height, width = model_input.shape[2:4]
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        # У модели с dynamic=True размер по умолчанию - размер обучения, его сохраняет экспорт ultralytics
+        default_h, default_w = ast.literal_eval(metadata.get('imgsz', str([DEFAULT_IMGSZ, DEFAULT_IMGSZ])))
+        self.imgsz = (height if isinstance(height, int) else default_h,
+                      width if isinstance(width, int) else default_w)
+        # Размер входа камеры применим только к модели, экспортированной с dynamic=True
+        self.dynamic_size = not isinstance(height, int) and not isinstance(width, int)
+        # Статический batch=1 у экспортированной модели - кадры прогоняются по одному
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+        self.preprocessor = Preprocessor()
+
+    def input_size(self, imgsz=None):
+        if imgsz and self.dynamic_size:
+            return imgsz, imgsz
+        return self.imgsz
+
+    def preprocess(self, images, imgsz=None):
+        return self.preprocessor.run(images, self.input_size(imgsz))
+
+    def postprocess(self, image, output, transform, conf, max_det):
+        scale, pad_x, pad_y = transform
+        output = output[output[:, 4] >= conf]
+        output = output[np.argsort(-output[:, 4])][:max_det]
+        boxes = output[:, :4].copy()
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / scale).clip(0, image.shape[1])
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / scale).clip(0, image.shape[0])
+        return Detections(image, boxes, output[:, 4], output[:, 5], self.names)
+
+    def run(self, images, imgsz=None):
+        tensor, transforms = self.preprocess(images, imgsz)
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: tensor})[0]
+        else:
+            outputs = np.concatenate([self.session.run(None, {self.input_name: tensor[i:i + 1]})[0]
+                                      for i in range(len(images))])
+        return outputs, transforms
+
+    def predict(self, images, conf, max_det, imgsz=None):
+        outputs, transforms = self.run(images, imgsz)
+        return [self.postprocess(image, output, transform, conf, max_det)
+                for image, output, transform in zip(images, outputs, transforms)]
+
+
+def load_backend(backend, path):
+    model = _models.get((backend, path))
+    if model is None:
+        model = _models[(backend, path)] = create_backend(backend, path)
+    return model
+
+
+def warm_up(model, imgsz=DEFAULT_IMGSZ, conf=0.5, max_det=1):
+    # Первый прогон выделяет буферы и инициализирует граф, его время не должно попасть на реальный кадр.
+    # imgsz - только размер пустого кадра: размер входа не задаётся, как у камеры без imgsz
+    image = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    model.predict([image], conf, max_det)
+
+
+def create_backend(backend, path):
+    if backend == 'ultralytics':
+        return UltralyticsBackend(path)
+    if backend == 'onnx':
+        return OnnxBackend(path)
+    if backend == 'openvino':
+        # Нужен пакет onnxruntime-openvino, иначе работает обычный CPU провайдер
+        return OnnxBackend(path, providers=('OpenVINOExecutionProvider', 'CPUExecutionProvider'))
+    raise ValueError(f"Unknown inference backend {backend}, expected one of {BACKENDS}")
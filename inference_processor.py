@@ -0,0 +1,241 @@
+import multiprocessing
+import queue
+import time
+from frame_ring import FrameRing, FrameRingReader, SLOT_COUNT
+from inference_backend import load_backend, warm_up
+from cascade import create_cascade
+from log_listener import get_logger
+import metrics
+
+NANO_MODEL_PATH = 'models/nano_10n_st_11.pt'
+HEAVY_MODEL_PATH = 'models/heavy_10m_st_11.pt'
+BACKEND = 'ultralytics'
+CONF = 0.35
+MAX_DET = 1
+BATCH_SIZE = 8
+MAX_WAIT = 0.05
+INFERENCE_TIMEOUT = 30
+
+
+# Клиент в процессе камеры: кладёт ROI в кольцо разделяемой памяти,
+# отправляет в общий процесс инференса только дескриптор и ждёт ответ
+class InferenceClient:
+    def __init__(self, ip_suffix, request_queue, result_queue, timeout=INFERENCE_TIMEOUT, imgsz=(None, None)):
+        self.ip_suffix = ip_suffix
+        self.request_queue = request_queue
+        self.result_queue = result_queue
+        self.timeout = timeout
+        # Размер инференса камеры (nano, heavy), None - размер модели
+        self.imgsz = imgsz
+        self.request_id = 0
+        self.ring = None
+
+    def write_frames(self, images):
+        # Все зоны кадра должны одновременно лежать в кольце, пока их не прочитал инференс
+        slot_bytes = max(image.nbytes for image in images)
+        if self.ring is None or self.ring.slot_bytes < slot_bytes or self.ring.slot_count < len(images):
+            if self.ring is not None:
+                self.ring.close()
+            self.ring = FrameRing.create(self.ip_suffix, slot_bytes, max(SLOT_COUNT, len(images)))
+        return [self.ring.write(self.ip_suffix, image) for image in images]
+
+    def detect_batch(self, images, regions=None):
+        # Запросы уходят подряд, и процесс инференса собирает их в один пакет.
+        # regions - имена зон, по ним инференс различает объекты разных зон камеры
+        request_ids = []
+        for descriptor, region in zip(self.write_frames(images), regions or [None] * len(images)):
+            self.request_id += 1
+            request_ids.append(self.request_id)
+            self.request_queue.put(('detect', self.ip_suffix, self.request_id, descriptor, region, self.imgsz))
+        results = {}
+        deadline = time.monotonic() + self.timeout
+        while len(results) < len(request_ids):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No inference result for requests {request_ids}")
+            request_id, result = self.result_queue.get(timeout=remaining)
+            # Ответы на запросы, по которым истёк таймаут, отбрасываем
+            if request_id in request_ids:
+                results[request_id] = result
+        return [results[request_id] for request_id in request_ids]
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+class InferenceProcessor(multiprocessing.Process):
+    def __init__(self, request_queue, result_queues, batch_size=BATCH_SIZE, max_wait=MAX_WAIT,
+                 backend=BACKEND, nano_model_path=NANO_MODEL_PATH, heavy_model_path=HEAVY_MODEL_PATH,
+                 metrics_queue=None, conf=CONF, max_det=MAX_DET, cascade=True, log_queue=None):
+        super().__init__()
+        self.request_queue = request_queue
+        self.result_queues = result_queues
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.backend = backend
+        self.nano_model_path = nano_model_path
+        self.heavy_model_path = heavy_model_path
+        self.metrics_queue = metrics_queue
+        self.log_queue = log_queue
+        self.conf = conf
+        self.max_det = max_det
+        self.cascade = create_cascade(cascade)
+        # Устанавливается, когда модели загружены и прогреты
+        self.ready = multiprocessing.Event()
+        self.running = multiprocessing.Value('b', True)
+
+    def initialize_logger(self):
+        self.logger = get_logger('InferenceProcessor', 'inference.log', self.log_queue)
+
+    def load_models(self):
+        # torch/onnxruntime и веса моделей загружаются только в процессе инференса, один раз
+        start = time.perf_counter()
+        self.model_nano = load_backend(self.backend, self.nano_model_path)
+        self.model_heavy = load_backend(self.backend, self.heavy_model_path)
+        loaded = time.perf_counter()
+        warm_up(self.model_nano, conf=self.conf, max_det=self.max_det)
+        warm_up(self.model_heavy, conf=self.conf, max_det=self.max_det)
+        self.logger.info(f"Models loaded with {self.backend} backend: "
+                         f"{self.nano_model_path}, {self.heavy_model_path}, "
+                         f"load {loaded - start:.2f} s, warm-up {time.perf_counter() - loaded:.2f} s")
+        self.ready.set()
+
+    def collect_batch(self):
+        batch = []
+        try:
+            batch.append(self.request_queue.get(timeout=1))
+        except queue.Empty:
+            return batch
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.request_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def predict(self, model, images, sizes=None):
+        # Только рамки: размеченные снимки рисует камера, когда снимок отправляется или сохраняется.
+        # Кадры с разным размером инференса идут в модель отдельными пакетами
+        groups = {}
+        for i, imgsz in enumerate(sizes or [None] * len(images)):
+            groups.setdefault(imgsz, []).append(i)
+        summaries = [None] * len(images)
+        for imgsz, indexes in groups.items():
+            results = model.predict([images[i] for i in indexes], conf=self.conf, max_det=self.max_det,
+                                    imgsz=imgsz)
+            for i, result in zip(indexes, results):
+                summaries[i] = result.summary()
+        return summaries
+
+    def read_frames(self, batch):
+        frames = []
+        for request in batch:
+            try:
+                frame = self.frame_reader.read(request[3])
+            except Exception as e:
+                self.logger.error(f"Error reading frame of camera {request[1]}: {e}")
+                frame = None
+            if frame is None:
+                self.logger.error(f"Frame of camera {request[1]} is not available")
+            frames.append(frame)
+        return frames
+
+    def observe_share(self, name, start, cameras):
+        # Время пакета делится поровну между камерами, чьи кадры в него попали
+        share = (time.perf_counter() - start) / len(cameras)
+        for camera in cameras:
+            metrics.observe(name, share, camera=camera)
+
+    def process_heavy(self, images, nano, cameras, regions, sizes):
+        # Каскад: тяжёлая модель на расширенных областях nano, кроме объектов из кэша
+        keys = list(zip(cameras, regions or [None] * len(images)))
+        requests, confirmed = self.cascade.plan(images, nano, keys)
+        if requests:
+            start = time.perf_counter()
+            summaries = self.predict(self.model_heavy, self.cascade.crops(images, requests),
+                                     [sizes[i] for i, _, _ in requests])
+            self.observe_share('heavy_inference', start, [cameras[i] for i, _, _ in requests])
+            self.cascade.record(keys, requests, summaries, confirmed)
+        return {i: detections for i, detections in enumerate(confirmed) if detections}
+
+    def process_batch(self, images, cameras, regions=None, sizes=None):
+        # sizes - размеры инференса (nano, heavy) каждого кадра, None - размеры моделей.
+        # Результат по каждому кадру - (рамки nano, рамки heavy) в координатах кадра
+        sizes = [imgsz or (None, None) for imgsz in sizes or [None] * len(images)]
+        start = time.perf_counter()
+        nano = self.predict(self.model_nano, images, [imgsz[0] for imgsz in sizes])
+        self.observe_share('nano_inference', start, cameras)
+        if self.cascade is not None:
+            heavy_sizes = [imgsz[1] for imgsz in sizes]
+            return self.collect_results(nano, self.process_heavy(images, nano, cameras, regions, heavy_sizes))
+        # Тяжёлая модель проверяет только кадры, на которых сработала лёгкая
+        positive = [i for i, summary in enumerate(nano) if summary]
+        heavy = {}
+        if positive:
+            start = time.perf_counter()
+            heavy_results = self.predict(self.model_heavy, [images[i] for i in positive],
+                                         [sizes[i][1] for i in positive])
+            self.observe_share('heavy_inference', start, [cameras[i] for i in positive])
+            heavy = dict(zip(positive, heavy_results))
+            for i in positive:
+                metrics.inc('heavy_escalations', camera=cameras[i], result='run')
+        return self.collect_results(nano, heavy)
+
+    def collect_results(self, nano, heavy):
+        return [(summary_nano, heavy.get(i)) for i, summary_nano in enumerate(nano)]
+
+    def send_results(self, batch, results):
+        for (command, ip_suffix, request_id, *_), result in zip(batch, results):
+            result_queue = self.result_queues.get(ip_suffix)
+            if result_queue is None:
+                self.logger.error(f"No result queue for camera {ip_suffix}")
+                continue
+            result_queue.put((request_id, result))
+
+    def run(self):
+        self.initialize_logger()
+        metrics.configure(self.metrics_queue)
+        self.logger.info("Inference processor starting")
+        self.frame_reader = FrameRingReader()
+        try:
+            self.load_models()
+        except Exception as e:
+            self.logger.error(f"Error loading models: {e}")
+            self.running.value = False
+            return
+
+        while self.running.value:
+            for camera in self.frame_reader.prune():
+                self.logger.debug(f"Frame ring of camera {camera} released")
+            batch = self.collect_batch()
+            if not batch:
+                continue
+            batch = [request for request in batch if request[0] == 'detect']
+            frames = self.read_frames(batch)
+            valid = [i for i, frame in enumerate(frames) if frame is not None]
+            results = [(None, None)] * len(batch)
+            if valid:
+                try:
+                    metrics.set_gauge('inference_batch_size', len(valid))
+                    for i, result in zip(valid, self.process_batch([frames[i] for i in valid],
+                                                                   [batch[i][1] for i in valid],
+                                                                   [batch[i][4] for i in valid],
+                                                                   [batch[i][5] for i in valid])):
+                        results[i] = result
+                except Exception as e:
+                    self.logger.error(f"Error processing batch of {len(valid)}: {e}")
+            del frames
+            self.send_results(batch, results)
+
+        self.frame_reader.close()
+        metrics.flush(force=True)
+        self.logger.info("Inference processor stopped")
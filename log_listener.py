@@ -0,0 +1,194 @@
+from logging.handlers import QueueHandler, RotatingFileHandler
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import sys
+import time
+
+LOG_DIR = 'logs'
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Записи пишутся пачками: не больше BATCH_SIZE за раз, файлы сбрасываются на диск после пачки
+BATCH_SIZE = 500
+GET_TIMEOUT = 0.5
+# Одинаковые предупреждения и ошибки одного логгера: не больше STORM_LIMIT за STORM_WINDOW секунд,
+# остальные только считаются и попадают в лог одной строкой в конце окна
+STORM_LIMIT = 5
+STORM_WINDOW = 60
+# Числа в тексте (время, счётчики, номера запросов) не делают ошибку новой
+DIGITS = re.compile(r'\d+')
+
+
+# Помечает записи файлом и камерой, по ним процесс логов раскладывает записи по файлам
+class RecordTag(logging.Filter):
+    def __init__(self, log_file, camera=None):
+        super().__init__()
+        self.log_file = log_file
+        self.camera = camera
+
+    def filter(self, record):
+        record.log_file = self.log_file
+        record.camera = self.camera
+        return True
+
+
+def get_logger(name, log_file, log_queue=None, camera=None):
+    # С log_queue процесс только кладёт записи в очередь, формат и запись в файл - в LogListener.
+    # Без неё (replay, benchmarks, tools) пишет в файл сам, как раньше
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    if log_queue is not None:
+        handler = QueueHandler(log_queue)
+    else:
+        handler = RotatingFileHandler(os.path.join(LOG_DIR, log_file), maxBytes=LOG_MAX_BYTES,
+                                      backupCount=LOG_BACKUP_COUNT)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(RecordTag(log_file, camera))
+    logger.addHandler(handler)
+    return logger
+
+
+def parse_camera_levels(value):
+    # "57:DEBUG,58:WARNING" -> {'57': 10, '58': 30}
+    levels = {}
+    for item in (value or '').split(','):
+        if item.strip():
+            camera, _, level = item.strip().partition(':')
+            levels[camera.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'time': self.formatTime(record), 'level': record.levelname, 'logger': record.name,
+                 'message': record.getMessage()}
+        camera = getattr(record, 'camera', None)
+        if camera is not None:
+            entry['camera'] = camera
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Файловый обработчик без сброса на диск после каждой записи: сбрасывает LogListener после пачки
+class BatchedFileHandler(RotatingFileHandler):
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class StormFilter:
+    def __init__(self, limit=STORM_LIMIT, window=STORM_WINDOW):
+        self.limit = limit
+        self.window = window
+        self.storms = {}
+
+    def check(self, record, now):
+        if self.limit <= 0 or record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.levelno, DIGITS.sub('#', record.getMessage()))
+        storm = self.storms.get(key)
+        if storm is None:
+            storm = self.storms[key] = {'start': now, 'count': 0, 'suppressed': 0, 'record': record}
+        storm['count'] += 1
+        storm['record'] = record
+        if storm['count'] <= self.limit:
+            return True
+        storm['suppressed'] += 1
+        return False
+
+    def expire(self, now):
+        # Записи о подавленных повторах по закончившимся окнам
+        summaries = []
+        for key, storm in list(self.storms.items()):
+            if now - storm['start'] < self.window:
+                continue
+            del self.storms[key]
+            if storm['suppressed']:
+                summaries.append(logging.makeLogRecord(dict(
+                    storm['record'].__dict__,
+                    msg=f"{storm['record'].getMessage()} (repeated {storm['suppressed']} more times "
+                        f"in {now - storm['start']:.0f} s, suppressed)",
+                    args=None)))
+        return summaries
+
+
+# Единственный процесс, который пишет логи: остальные процессы только кладут записи в очередь
+# (get_logger с log_queue), поэтому запись на диск и ротация не задерживают детекцию и тревоги
+class LogListener(multiprocessing.Process):
+    def __init__(self, log_queue, log_dir=LOG_DIR, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 json_output=False, level=logging.DEBUG, camera_levels=None,
+                 storm_limit=STORM_LIMIT, storm_window=STORM_WINDOW):
+        super().__init__()
+        self.log_queue = log_queue
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.json_output = json_output
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        # Свой уровень для отдельных камер, например DEBUG только для настраиваемой камеры
+        self.camera_levels = camera_levels or {}
+        self.storm_limit = storm_limit
+        self.storm_window = storm_window
+        self.running = multiprocessing.Value('b', True)
+
+    def handler(self, log_file):
+        handler = self.handlers.get(log_file)
+        if handler is None:
+            handler = self.handlers[log_file] = BatchedFileHandler(
+                os.path.join(self.log_dir, log_file), maxBytes=self.max_bytes, backupCount=self.backup_count)
+            handler.setFormatter(self.formatter)
+        return handler
+
+    def accepts(self, record):
+        camera = getattr(record, 'camera', None)
+        return record.levelno >= self.camera_levels.get(str(camera), self.level)
+
+    def write(self, record):
+        try:
+            self.handler(getattr(record, 'log_file', None) or 'main.log').handle(record)
+        except Exception as e:
+            # Логировать некуда: ошибка самого процесса логов уходит в stderr
+            print(f"Error writing log record: {e!r}", file=sys.stderr)
+
+    def collect_batch(self):
+        batch = []
+        try:
+            batch.append(self.log_queue.get(timeout=GET_TIMEOUT))
+            while len(batch) < BATCH_SIZE:
+                batch.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def process_batch(self, batch):
+        now = time.monotonic()
+        for record in batch:
+            if self.accepts(record) and self.storm_filter.check(record, now):
+                self.write(record)
+        for record in self.storm_filter.expire(now):
+            self.write(record)
+        for handler in self.handlers.values():
+            handler.flush_batch()
+
+    def run(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.handlers = {}
+        self.formatter = JsonFormatter() if self.json_output else logging.Formatter(LOG_FORMAT)
+        self.storm_filter = StormFilter(self.storm_limit, self.storm_window)
+        while self.running.value:
+            self.process_batch(self.collect_batch())
+        # Дописываем то, что процессы успели положить в очередь до остановки
+        while True:
+            batch = self.collect_batch()
+            if not batch:
+                break
+            self.process_batch(batch)
+        self.storm_filter.window = 0
+        self.process_batch([])
+        for handler in self.handlers.values():
+            handler.close()
@@ -1,13 +1,24 @@
 import os
 from dotenv import load_dotenv
-import multiprocessing
-import time
-import logging
-from logging.handlers import RotatingFileHandler
 from datetime import datetime, timedelta
-from camera_processor import CameraProcessor
+from camera_processor import CameraProcessor, SNAPSHOT_TIMEOUT, ONVIF_TIMEOUT
 from telegram_processor import TelegramBotProcessor
-from alarm_processor import AlarmProcessor
+from alarm_processor import AlarmProcessor, ALARM_TIMEOUT, ALARM_RETRIES, DEDUP_WINDOW
+from inference_processor import (InferenceProcessor, BATCH_SIZE, MAX_WAIT, BACKEND,
+                                 NANO_MODEL_PATH, HEAVY_MODEL_PATH, CONF, MAX_DET)
+from cascade import CROP_PADDING, CONFIRM_TTL, REJECT_TTL, ESCALATION_RATE
+from frame_ring import start_resource_tracker, unlink_rings
+from scheduler import InferenceBudget, BOOST_DURATION
+from transport import create_queue, get_message, release_reader_lock, CameraQueues, TaggedQueue, SPARE_QUEUES
+from watchdog import CameraWatchdog, STALL_TIMEOUT, stop_process
+from camera_pool import CameraFetcher, CameraWorker, POOL_WORKERS
+from camera_config import CameraActions, ConfigWatcher, apply_camera_config, load_cameras, parse_cameras
+from metrics import MetricsProcessor, METRICS_HOST, METRICS_PORT
+from dvr_alarm_listener import DvrAlarmListener, LISTENER_HOST, LISTENER_PORT
+from log_listener import (LogListener, get_logger, parse_camera_levels, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+                          STORM_LIMIT, STORM_WINDOW)
+from sofia_talk import TALK_SCHEME
+import metrics
 
 
 # Ограничение на отправку сообщений
@@ -15,7 +26,9 @@ last_telegram_message_time = datetime.min
 MESSAGE_COOLDOWN = timedelta(minutes=10)
 valid_camera_params = ['ip', 'user', 'passw',
                        'command_queue', 'response_queue',
-                       'alarm_queue', 'alarm_url', 'area', 'port']
+                       'alarm_queue', 'alarm_url', 'area', 'port',
+                       'mode', 'stream_uri', 'snapshot_uri', 'motion_gate', 'schedule', 'zones',
+                       'imgsz', 'decode_scale']
 
 
 def load_configuration():
@@ -23,21 +36,95 @@ def load_configuration():
     load_dotenv()
 
     # Телеграм-бот настройки
-    global TELEGRAM_BOT_TOKEN, CHAT_ID, camera_ips
+    global TELEGRAM_BOT_TOKEN, CHAT_ID, camera_ips, CAMERA_CONFIG, CAMERA_SPARE_QUEUES
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
     CHAT_ID = os.getenv('CHAT_ID')
-    camera_ips = os.getenv('camera_ips')
-    camera_ips = eval(os.getenv('CAMERA_IPS'))
+    # Файл конфигурации камер (JSON или YAML) перечитывается на лету, CAMERA_IPS - только при запуске
+    CAMERA_CONFIG = os.getenv('CAMERA_CONFIG')
+    if CAMERA_CONFIG:
+        camera_ips = load_cameras(CAMERA_CONFIG)
+    else:
+        camera_ips = parse_cameras(os.getenv('CAMERA_IPS'))
+    # Сколько камер можно добавить в файл конфигурации без перезапуска
+    CAMERA_SPARE_QUEUES = int(os.getenv('CAMERA_SPARE_QUEUES', SPARE_QUEUES)) if CAMERA_CONFIG else 0
 
+    # Настройки общего процесса инференса
+    global INFERENCE_BATCH_SIZE, INFERENCE_MAX_WAIT
+    INFERENCE_BATCH_SIZE = int(os.getenv('INFERENCE_BATCH_SIZE', BATCH_SIZE))
+    INFERENCE_MAX_WAIT = float(os.getenv('INFERENCE_MAX_WAIT', MAX_WAIT))
+    # Порог уверенности и число объектов на кадр, подбираются через replay.py
+    global INFERENCE_CONF, INFERENCE_MAX_DET
+    INFERENCE_CONF = float(os.getenv('INFERENCE_CONF', CONF))
+    INFERENCE_MAX_DET = int(os.getenv('INFERENCE_MAX_DET', MAX_DET))
+    # Каскад nano -> heavy: области с отступом, кэш решений тяжёлой модели и лимит её запусков
+    global HEAVY_CASCADE
+    HEAVY_CASCADE = os.getenv('HEAVY_CASCADE', 'true').lower() in ('1', 'true', 'yes') and {
+        'padding': float(os.getenv('HEAVY_CROP_PADDING', CROP_PADDING)),
+        'confirm_ttl': float(os.getenv('HEAVY_CONFIRM_TTL', CONFIRM_TTL)),
+        'reject_ttl': float(os.getenv('HEAVY_REJECT_TTL', REJECT_TTL)),
+        'max_rate': float(os.getenv('HEAVY_ESCALATION_RATE', ESCALATION_RATE)),
+    }
+    # Пул: снимки всех камер получает один процесс, обрабатывают POOL_WORKERS процессов
+    global CAMERA_POOL, CAMERA_POOL_WORKERS
+    CAMERA_POOL = os.getenv('CAMERA_POOL', 'false').lower() in ('1', 'true', 'yes')
+    CAMERA_POOL_WORKERS = int(os.getenv('POOL_WORKERS', POOL_WORKERS))
+    # Общий лимит кадров в секунду на все камеры, 0 - без ограничения
+    global FRAME_BUDGET
+    FRAME_BUDGET = float(os.getenv('FRAME_BUDGET', 0))
+    # ultralytics (PyTorch), onnx или openvino; для ONNX указываются пути к .onnx моделям
+    global INFERENCE_BACKEND, NANO_MODEL, HEAVY_MODEL
+    INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', BACKEND)
+    NANO_MODEL = os.getenv('NANO_MODEL', NANO_MODEL_PATH)
+    HEAVY_MODEL = os.getenv('HEAVY_MODEL', HEAVY_MODEL_PATH)
 
-def initialize_main_logger():
-    logger = logging.getLogger('Main')
-    logger.setLevel(logging.DEBUG)
-    handler = RotatingFileHandler('logs/main.log', maxBytes=10240, backupCount=10)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-    return logger
+    # Настройки отправки тревог
+    global ALARM_REQUEST_TIMEOUT, ALARM_RETRY_COUNT, ALARM_DEDUP_WINDOW
+    ALARM_REQUEST_TIMEOUT = float(os.getenv('ALARM_TIMEOUT', ALARM_TIMEOUT))
+    ALARM_RETRY_COUNT = int(os.getenv('ALARM_RETRIES', ALARM_RETRIES))
+    ALARM_DEDUP_WINDOW = float(os.getenv('ALARM_DEDUP_WINDOW', DEDUP_WINDOW))
+
+    # Эндпоинт Prometheus /metrics
+    global METRICS_LISTEN_HOST, METRICS_LISTEN_PORT
+    METRICS_LISTEN_HOST = os.getenv('METRICS_HOST', METRICS_HOST)
+    METRICS_LISTEN_PORT = int(os.getenv('METRICS_PORT', METRICS_PORT))
+
+    # Приём тревог от камер XM/Sofia (сервер тревог в настройках камеры)
+    global DVR_ALARM_LISTENER, DVR_ALARM_HOST, DVR_ALARM_PORT, DVR_ALARM_BOOST
+    DVR_ALARM_LISTENER = os.getenv('DVR_ALARM_LISTENER', 'false').lower() in ('1', 'true', 'yes')
+    DVR_ALARM_HOST = os.getenv('DVR_ALARM_HOST', LISTENER_HOST)
+    DVR_ALARM_PORT = int(os.getenv('DVR_ALARM_PORT', LISTENER_PORT))
+    DVR_ALARM_BOOST = float(os.getenv('DVR_ALARM_BOOST', BOOST_DURATION))
+
+    # Таймауты запросов к камерам и перезапуск зависших процессов камер
+    global CAMERA_SNAPSHOT_TIMEOUT, CAMERA_ONVIF_TIMEOUT, CAMERA_STALL_TIMEOUT
+    CAMERA_SNAPSHOT_TIMEOUT = float(os.getenv('SNAPSHOT_TIMEOUT', SNAPSHOT_TIMEOUT))
+    CAMERA_ONVIF_TIMEOUT = float(os.getenv('ONVIF_TIMEOUT', ONVIF_TIMEOUT))
+    CAMERA_STALL_TIMEOUT = float(os.getenv('CAMERA_STALL_TIMEOUT', STALL_TIMEOUT))
+
+    # Процесс логов: уровень, свой уровень камер ("57:DEBUG,58:WARNING"), ротация, JSON, подавление повторов
+    global LOG_LEVEL, LOG_CAMERA_LEVELS, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUPS, LOG_JSON
+    global LOG_STORM_LIMIT, LOG_STORM_WINDOW
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
+    LOG_CAMERA_LEVELS = parse_camera_levels(os.getenv('LOG_CAMERAS'))
+    LOG_FILE_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', LOG_MAX_BYTES))
+    LOG_FILE_BACKUPS = int(os.getenv('LOG_BACKUP_COUNT', LOG_BACKUP_COUNT))
+    LOG_JSON = os.getenv('LOG_JSON', 'false').lower() in ('1', 'true', 'yes')
+    LOG_STORM_LIMIT = int(os.getenv('LOG_STORM_LIMIT', STORM_LIMIT))
+    LOG_STORM_WINDOW = float(os.getenv('LOG_STORM_WINDOW', STORM_WINDOW))
+
+
+def talk_alarm_urls(cameras):
+    # Сессии с камерами, которые играют звук (alarm_url sofia://), открываются заранее
+    urls = set()
+    for camera in cameras:
+        for alarm_url in [camera.get('alarm_url')] + [zone.get('alarm_url') for zone in camera.get('zones') or []]:
+            if alarm_url and alarm_url.startswith(TALK_SCHEME):
+                urls.add(alarm_url)
+    return sorted(urls)
+
+
+def initialize_main_logger(log_queue):
+    return get_logger('Main', 'main.log', log_queue)
 
 
 def clear_queue(queue):
@@ -49,85 +136,296 @@ def clear_queue(queue):
 
 
 def main():
-    logger = initialize_main_logger()
+    load_configuration()
+    # Все процессы только кладут записи логов в очередь, пишет их на диск один процесс
+    log_queue = create_queue()
+    log_process = LogListener(log_queue, max_bytes=LOG_FILE_MAX_BYTES, backup_count=LOG_FILE_BACKUPS,
+                              json_output=LOG_JSON, level=LOG_LEVEL, camera_levels=LOG_CAMERA_LEVELS,
+                              storm_limit=LOG_STORM_LIMIT, storm_window=LOG_STORM_WINDOW)
+    log_process.start()
+    logger = initialize_main_logger(log_queue)
     logger.info("Starting main function")
+    start_resource_tracker()
 
-    with multiprocessing.Manager() as manager:
-        command_queue = {}
-        response_queue = manager.Queue()
-        alarm_queue = manager.Queue()
-        load_configuration()
-        alarm_process = AlarmProcessor(alarm_queue, response_queue)
-        alarm_process.start()
-        logger.info("Alarm process started")
-
-        camera_processes = []
-
-        def initializing_camera(camera):
-            ip = camera['ip']
-            camera_ip = f'192.168.1.{ip}'
-            logger.info(f"Initializing camera {camera_ip}")
-            check_command_queue = command_queue.get(ip, None)
-            command_queue[ip] = check_command_queue if check_command_queue else manager.Queue()
-            camera_params = {k: v for k, v in camera.items() if
-                             k in valid_camera_params}
-            camera_process = CameraProcessor(command_queue=command_queue[ip],
-                                             response_queue=response_queue,
-                                             alarm_queue=alarm_queue,
-                                             **camera_params)
-            camera_process.start()
-            camera_processes.append(camera_process)
-            logger.info(f"Camera {camera_ip} started successfully")
-
-        def find_camera(ip_suffix):
-            for camera in camera_ips:
-                if camera['ip'] == ip_suffix:
-                    return camera
-            return None
+    # Метрики всех процессов собираются в одном процессе с HTTP эндпоинтом
+    metrics_queue = create_queue()
+    metrics_process = MetricsProcessor(metrics_queue, host=METRICS_LISTEN_HOST, port=METRICS_LISTEN_PORT,
+                                       log_queue=log_queue)
+    metrics_process.start()
+    metrics.configure(metrics_queue)
+    logger.info("Metrics process started")
+
+    # Очереди создаются заранее для всех камер из конфигурации, чтобы их унаследовали
+    # процессы бота и инференса, в том числе для камер, запущенных позже через /start_cam,
+    # и запасные - для камер, добавленных в файл конфигурации на лету
+    # Камеры в режиме stream всегда работают в своём процессе: декодер потока не делится
+    pooled_cameras = [camera for camera in camera_ips
+                      if CAMERA_POOL and camera.get('mode', 'snapshot') != 'stream']
+    worker_queues = [create_queue() for _ in range(min(CAMERA_POOL_WORKERS, len(pooled_cameras)))]
+    pool_queues = {camera['ip']: worker_queues[i % len(worker_queues)]
+                   for i, camera in enumerate(pooled_cameras)}
+    command_queue = CameraQueues({camera['ip']: TaggedQueue(pool_queues[camera['ip']], camera['ip'])
+                                  if camera['ip'] in pool_queues else create_queue()
+                                  for camera in camera_ips}, spare=CAMERA_SPARE_QUEUES)
+    response_queue = create_queue()
+    alarm_queue = create_queue()
+    alarm_process = AlarmProcessor(alarm_queue, response_queue, timeout=ALARM_REQUEST_TIMEOUT,
+                                   retries=ALARM_RETRY_COUNT, dedup_window=ALARM_DEDUP_WINDOW,
+                                   metrics_queue=metrics_queue, talk_urls=talk_alarm_urls(camera_ips),
+                                   log_queue=log_queue)
+    alarm_process.start()
+    logger.info("Alarm process started")
+
+    # Через очередь передаются только дескрипторы кадров, сами кадры лежат в разделяемой памяти
+    inference_queue = create_queue()
+    result_queues = CameraQueues({camera['ip']: create_queue() for camera in camera_ips},
+                                 spare=CAMERA_SPARE_QUEUES)
+    inference_process = InferenceProcessor(inference_queue, result_queues,
+                                           batch_size=INFERENCE_BATCH_SIZE,
+                                           max_wait=INFERENCE_MAX_WAIT,
+                                           backend=INFERENCE_BACKEND,
+                                           nano_model_path=NANO_MODEL,
+                                           heavy_model_path=HEAVY_MODEL,
+                                           metrics_queue=metrics_queue,
+                                           conf=INFERENCE_CONF,
+                                           max_det=INFERENCE_MAX_DET,
+                                           cascade=HEAVY_CASCADE,
+                                           log_queue=log_queue)
+    inference_process.start()
+    logger.info("Inference process started")
+
+    camera_processes = []
+    budget = InferenceBudget(FRAME_BUDGET)
 
+    def create_camera(camera):
+        camera_params = {k: v for k, v in camera.items() if
+                         k in valid_camera_params}
+        return CameraProcessor(command_queue=command_queue[camera['ip']],
+                               response_queue=response_queue,
+                               alarm_queue=alarm_queue,
+                               inference_queue=inference_queue,
+                               result_queue=result_queues[camera['ip']],
+                               metrics_queue=metrics_queue,
+                               log_queue=log_queue,
+                               budget=budget,
+                               snapshot_timeout=CAMERA_SNAPSHOT_TIMEOUT,
+                               onvif_timeout=CAMERA_ONVIF_TIMEOUT,
+                               **camera_params)
+
+    # Объекты камер пула создаются заранее и передаются обработчикам при запуске
+    pool_processes = []
+    if pooled_cameras:
+        control_queue = create_queue()
+        fetch_params = ['ip', 'user', 'passw', 'port']
+        fetcher_process = CameraFetcher({camera['ip']: {k: v for k, v in camera.items() if k in fetch_params}
+                                         for camera in pooled_cameras},
+                                        control_queue,
+                                        pool_queues,
+                                        metrics_queue=metrics_queue,
+                                        log_queue=log_queue)
+        for index, worker_queue in enumerate(worker_queues):
+            cameras = {}
+            for camera in pooled_cameras:
+                if pool_queues[camera['ip']] is worker_queue:
+                    cameras[camera['ip']] = create_camera(camera)
+                    cameras[camera['ip']].pooled = True
+            pool_processes.append(CameraWorker(index, cameras, worker_queue, control_queue,
+                                               metrics_queue=metrics_queue, log_queue=log_queue))
+        pool_processes.append(fetcher_process)
+        for process in pool_processes:
+            process.start()
+        logger.info(f"Camera pool started: {len(pooled_cameras)} cameras, {len(worker_queues)} workers")
+
+    def initializing_camera(camera):
+        ip = camera['ip']
+        camera_ip = f'192.168.1.{ip}'
+        logger.info(f"Initializing camera {camera_ip}")
+        if ip in pool_queues:
+            pool_queues[ip].put(('start', ip))
+            pool_started.add(ip)
+            logger.info(f"Camera {camera_ip} started in pool")
+            return
+        camera_process = create_camera(camera)
+        camera_process.start()
+        # Завершившиеся процессы этой камеры больше не нужны CameraWatchdog
+        camera_processes[:] = [process for process in camera_processes
+                               if process.ip_suffix != ip or process.is_alive()]
+        camera_processes.append(camera_process)
+        logger.info(f"Camera {camera_ip} started successfully")
+
+    def find_camera(ip_suffix):
         for camera in camera_ips:
-            if camera['track']:
-                initializing_camera(camera)
-        main_queue = manager.Queue()
-        command_queue['main'] = main_queue
-        telegram_bot_process = TelegramBotProcessor(TELEGRAM_BOT_TOKEN,
-                                                    CHAT_ID, command_queue,
-                                                    response_queue)
-        telegram_bot_process.start()
-        logger.info("Telegram bot process started")
+            if camera['ip'] == ip_suffix:
+                return camera
+        return None
 
-        try:
-            while telegram_bot_process.running.value:
-                if not main_queue.empty():
-                    response = main_queue.get()
-                    if isinstance(response, tuple) and len(response) == 2:
-                        command, data = response
-                        if command == 'start_camera':
-                            camera = find_camera(data)
-                            if camera:
-                                initializing_camera(camera)
-                                logger.info(
-                                    f"Camera process {data} started")
-                    else:
-                        logger.error(
-                            f"Error start_camera. Can not parse response: {command_queue}")
-                time.sleep(1)
-        except KeyboardInterrupt:
-            logger.info("KeyboardInterrupt received, shutting down")
-        finally:
-            for process in camera_processes:
-                process.running.value = False
-                process.join()
-                logger.info(f"Camera process {process.ip} joined")
-            telegram_bot_process.running.value = False
-            telegram_bot_process.join()
-            logger.info("Telegram bot process joined")
-
-            alarm_process.running.value = False
-            alarm_process.join()
-            logger.info("Alarm process joined")
+    pool_started = set()
+
+    def restart_camera(process):
+        # Очереди камеры те же: снимается блокировка чтения, которую мог оставить убитый процесс,
+        # и отбрасываются ответы инференса на его запросы
+        ip = process.ip_suffix
+        # Остановленный принудительно процесс не удалил свои кольца кадров
+        unlink_rings(ip, process.pid)
+        camera = find_camera(ip)
+        if camera is None:
+            # Камера убрана из конфигурации: CameraWatchdog уберёт её процесс из списка
+            return None
+        release_reader_lock(command_queue[ip])
+        release_reader_lock(result_queues[ip])
+        clear_queue(result_queues[ip])
+        camera_process = create_camera(camera)
+        camera_process.start()
+        return camera_process
+
+    def camera_running(ip):
+        if ip in pool_queues:
+            return ip in pool_started
+        return any(process.ip_suffix == ip and process.is_alive() for process in camera_processes)
+
+    def stop_camera(ip):
+        if not camera_running(ip):
+            return
+        command_queue[ip].put('stop_camera')
+        pool_started.discard(ip)
+        if ip in pool_queues:
+            logger.info(f"Camera {ip} stopped by config")
+            return
+        # Процесс камеры дожидаемся, чтобы новый процесс не делил с ним очередь результатов.
+        # Зависший процесс главный цикл ждёт не дольше STOP_TIMEOUT, затем он завершается принудительно
+        for process in camera_processes:
+            if process.ip_suffix == ip and process.is_alive():
+                stop_process(process)
+                unlink_rings(ip, process.pid)
+        release_reader_lock(command_queue[ip])
+        release_reader_lock(result_queues[ip])
+        clear_queue(result_queues[ip])
+        logger.info(f"Camera {ip} stopped by config")
+
+    def add_camera_queues(ip):
+        # Камера, убранная из конфигурации и добавленная снова, работает на своих прежних очередях.
+        # Новая камера получает запасные: их уже видят процессы бота, инференса и тревог DVR
+        if ip in command_queue:
+            return True
+        queues = [command_queue.assign(ip)]
+        if queues[0] is None:
+            return False
+        queues.append(result_queues.assign(ip))
+        # В запасной очереди могли остаться сообщения и блокировка прежней камеры
+        for queue in queues:
+            release_reader_lock(queue)
+            clear_queue(queue)
+        return True
+
+    def remove_camera(ip):
+        stop_camera(ip)
+        command_queue.release(ip)
+        result_queues.release(ip)
+
+    camera_actions = CameraActions(add=add_camera_queues, remove=remove_camera, start=initializing_camera,
+                                   stop=stop_camera, running=camera_running,
+                                   update=lambda ip, params: command_queue[ip].put(('update_config', params)),
+                                   pooled=lambda ip: ip in pool_queues)
+
+    def reload_camera_config(new_cameras):
+        global camera_ips
+        camera_ips = apply_camera_config(camera_ips, new_cameras, camera_actions, logger)
+
+    for camera in camera_ips:
+        if camera['track']:
+            initializing_camera(camera)
+    main_queue = create_queue()
+    command_queue['main'] = main_queue
+    telegram_bot_process = TelegramBotProcessor(TELEGRAM_BOT_TOKEN,
+                                                CHAT_ID, command_queue,
+                                                response_queue,
+                                                metrics_queue=metrics_queue,
+                                                log_queue=log_queue)
+    telegram_bot_process.start()
+    logger.info("Telegram bot process started")
+
+    dvr_alarm_process = None
+    if DVR_ALARM_LISTENER:
+        dvr_alarm_process = DvrAlarmListener(command_queue, host=DVR_ALARM_HOST, port=DVR_ALARM_PORT,
+                                             boost_duration=DVR_ALARM_BOOST, metrics_queue=metrics_queue,
+                                             log_queue=log_queue)
+        dvr_alarm_process.start()
+        logger.info("DVR alarm listener started")
+
+    config_watcher = ConfigWatcher(CAMERA_CONFIG) if CAMERA_CONFIG else None
+    watchdog = CameraWatchdog(logger, restart_camera, stall_timeout=CAMERA_STALL_TIMEOUT)
+    try:
+        while telegram_bot_process.running.value:
+            try:
+                watchdog.check(camera_processes)
+            except Exception as e:
+                logger.error(f"Error in camera watchdog: {e}")
+            if config_watcher:
+                try:
+                    new_cameras = config_watcher.poll()
+                    if new_cameras is not None:
+                        reload_camera_config(new_cameras)
+                except Exception as e:
+                    logger.error(f"Error reloading camera config {CAMERA_CONFIG}: {e}")
+            metrics.set_gauge('queue_depth', metrics.queue_size(inference_queue), queue='inference')
+            metrics.set_gauge('queue_depth', metrics.queue_size(alarm_queue), queue='alarm')
+            metrics.set_gauge('queue_depth', metrics.queue_size(response_queue), queue='response')
+            response = get_message(main_queue)
+            if response is None:
+                continue
+            if isinstance(response, tuple) and len(response) == 2:
+                command, data = response
+                if command == 'start_camera':
+                    camera = find_camera(data)
+                    if camera:
+                        initializing_camera(camera)
+                        logger.info(
+                            f"Camera process {data} started")
+            else:
+                logger.error(
+                    f"Error start_camera. Can not parse response: {response}")
+    except KeyboardInterrupt:
+        logger.info("KeyboardInterrupt received, shutting down")
+    finally:
+        if dvr_alarm_process:
+            dvr_alarm_process.running.value = False
+            dvr_alarm_process.join()
+            logger.info("DVR alarm listener joined")
+        for process in camera_processes:
+            process.running.value = False
+        # Сначала останавливается получение снимков, пока обработчики пула ещё читают свои очереди
+        for process in reversed(pool_processes):
+            process.running.value = False
+            process.join()
+            logger.info(f"Pool process {process.name} joined")
+        telegram_bot_process.running.value = False
+        inference_process.running.value = False
+        alarm_process.running.value = False
+        # Процесс не завершится, пока его данные не вычитаны из очереди
+        clear_queue(response_queue)
+        clear_queue(alarm_queue)
+
+        for process in camera_processes:
+            process.join()
+            logger.info(f"Camera process {process.ip} joined")
+        telegram_bot_process.join()
+        logger.info("Telegram bot process joined")
+
+        inference_process.join()
+        logger.info("Inference process joined")
+
+        alarm_process.join()
+        logger.info("Alarm process joined")
+
+        # Останавливается последним, пока остальные процессы дописывают метрики
+        metrics_process.running.value = False
+        metrics_process.join()
+        logger.info("Metrics process joined")
 
     logger.info("Main function finished")
+    # Последним, чтобы записать сообщения всех остановленных процессов
+    log_process.running.value = False
+    log_process.join()
 
 
 if __name__ == '__main__':
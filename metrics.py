@@ -0,0 +1,217 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import multiprocessing
+import os
+import threading
+import time
+from transport import get_message
+from log_listener import get_logger
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+FLUSH_INTERVAL = 5
+PREFIX = 'dvr_'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# Локальные метрики процесса. Значения копятся в памяти и раз в FLUSH_INTERVAL
+# отправляются приращениями в очередь MetricsProcessor. Пока очередь не задана
+# (configure не вызван), запись метрик ничего не делает.
+class MetricsRegistry:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # В дочернем процессе после fork: значения родителя (в том числе его gauge) не отправляются
+        # от имени потомка, очередь задаёт configure. Блокировку мог держать другой поток родителя
+        self.queue = None
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.samples = None
+        self.last_flush = time.monotonic()
+
+    def configure(self, metrics_queue):
+        self.queue = metrics_queue
+
+    def keep_samples(self):
+        # Сырые значения гистограмм для перцентилей в отчёте replay, в рабочем режиме не копятся
+        self.samples = {}
+        return self.samples
+
+    def inc(self, name, value=1, **labels):
+        if self.queue is None:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.flush()
+
+    def observe(self, name, seconds, **labels):
+        if self.queue is None:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Счётчики по корзинам, затем сумма и количество
+                histogram = self.histograms[key] = [0] * (len(BUCKETS) + 3)
+            histogram[bisect_left(BUCKETS, seconds)] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            if self.samples is not None:
+                self.samples.setdefault(key, []).append(seconds)
+        self.flush()
+
+    def set_gauge(self, name, value, **labels):
+        if self.queue is None:
+            return
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+        self.flush()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def flush(self, force=False):
+        if self.queue is None or (not force and time.monotonic() - self.last_flush < FLUSH_INTERVAL):
+            return
+        with self.lock:
+            counters, histograms, gauges = self.counters, self.histograms, dict(self.gauges)
+            self.counters, self.histograms = {}, {}
+            self.last_flush = time.monotonic()
+        try:
+            self.queue.put(('metrics', counters, histograms, gauges))
+        except Exception:
+            pass
+
+
+_registry = MetricsRegistry()
+configure = _registry.configure
+keep_samples = _registry.keep_samples
+inc = _registry.inc
+observe = _registry.observe
+set_gauge = _registry.set_gauge
+timer = _registry.timer
+flush = _registry.flush
+os.register_at_fork(after_in_child=_registry.reset)
+
+
+def queue_size(message_queue):
+    try:
+        return message_queue.qsize()
+    except NotImplementedError:
+        # На macOS qsize не поддерживается
+        return None
+
+
+def format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+# Собирает метрики всех процессов и отдаёт их в текстовом формате Prometheus на /metrics
+class MetricsProcessor(multiprocessing.Process):
+    def __init__(self, metrics_queue, host=METRICS_HOST, port=METRICS_PORT, log_queue=None):
+        super().__init__()
+        self.metrics_queue = metrics_queue
+        self.log_queue = log_queue
+        self.host = host
+        self.port = port
+        self.running = multiprocessing.Value('b', True)
+
+    def initialize_logger(self):
+        self.logger = get_logger('MetricsProcessor', 'metrics.log', self.log_queue)
+
+    def merge(self, counters, histograms, gauges):
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, values in histograms.items():
+                total = self.histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+            self.gauges.update(gauges)
+
+    def render(self):
+        lines = []
+        # Строка # TYPE - одна на семейство, перед его первым значением
+        families = set()
+
+        def family(name, kind):
+            if name not in families:
+                families.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                family(f'{PREFIX}{name}_total', 'counter')
+                lines.append(f'{PREFIX}{name}_total{format_labels(labels)} {value}')
+            for (name, labels), value in sorted(self.gauges.items()):
+                if value is not None:
+                    family(f'{PREFIX}{name}', 'gauge')
+                    lines.append(f'{PREFIX}{name}{format_labels(labels)} {value}')
+            for (name, labels), values in sorted(self.histograms.items()):
+                family(f'{PREFIX}{name}_seconds', 'histogram')
+                cumulative = 0
+                for bucket, count in zip(BUCKETS + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(f'{PREFIX}{name}_seconds_bucket{format_labels(labels, (("le", bucket),))} {cumulative}')
+                lines.append(f'{PREFIX}{name}_seconds_sum{format_labels(labels)} {values[-2]:.6f}')
+                lines.append(f'{PREFIX}{name}_seconds_count{format_labels(labels)} {values[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def start_http_server(self):
+        processor = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = processor.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def run(self):
+        self.initialize_logger()
+        self.lock = threading.Lock()
+        self.counters, self.histograms, self.gauges = {}, {}, {}
+        try:
+            server = self.start_http_server()
+            self.logger.info(f"Metrics endpoint http://{self.host}:{self.port}/metrics started")
+        except Exception as e:
+            self.logger.error(f"Error starting metrics endpoint: {e}")
+            server = None
+        while self.running.value:
+            message = get_message(self.metrics_queue)
+            if message is None:
+                continue
+            try:
+                command, counters, histograms, gauges = message
+                if command == 'metrics':
+                    self.merge(counters, histograms, gauges)
+            except Exception as e:
+                self.logger.error(f"Error merging metrics: {e}")
+        if server:
+            server.shutdown()
+        self.logger.info("Metrics processor stopped")
@@ -0,0 +1,61 @@
+import time
+import cv2
+import numpy as np
+
+GATE_WIDTH = 160
+PIXEL_THRESHOLD = 25
+CHANGED_RATIO = 0.005
+BACKGROUND_ALPHA = 0.05
+FORCE_INTERVAL = 60
+
+
+# Дешёвый фильтр перед лёгкой моделью: сравнивает уменьшенную серую ROI
+# с фоном (скользящее среднее) и пропускает кадр в YOLO, только если
+# изменилась заметная доля пикселей. Раз в force_interval кадр пропускается
+# принудительно, чтобы не пропустить неподвижный объект, ушедший в фон.
+class MotionGate:
+    def __init__(self, width=GATE_WIDTH, pixel_threshold=PIXEL_THRESHOLD,
+                 changed_ratio=CHANGED_RATIO, background_alpha=BACKGROUND_ALPHA,
+                 force_interval=FORCE_INTERVAL):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.changed_ratio = changed_ratio
+        self.background_alpha = background_alpha
+        self.force_interval = force_interval
+        self.background = None
+        self.last_pass = 0
+        self.hits = 0
+        self.misses = 0
+        self.forced = 0
+
+    def prepare(self, image):
+        height, width = image.shape[:2]
+        scale = min(1.0, self.width / width)
+        small = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0).astype(np.float32)
+
+    def check(self, image):
+        now = time.monotonic()
+        small = self.prepare(image)
+        if self.background is None or self.background.shape != small.shape:
+            self.background = small
+            self.hits += 1
+            self.last_pass = now
+            return True
+        changed = np.count_nonzero(cv2.absdiff(small, self.background) > self.pixel_threshold)
+        cv2.accumulateWeighted(small, self.background, self.background_alpha)
+        if changed >= self.changed_ratio * small.size:
+            self.hits += 1
+            self.last_pass = now
+            return True
+        if now - self.last_pass >= self.force_interval:
+            self.forced += 1
+            self.last_pass = now
+            return True
+        self.misses += 1
+        return False
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'forced': self.forced}
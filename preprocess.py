@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+
+DEFAULT_IMGSZ = 640
+# Размер входа YOLO кратен шагу сети
+STRIDE = 32
+PAD_VALUE = 114
+# Декодирование JPEG сразу в уменьшенном виде (масштабирование DCT в libjpeg)
+DECODE_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4}
+
+
+def round_imgsz(imgsz):
+    return max(STRIDE, int(np.ceil(int(imgsz) / STRIDE)) * STRIDE)
+
+
+def parse_imgsz(imgsz):
+    # Размер инференса камеры: число - для обеих моделей, {"nano": 320, "heavy": 640} - по моделям,
+    # None - размер модели по умолчанию. Возвращает (nano, heavy)
+    if isinstance(imgsz, dict):
+        nano, heavy = imgsz.get('nano'), imgsz.get('heavy')
+    else:
+        nano = heavy = imgsz
+    return (round_imgsz(nano) if nano else None, round_imgsz(heavy) if heavy else None)
+
+
+def decode_scale(roi_sizes, imgsz):
+    # Наибольшее уменьшение при декодировании, при котором длинная сторона каждой зоны
+    # остаётся не меньше размера инференса: модель всё равно уменьшила бы зону до imgsz
+    for scale in (4, 2):
+        if all(max(width, height) / scale >= imgsz for width, height in roi_sizes):
+            return scale
+    return 1
+
+
+def decode_jpeg(data, scale=1):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), DECODE_FLAGS[scale])
+
+
+def letterbox_geometry(shape, imgsz):
+    height, width = shape[:2]
+    target_h, target_w = imgsz
+    scale = min(target_h / height, target_w / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    return scale, (target_w - new_w) // 2, (target_h - new_h) // 2, new_w, new_h
+
+
+# Подготовка пакета для модели в заранее выделенных буферах: уменьшение с сохранением пропорций
+# сразу в холст, затем BGR -> RGB, HWC -> CHW и нормализация одним проходом в тензор пакета.
+# Буферы выделяются заново только для большего пакета или другого размера входа.
+class Preprocessor:
+    def __init__(self):
+        self.canvas = None
+        self.tensor = None
+
+    def buffers(self, count, imgsz):
+        target_h, target_w = imgsz
+        if self.canvas is None or self.canvas.shape[:2] != (target_h, target_w):
+            self.canvas = np.empty((target_h, target_w, 3), dtype=np.uint8)
+            self.tensor = None
+        if self.tensor is None or self.tensor.shape[0] < count:
+            self.tensor = np.empty((count, 3, target_h, target_w), dtype=np.float32)
+        return self.canvas, self.tensor
+
+    def letterbox(self, image, canvas):
+        scale, pad_x, pad_y, new_w, new_h = letterbox_geometry(image.shape, canvas.shape[:2])
+        # Заполняются только поля, изображение пишется поверх холста без промежуточной копии
+        canvas[:pad_y] = PAD_VALUE
+        canvas[pad_y + new_h:] = PAD_VALUE
+        canvas[pad_y:pad_y + new_h, :pad_x] = PAD_VALUE
+        canvas[pad_y:pad_y + new_h, pad_x + new_w:] = PAD_VALUE
+        cv2.resize(image, (new_w, new_h), dst=canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w],
+                   interpolation=cv2.INTER_LINEAR)
+        return scale, pad_x, pad_y
+
+    def run(self, images, imgsz):
+        # Возвращает тензор (N, 3, H, W) float32 - представление буфера, действительное до следующего
+        # вызова, и (scale, pad_x, pad_y) каждого изображения для пересчёта рамок
+        canvas, tensor = self.buffers(len(images), imgsz)
+        transforms = []
+        for i, image in enumerate(images):
+            transforms.append(self.letterbox(image, canvas))
+            np.multiply(canvas[:, :, ::-1].transpose(2, 0, 1), np.float32(1 / 255), out=tensor[i],
+                        dtype=np.float32)
+        return tensor[:len(images)], transforms
@@ -0,0 +1,360 @@
+import argparse
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from camera_config import load_cameras
+from camera_processor import CameraProcessor
+from inference_processor import InferenceProcessor, BACKEND, NANO_MODEL_PATH, HEAVY_MODEL_PATH, CONF, MAX_DET
+import metrics
+
+OUTPUT_DIR = 'replay'
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+# Частота кадров папки без index.json
+SOURCE_FPS = 1
+# В режиме real паузы в источнике длиннее этой (ночь между снимками кольца) пропускаются
+MAX_GAP = 10
+PERCENTILES = (50, 90, 99)
+STAGES = ('snapshot_fetch', 'jpeg_decode', 'roi_crop', 'nano_inference', 'heavy_inference',
+          'image_save', 'frame_cycle')
+CAMERA_PARAMS = ('alarm_url', 'area', 'zones', 'motion_gate', 'schedule', 'imgsz', 'decode_scale')
+
+
+# Локальная замена очередей тревог, уведомлений Telegram и метрик
+class Sink:
+    def __init__(self):
+        self.items = []
+
+    def put(self, item):
+        self.items.append(item)
+
+
+# Вместо InferenceClient: тот же process_batch, что в процессе инференса, но вызывается
+# прямо в процессе replay, без очередей. Считает кадры, ушедшие в лёгкую и тяжёлую модель.
+class LocalInference:
+    def __init__(self, processor, ip_suffix, stats, lock, imgsz=(None, None)):
+        self.processor = processor
+        self.ip_suffix = ip_suffix
+        self.stats = stats
+        self.lock = lock
+        self.imgsz = imgsz
+
+    def detect_batch(self, images, regions=None):
+        with self.lock:
+            results = self.processor.process_batch(images, [self.ip_suffix] * len(images), regions,
+                                                   [self.imgsz] * len(images))
+        self.stats['checked'] += len(results)
+        self.stats['nano'] += sum(1 for result in results if result[0])
+        self.stats['heavy'] += sum(1 for result in results if result[1])
+        return results
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+    def close(self):
+        pass
+
+
+def folder_frames(path, camera, fps=SOURCE_FPS):
+    index_path = os.path.join(path, 'index.json')
+    if os.path.exists(index_path):
+        # Кольцо снимков камеры (video/camera_*): исходные кадры row_nano по времени записи,
+        # размеченные снимки nano/heavy и копии row_heavy пропускаются
+        with open(index_path) as index_file:
+            slots = json.load(index_file)['slots'].values()
+        entries = sorted((entry for entry in slots if entry['label'] == 'row_nano'), key=lambda e: e['time'])
+        files = [(entry['time'] - entries[0]['time'], os.path.join(path, entry['file'])) for entry in entries]
+    else:
+        paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(path, pattern)))
+        files = [(i / fps, file_path) for i, file_path in enumerate(paths)]
+    for timestamp, file_path in files:
+        try:
+            with metrics.timer('snapshot_fetch', camera=camera):
+                with open(file_path, 'rb') as image_file:
+                    data = image_file.read()
+        except FileNotFoundError:
+            continue
+        yield timestamp, data, None
+
+
+def video_frames(path, camera):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Can not open video {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or SOURCE_FPS
+    try:
+        for index in itertools.count():
+            with metrics.timer('snapshot_fetch', camera=camera):
+                ok, frame = capture.read()
+            if not ok:
+                break
+            yield index / fps, None, frame
+    finally:
+        capture.release()
+
+
+def open_source(path, camera, fps=SOURCE_FPS):
+    return folder_frames(path, camera, fps) if os.path.isdir(path) else video_frames(path, camera)
+
+
+def reuse_logger(obj, name):
+    # Обработчик лога добавляется один раз за запуск, а не на каждую конфигурацию
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        obj.logger = logger
+    else:
+        obj.initialize_logger()
+
+
+def replay_camera(camera, source, speed, limit=None):
+    start = time.monotonic()
+    pending = next(source, None)
+    count = 0
+    while pending is not None and (not limit or count < limit):
+        cycle_start = time.monotonic()
+        if speed == 'real':
+            # Как живая камера: берётся последний кадр к текущему моменту, пропущенные не обрабатываются
+            wait = pending[0] - (cycle_start - start)
+            if wait > MAX_GAP:
+                start -= wait
+                continue
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            elapsed = cycle_start - start
+            frame, pending = pending, next(source, None)
+            while pending is not None and pending[0] <= elapsed:
+                frame, pending = pending, next(source, None)
+        else:
+            frame, pending = pending, next(source, None)
+        _, data, image = frame
+        with metrics.timer('frame_cycle', camera=camera.ip_suffix):
+            if image is None:
+                image = camera.decode_snapshot(data)
+            if image is not None:
+                camera.process_frame(image, data)
+        count += 1
+        if speed == 'real':
+            camera.wait_next_frame(cycle_start)
+    return count
+
+
+def camera_motion_gate(camera_config, gate):
+    if gate == 'off':
+        return False
+    configured = camera_config.get('motion_gate', True)
+    if gate == 'on':
+        return configured if isinstance(configured, dict) else True
+    return configured
+
+
+def percentiles(samples):
+    values = np.array(samples) * 1000
+    stats = {f'p{p}': round(float(np.percentile(values, p)), 2) for p in PERCENTILES}
+    stats['max'] = round(float(values.max()), 2)
+    stats['count'] = len(samples)
+    return stats
+
+
+def build_report(config, cameras, stats, frames, seconds, samples, counters, alarm_sink, response_sink):
+    stages = {}
+    for (name, _), values in samples.items():
+        stages.setdefault(name, []).extend(values)
+    gate = {result: sum(value for (name, labels), value in counters.items()
+                        if name == 'motion_gate' and dict(labels)['result'] == result)
+            for result in ('pass', 'skip')}
+    suppressed = sum(value for (name, labels), value in counters.items()
+                     if name == 'alarms' and dict(labels).get('result') == 'suppressed')
+    dropped = sum(value for (name, _), value in counters.items() if name == 'images_dropped')
+    escalations = {result: sum(value for (name, labels), value in counters.items()
+                               if name == 'heavy_escalations' and dict(labels)['result'] == result)
+                   for result in ('run', 'cached', 'throttled')}
+    alarms = [item for item in alarm_sink.items if item[0] == 'alarm']
+    checked = sum(camera_stats['checked'] for camera_stats in stats.values())
+    nano = sum(camera_stats['nano'] for camera_stats in stats.values())
+    heavy = sum(camera_stats['heavy'] for camera_stats in stats.values())
+    return {
+        'config': config,
+        'frames': frames,
+        'seconds': round(seconds, 3),
+        'fps': round(frames / seconds, 2) if seconds else 0,
+        'stages': {name: percentiles(stages[name]) for name in STAGES if stages.get(name)},
+        'checked': checked,
+        'nano_hits': nano,
+        'heavy_hits': heavy,
+        'escalation_rate': round(nano / checked, 4) if checked else 0,
+        'confirmation_rate': round(heavy / nano, 4) if nano else 0,
+        'heavy_runs': escalations['run'],
+        'heavy_cached': escalations['cached'],
+        'heavy_throttled': escalations['throttled'],
+        'gate_skip_rate': round(gate['skip'] / (gate['pass'] + gate['skip']), 4) if gate['skip'] else 0,
+        'alarms': len(alarms),
+        'alarms_suppressed': suppressed,
+        'notifications': sum(1 for item in response_sink.items if item[0] == 'notification'),
+        'images_dropped': dropped,
+        'cameras': {ip: dict(stats[ip], alarms=sum(1 for item in alarms if str(item[2]) == ip))
+                    for ip in cameras},
+    }
+
+
+def run_config(index, config, sources, camera_configs, args):
+    processor = InferenceProcessor(None, {}, backend=config['backend'], nano_model_path=config['nano'],
+                                   heavy_model_path=config['heavy'], conf=config['conf'],
+                                   max_det=config['max_det'], cascade=config['cascade'] == 'on')
+    reuse_logger(processor, 'InferenceProcessor')
+    processor.load_models()
+    samples = metrics.keep_samples()
+    metrics_sink, alarm_sink, response_sink = Sink(), Sink(), Sink()
+    lock = threading.Lock()
+    cameras = {}
+    stats = {}
+    for ip in sources:
+        camera_config = camera_configs.get(ip, {})
+        params = {key: camera_config[key] for key in CAMERA_PARAMS if key in camera_config}
+        params['motion_gate'] = camera_motion_gate(camera_config, config['gate'])
+        if config['imgsz'] != 'config':
+            params['imgsz'] = parse_imgsz_option(config['imgsz'])
+        params.setdefault('alarm_url', None)
+        params.setdefault('area', None)
+        camera = CameraProcessor(ip, '', '', None, response_sink, alarm_sink,
+                                 None, None, metrics_queue=metrics_sink, **params)
+        stats[ip] = {'frames': 0, 'checked': 0, 'nano': 0, 'heavy': 0}
+        camera.inference = LocalInference(processor, camera.ip_suffix, stats[ip], lock, camera.imgsz)
+        # Снимки каждой конфигурации пишутся в свою папку
+        camera.save_dir = os.path.join('video', str(index), f'camera_{ip}')
+        reuse_logger(camera, f'CameraProcessor-{camera.ip}')
+        camera.start_pipeline()
+        cameras[ip] = camera
+
+    def replay(ip):
+        source = open_source(sources[ip], cameras[ip].ip_suffix, args.fps)
+        stats[ip]['frames'] = replay_camera(cameras[ip], source, args.speed, args.limit)
+
+    start = time.perf_counter()
+    if args.speed == 'real':
+        threads = [threading.Thread(target=replay, args=(ip,)) for ip in cameras]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        for ip in cameras:
+            replay(ip)
+    seconds = time.perf_counter() - start
+    for camera in cameras.values():
+        camera.stop_pipeline()
+
+    counters = {}
+    for _, flushed, _, _ in metrics_sink.items:
+        for key, value in flushed.items():
+            counters[key] = counters.get(key, 0) + value
+    frames = sum(camera_stats['frames'] for camera_stats in stats.values())
+    return build_report(config, cameras, stats, frames, seconds, samples, counters, alarm_sink, response_sink)
+
+
+def print_report(report):
+    config = report['config']
+    print(f"\nconfig {config['name']}: backend {config['backend']}, conf {config['conf']}, "
+          f"max_det {config['max_det']}, motion gate {config['gate']}, heavy cascade {config['cascade']}, "
+          f"imgsz {config['imgsz']}")
+    print(f"  frames {report['frames']} in {report['seconds']:.1f} s, {report['fps']:.2f} fps")
+    print(f"  zones checked {report['checked']}, nano hits {report['nano_hits']} "
+          f"({report['escalation_rate'] * 100:.1f}% escalated to heavy), heavy confirmed {report['heavy_hits']} "
+          f"({report['confirmation_rate'] * 100:.1f}% of nano hits)")
+    print(f"  heavy model runs {report['heavy_runs']}, answered from cache {report['heavy_cached']}, "
+          f"throttled {report['heavy_throttled']}")
+    print(f"  motion gate skipped {report['gate_skip_rate'] * 100:.1f}%")
+    print(f"  alarms {report['alarms']} (suppressed {report['alarms_suppressed']}), "
+          f"notifications {report['notifications']}, images dropped {report['images_dropped']}")
+    print(f"  {'stage':<16}{'count':>8}" + ''.join(f"{f'p{p} ms':>10}" for p in PERCENTILES) + f"{'max ms':>10}")
+    for name, stage in report['stages'].items():
+        print(f"  {name:<16}{stage['count']:>8}" + ''.join(f"{stage[f'p{p}']:>10.2f}" for p in PERCENTILES)
+              + f"{stage['max']:>10.2f}")
+
+
+def parse_backend(value):
+    # ultralytics или onnx:models/nano.onnx:models/heavy.onnx
+    backend, *paths = value.split(':')
+    if len(paths) == 2:
+        return backend, paths[0], paths[1]
+    if paths:
+        raise argparse.ArgumentTypeError(f"expected backend or backend:nano:heavy, got {value}")
+    return backend, NANO_MODEL_PATH, HEAVY_MODEL_PATH
+
+
+def parse_imgsz_option(value):
+    # 640 - для обеих моделей, 320:640 - nano и heavy
+    nano, _, heavy = value.partition(':')
+    return {'nano': int(nano), 'heavy': int(heavy or nano)}
+
+
+def parse_source(value):
+    ip, separator, path = value.partition('=')
+    if not separator or not ip or not path:
+        raise argparse.ArgumentTypeError(f"expected ip=path, got {value}")
+    return ip, path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline replay of saved frames or video files through the '
+                                                 'detection pipeline, with alarms and notifications sent to '
+                                                 'local sinks and a report per configuration')
+    parser.add_argument('sources', nargs='+', type=parse_source,
+                        help='camera ip=folder of frames (e.g. 57=video/camera_57) or ip=video file')
+    parser.add_argument('--config', help='camera config (JSON or YAML as CAMERA_CONFIG) for area, zones, '
+                                         'motion_gate, schedule and alarm_url')
+    parser.add_argument('--backend', nargs='+', type=parse_backend, default=[parse_backend(BACKEND)],
+                        help='backend or backend:nano_model:heavy_model')
+    parser.add_argument('--conf', nargs='+', type=float, default=[CONF])
+    parser.add_argument('--max-det', nargs='+', type=int, default=[MAX_DET])
+    parser.add_argument('--gate', nargs='+', choices=('config', 'on', 'off'), default=['config'])
+    parser.add_argument('--cascade', nargs='+', choices=('on', 'off'), default=['on'],
+                        help='off - heavy model on the whole zone at every nano hit, without cache and limit')
+    parser.add_argument('--imgsz', nargs='+', default=['config'],
+                        help='inference size: config, 640 for both models or 320:640 for nano and heavy')
+    parser.add_argument('--speed', choices=('max', 'real'), default='max',
+                        help='max - every frame as fast as possible, real - source timing and camera schedule')
+    parser.add_argument('--fps', type=float, default=SOURCE_FPS, help='frame rate of folders without index.json')
+    parser.add_argument('--limit', type=int, help='frames per camera')
+    parser.add_argument('--output', default=OUTPUT_DIR, help='directory for logs, saved images and report.json')
+    args = parser.parse_args()
+
+    sources = {ip: os.path.abspath(path) for ip, path in args.sources}
+    camera_configs = {}
+    if args.config:
+        camera_configs = {str(camera['ip']): camera for camera in load_cameras(args.config)}
+    backends = [(backend, os.path.abspath(nano), os.path.abspath(heavy)) for backend, nano, heavy in args.backend]
+    # Логи, снимки и отчёт пишутся в отдельную папку, рабочие video/ и logs/ не затрагиваются
+    os.makedirs(os.path.join(args.output, 'logs'), exist_ok=True)
+    os.chdir(args.output)
+
+    reports = []
+    for index, ((backend, nano, heavy), conf, max_det, gate, cascade, imgsz) in enumerate(
+            itertools.product(backends, args.conf, args.max_det, args.gate, args.cascade, args.imgsz)):
+        config = {'name': str(index), 'backend': backend, 'nano': nano, 'heavy': heavy,
+                  'conf': conf, 'max_det': max_det, 'gate': gate, 'cascade': cascade, 'imgsz': imgsz}
+        report = run_config(index, config, sources, camera_configs, args)
+        print_report(report)
+        reports.append(report)
+
+    if len(reports) > 1:
+        print(f"\n{'config':<8}{'backend':<12}{'conf':>6}{'max_det':>9}{'gate':>8}{'cascade':>9}{'imgsz':>9}"
+              f"{'fps':>9}{'nano %':>9}{'heavy':>7}{'runs':>7}{'alarms':>8}")
+        for report in reports:
+            config = report['config']
+            print(f"{config['name']:<8}{config['backend']:<12}{config['conf']:>6}{config['max_det']:>9}"
+                  f"{config['gate']:>8}{config['cascade']:>9}{config['imgsz']:>9}{report['fps']:>9.2f}"
+                  f"{report['escalation_rate'] * 100:>9.1f}{report['heavy_hits']:>7}{report['heavy_runs']:>7}"
+                  f"{report['alarms']:>8}")
+    with open('report.json', 'w') as report_file:
+        json.dump(reports, report_file, indent=2)
+    print(f"\nreport saved to {os.path.join(os.getcwd(), 'report.json')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import multiprocessing
+import time
+from datetime import datetime
+
+ACTIVE_INTERVAL = 0.25
+BASE_INTERVAL = 1
+IDLE_INTERVAL = 5
+ACTIVE_WINDOW = 30
+IDLE_AFTER = 300
+IDLE_RAMP = 600
+NIGHT_INTERVAL = 5
+BOOST_DURATION = 30
+
+
+# Частота опроса камеры по недавней активности: после срабатывания nano камера
+# опрашивается часто, без движения и срабатываний интервал постепенно растёт до
+# idle_interval, в ночные часы (night=[начало, конец]) - не чаще night_interval.
+# Событие от самой камеры (boost) включает частый опрос сразу, в том числе ночью.
+class AdaptiveScheduler:
+    def __init__(self, active_interval=ACTIVE_INTERVAL, base_interval=BASE_INTERVAL,
+                 idle_interval=IDLE_INTERVAL, active_window=ACTIVE_WINDOW, idle_after=IDLE_AFTER,
+                 idle_ramp=IDLE_RAMP, night=None, night_interval=NIGHT_INTERVAL):
+        self.active_interval = active_interval
+        self.base_interval = base_interval
+        self.idle_interval = idle_interval
+        self.active_window = active_window
+        self.idle_after = idle_after
+        self.idle_ramp = idle_ramp
+        self.night = night
+        self.night_interval = night_interval
+        now = time.monotonic()
+        self.last_hit = None
+        self.last_activity = now
+        self.boost_until = None
+
+    def record(self, motion, hit):
+        now = time.monotonic()
+        if motion or hit:
+            self.last_activity = now
+        if hit:
+            self.last_hit = now
+
+    def boost(self, duration=BOOST_DURATION):
+        now = time.monotonic()
+        self.boost_until = max(self.boost_until or now, now + duration)
+        self.last_activity = now
+
+    def is_night(self):
+        if not self.night:
+            return False
+        start, end = self.night
+        hour = datetime.now().hour
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def interval(self):
+        now = time.monotonic()
+        if self.boost_until is not None and now < self.boost_until:
+            return self.active_interval
+        if self.last_hit is not None and now - self.last_hit < self.active_window:
+            return self.active_interval
+        idle = now - self.last_activity
+        if idle <= self.idle_after:
+            interval = self.base_interval
+        else:
+            ramp = min(1, (idle - self.idle_after) / self.idle_ramp) if self.idle_ramp else 1
+            interval = self.base_interval + (self.idle_interval - self.base_interval) * ramp
+        if self.is_night():
+            interval = max(interval, self.night_interval)
+        return interval
+
+
+# Общий на все камеры лимит кадров в секунду. Каждая камера резервирует время
+# своего следующего кадра; когда суммарная частота больше лимита, кадры всех
+# камер равномерно сдвигаются, а не копятся в очереди инференса.
+class InferenceBudget:
+    def __init__(self, frames_per_second=0):
+        self.frames_per_second = frames_per_second
+        self.next_free = multiprocessing.Value('d', 0.0)
+
+    def reserve(self, earliest):
+        if self.frames_per_second <= 0:
+            return earliest
+        with self.next_free.get_lock():
+            granted = max(earliest, self.next_free.value)
+            self.next_free.value = granted + 1 / self.frames_per_second
+        return granted
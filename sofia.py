@@ -0,0 +1,59 @@
+import hashlib
+import json
+import struct
+
+# Заголовок пакета Sofia (get_sound/dvr_sofia.ksy): head_flag, version, reserved, session_id,
+# sequence, total_packet, cur_packet, message_id, size - всего 20 байт, little endian
+HEADER = struct.Struct('<BBHIIBBHI')
+HEAD_FLAG = 0xff
+MAX_PACKET_SIZE = 65536
+PORT = 34567
+# Коды сообщений из get_sound/dvr_sofia.ksy; ответ обычно имеет код запроса + 1, кроме входа
+LOGIN_REQ = 1000
+LOGIN_RSP = 1000
+KEEPALIVE_REQ = 1006
+TALK_REQ = 1430
+TALK_CU_PU_DATA = 1432
+TALK_CLAIM = 1434
+# Ret в ответах: 100 - успех, от 200 - ошибка
+RET_OK = 100
+
+
+def parse_header(data):
+    (head_flag, version, reserved, session_id, sequence,
+     total_packet, cur_packet, message_id, size) = HEADER.unpack(data)
+    if head_flag != HEAD_FLAG:
+        raise ValueError(f"not a Sofia packet, head flag {head_flag:#x}")
+    if size > MAX_PACKET_SIZE:
+        raise ValueError(f"packet too large: {size} bytes")
+    return {'session_id': session_id, 'sequence': sequence, 'message_id': message_id, 'size': size}
+
+
+def build_packet(message_id, payload, session_id=0, sequence=0):
+    return HEADER.pack(HEAD_FLAG, 0, 0, session_id, sequence, 0, 0, message_id, len(payload)) + payload
+
+
+def encode_json(params):
+    # Как sofiactl.pl: JSON и перевод строки
+    return json.dumps(params).encode() + b'\n'
+
+
+def decode_json(payload):
+    # Прошивки XM дописывают после JSON перевод строки и нулевой байт
+    return json.loads(payload.rstrip(b'\x00\r\n ').decode('utf-8', errors='replace'))
+
+
+def sofia_hash(password):
+    # Хеш пароля XM ("md5based" в sofiactl.pl): 8 символов из попарных сумм байт MD5
+    digest = hashlib.md5(password.encode()).digest()
+    chars = []
+    for i in range(8):
+        n = (digest[2 * i] + digest[2 * i + 1]) % 0x3e
+        if n > 35:
+            n += 61
+        elif n > 9:
+            n += 55
+        else:
+            n += 0x30
+        chars.append(chr(n))
+    return ''.join(chars)
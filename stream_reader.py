@@ -0,0 +1,88 @@
+import threading
+import time
+import cv2
+
+RECONNECT_DELAY = 5
+
+
+# Постоянный программный декодер потока (RTSP или локальный файл).
+# Фоновый поток читает кадры без остановки и хранит только последний,
+# поэтому детекция всегда получает свежий кадр, а устаревшие отбрасываются.
+class LatestFrameReader:
+    def __init__(self, uri, logger, loop_file=True):
+        self.uri = uri
+        self.logger = logger
+        self.loop_file = loop_file
+        self.frame = None
+        self.frame_id = 0
+        self.dropped = 0
+        self.last_read_id = 0
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def open(self):
+        capture = cv2.VideoCapture(self.uri, cv2.CAP_FFMPEG)
+        # Минимальный буфер декодера, чтобы не копить старые кадры
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if not capture.isOpened():
+            capture.release()
+            return None
+        return capture
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.read_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def read_loop(self):
+        capture = None
+        # Локальный файл воспроизводится в реальном времени, как камера
+        file_delay = 0
+        while self.running:
+            if capture is None:
+                capture = self.open()
+                if capture is None:
+                    self.logger.error(f"Error opening stream {self.uri}")
+                    time.sleep(RECONNECT_DELAY)
+                    continue
+                fps = capture.get(cv2.CAP_PROP_FPS)
+                is_file = capture.get(cv2.CAP_PROP_FRAME_COUNT) > 0
+                file_delay = 1 / fps if is_file and fps > 0 else 0
+                self.logger.info(f"Stream {self.uri} opened")
+            ok, frame = capture.read()
+            if not ok:
+                capture.release()
+                capture = None
+                if not (file_delay and self.loop_file):
+                    self.logger.error(f"Stream {self.uri} interrupted, reconnecting")
+                    time.sleep(RECONNECT_DELAY)
+                continue
+            with self.condition:
+                if self.frame_id != self.last_read_id:
+                    self.dropped += 1
+                self.frame = frame
+                self.frame_id += 1
+                self.condition.notify_all()
+            if file_delay:
+                time.sleep(file_delay)
+        if capture is not None:
+            capture.release()
+
+    def latest(self):
+        with self.condition:
+            return self.frame
+
+    def read(self, timeout):
+        # Возвращает кадр, который ещё не отдавался, либо None по таймауту
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.frame_id != self.last_read_id, timeout=timeout):
+                return None
+            self.last_read_id = self.frame_id
+            return self.frame
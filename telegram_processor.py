@@ -1,28 +1,28 @@
-from logging.handlers import RotatingFileHandler
 import telebot
 import multiprocessing
-import logging
 import time
 import threading
+from transport import get_message
+from log_listener import get_logger
+from telegram_sender import TelegramSender, PRIORITY_SNAPSHOT
+import metrics
 
 
 class TelegramBotProcessor(multiprocessing.Process):
-    def __init__(self, telegram_token, chat_id, command_queue, response_queue):
+    def __init__(self, telegram_token, chat_id, command_queue, response_queue, metrics_queue=None,
+                 log_queue=None):
         super().__init__()
         self.telegram_token = telegram_token
         self.chat_id = chat_id
         self.command_queue = command_queue
         self.response_queue = response_queue
+        self.metrics_queue = metrics_queue
+        self.log_queue = log_queue
         self.running = multiprocessing.Value('b', True)
         self.stop_message = False
 
     def initialize_logger(self):
-        self.logger = logging.getLogger('TelegramBotProcessor')
-        self.logger.setLevel(logging.DEBUG)
-        handler = RotatingFileHandler('logs/telegram_bot.log', maxBytes=10240, backupCount=10)
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+        self.logger = get_logger('TelegramBotProcessor', 'telegram_bot.log', self.log_queue)
 
     def initialize_bot_handlers(self, bot):
         @bot.message_handler(commands=['now'])
@@ -36,6 +36,15 @@ class TelegramBotProcessor(multiprocessing.Process):
             except (IndexError, ValueError):
                 bot.reply_to(message, "Используйте команду в формате: /now <последние цифры IP>")
 
+        @bot.message_handler(commands=['gate'])
+        def handle_gate(message):
+            self.logger.debug("Received 'gate' command")
+            try:
+                ip_suffix = int(message.text.split()[1])
+                self.command_queue[ip_suffix].put('gate_stats')
+            except (IndexError, ValueError, KeyError):
+                bot.reply_to(message, "Используйте команду в формате: /gate <последние цифры IP>")
+
         @bot.message_handler(commands=['stop'])
         def handle_stop(message):
             self.logger.debug("Received 'stop' command")
@@ -117,31 +126,29 @@ class TelegramBotProcessor(multiprocessing.Process):
     def process_queue(self, bot):
         while self.running.value:
             try:
-                if not self.response_queue.empty():
-                    response = self.response_queue.get()
+                response = get_message(self.response_queue)
+                if response is not None:
                     if isinstance(response, tuple) and len(response) == 2:
                         command, data = response
+                        # Отправка идёт асинхронно в TelegramSender, здесь только постановка в очередь
                         if command == 'notification':
                             if not self.stop_message:
-                                image_path, ip_suffix = data
-                                with open(image_path, 'rb') as img_file:
-                                    bot.send_photo(chat_id=self.chat_id,
-                                                   photo=img_file,
-                                                   caption=f"Обнаружена кошка на камере {ip_suffix}")
-                                    del ip_suffix
+                                # Снимок приходит в памяти (JPEG), без временного файла
+                                image_data, ip_suffix = data
+                                self.sender.send_photo(image_data,
+                                                       caption=f"Обнаружена кошка на камере {ip_suffix}")
                         elif command == 'snapshot_done':
-                            image_path = data
-                            with open(image_path, 'rb') as img_file:
-                                bot.send_photo(chat_id=self.chat_id,
-                                               photo=img_file,
-                                               caption="Запрошенный snapshot")
+                            if data:
+                                self.sender.send_photo(data, caption="Запрошенный snapshot",
+                                                       priority=PRIORITY_SNAPSHOT)
+                            else:
+                                self.sender.send_message("Не удалось получить snapshot",
+                                                         priority=PRIORITY_SNAPSHOT)
                         elif command == 'alarm':
                             if not self.stop_message:
-                                bot.send_message(chat_id=self.chat_id,
-                                                 text=data)
+                                self.sender.send_message(data)
                         elif command == 'camera_status':
-                            bot.send_message(chat_id=self.chat_id,
-                                             text=data)
+                            self.sender.send_message(data)
                         # elif command == 'replacing_command_queue':
                         #     print(1, data)
                         #     self.command_queue = data
@@ -149,12 +156,10 @@ class TelegramBotProcessor(multiprocessing.Process):
                     else:
                         self.logger.error(
                             f'Error in command. {response}')
-                        bot.send_message(chat_id=self.chat_id,
-                                         text='Ошибка в команде')
+                        self.sender.send_message('Ошибка в команде')
 
             except Exception as e:
                 self.logger.error(f"Error processing queue: {e}")
-            time.sleep(1)
 
     def clear_telegram_updates(self, bot):
         self.logger.debug("Clearing Telegram updates")
@@ -169,7 +174,10 @@ class TelegramBotProcessor(multiprocessing.Process):
 
     def run(self):
         self.initialize_logger()
+        metrics.configure(self.metrics_queue)
         bot = telebot.TeleBot(self.telegram_token)
+        self.sender = TelegramSender(self.telegram_token, self.chat_id, self.logger)
+        self.sender.start()
         self.clear_telegram_updates(bot)
         self.initialize_bot_handlers(bot)
         self.logger.debug("Starting TelegramBotProcessor")
@@ -190,10 +198,14 @@ class TelegramBotProcessor(multiprocessing.Process):
             self.logger.error("TelegramBotProcessor not working")
 
         self.logger.debug(f"starting bot polling")
-        while self.running.value:
-            try:
-                bot.polling(none_stop=True, interval=10)
-            except Exception as e:
-                self.logger.error(f"Error in bot polling: {e}")
-                time.sleep(60)
-                self.logger.debug(f"repeated started bot.polling")
+        try:
+            while self.running.value:
+                try:
+                    bot.polling(none_stop=True, interval=10)
+                except Exception as e:
+                    self.logger.error(f"Error in bot polling: {e}")
+                    time.sleep(60)
+                    self.logger.debug(f"repeated started bot.polling")
+        finally:
+            # Уже поставленные в очередь сообщения отправляются до выхода процесса
+            self.sender.stop()
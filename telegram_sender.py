@@ -0,0 +1,214 @@
+import asyncio
+import collections
+import json
+import threading
+import time
+import aiohttp
+import metrics
+
+API_URL = 'https://api.telegram.org'
+# Снимок по /now важнее уведомлений, уведомления важнее статусных сообщений
+PRIORITY_SNAPSHOT = 0
+PRIORITY_NOTIFICATION = 1
+PRIORITY_STATUS = 2
+MEDIA_GROUP_SIZE = 10
+COALESCE_WINDOW = 0.5
+# Лимиты Telegram: около 1 сообщения в секунду в один чат и 30 в секунду на бота
+CHAT_RATE = 1
+CHAT_BURST = 3
+GLOBAL_RATE = 30
+REQUEST_TIMEOUT = 30
+RETRIES = 5
+RETRY_BACKOFF = 1
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def drain(self, seconds):
+        # После 429 бакет пуст на время retry_after
+        self.tokens = -seconds * self.rate
+        self.updated = time.monotonic()
+
+
+# Асинхронная отправка в Bot API в отдельном потоке со своим циклом asyncio.
+# Сообщения идут по приоритету, уведомления с фото, накопившиеся за COALESCE_WINDOW,
+# уходят одним sendMediaGroup, частота ограничена бакетами на чат и на бота.
+class TelegramSender(threading.Thread):
+    def __init__(self, token, chat_id, logger, api_url=API_URL, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST,
+                 global_rate=GLOBAL_RATE, coalesce_window=COALESCE_WINDOW, retries=RETRIES):
+        super().__init__(daemon=True)
+        self.base_url = f'{api_url}/bot{token}'
+        self.chat_id = chat_id
+        self.logger = logger
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_rate = global_rate
+        self.coalesce_window = coalesce_window
+        self.retries = retries
+        self.queues = {priority: collections.deque()
+                       for priority in (PRIORITY_SNAPSHOT, PRIORITY_NOTIFICATION, PRIORITY_STATUS)}
+        self.loop = None
+        self.wakeup = None
+        # Когда в пустую очередь уведомлений попало первое из ожидающих
+        self.notifications_since = 0
+        self.started = threading.Event()
+        self.stopping = False
+        self.sent = 0
+        self.failed = 0
+
+    def submit(self, priority, item):
+        # Вызывается из других потоков процесса бота
+        self.started.wait()
+        self.loop.call_soon_threadsafe(self.enqueue, priority, item)
+
+    def enqueue(self, priority, item):
+        if priority == PRIORITY_NOTIFICATION and not self.queues[priority]:
+            self.notifications_since = time.monotonic()
+        self.queues[priority].append(item)
+        self.wakeup.set()
+
+    def send_message(self, text, priority=PRIORITY_STATUS):
+        self.submit(priority, ('message', text))
+
+    def send_photo(self, photo, caption, priority=PRIORITY_NOTIFICATION):
+        self.submit(priority, ('photo', photo, caption))
+
+    def pending(self):
+        return sum(len(items) for items in self.queues.values())
+
+    def next_batch(self):
+        for priority, items in self.queues.items():
+            if not items:
+                continue
+            item = items.popleft()
+            if item[0] != 'photo' or priority != PRIORITY_NOTIFICATION:
+                return [item]
+            # Уведомления с фото подряд объединяются в медиагруппу
+            batch = [item]
+            while items and items[0][0] == 'photo' and len(batch) < MEDIA_GROUP_SIZE:
+                batch.append(items.popleft())
+            return batch
+        return None
+
+    async def call(self, session, method, data):
+        start = time.perf_counter()
+        for attempt in range(self.retries):
+            await self.global_bucket.acquire()
+            await self.chat_bucket.acquire()
+            try:
+                async with session.post(f'{self.base_url}/{method}', data=data(),
+                                        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
+                    result = await response.json(content_type=None)
+            except Exception as e:
+                self.logger.error(f"Telegram {method} error: {e!r}, attempt {attempt + 1}")
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+                continue
+            if result.get('ok'):
+                metrics.observe('telegram_send', time.perf_counter() - start, kind=method)
+                self.sent += 1
+                return True
+            if response.status == 429:
+                retry_after = result.get('parameters', {}).get('retry_after', 1)
+                self.logger.warning(f"Telegram {method} rate limited, retry after {retry_after} s")
+                self.chat_bucket.drain(retry_after)
+                continue
+            if response.status >= 500:
+                self.logger.error(f"Telegram {method} server error {response.status}, attempt {attempt + 1}")
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+                continue
+            self.logger.error(f"Telegram {method} failed: {result.get('description')}")
+            break
+        self.failed += 1
+        metrics.inc('telegram_failed', kind=method)
+        return False
+
+    def message_form(self, text):
+        return lambda: {'chat_id': str(self.chat_id), 'text': text}
+
+    def photo_form(self, photo, caption):
+        def form():
+            data = aiohttp.FormData()
+            data.add_field('chat_id', str(self.chat_id))
+            data.add_field('caption', caption)
+            data.add_field('photo', photo, filename='photo.jpg', content_type='image/jpeg')
+            return data
+        return form
+
+    def media_group_form(self, batch):
+        def form():
+            data = aiohttp.FormData()
+            data.add_field('chat_id', str(self.chat_id))
+            media = [{'type': 'photo', 'media': f'attach://photo{i}', 'caption': caption}
+                     for i, (_, _, caption) in enumerate(batch)]
+            data.add_field('media', json.dumps(media, ensure_ascii=False))
+            for i, (_, photo, _) in enumerate(batch):
+                data.add_field(f'photo{i}', photo, filename=f'photo{i}.jpg', content_type='image/jpeg')
+            return data
+        return form
+
+    async def send_batch(self, session, batch):
+        if batch[0][0] == 'message':
+            await self.call(session, 'sendMessage', self.message_form(batch[0][1]))
+        elif len(batch) == 1:
+            await self.call(session, 'sendPhoto', self.photo_form(batch[0][1], batch[0][2]))
+        else:
+            await self.call(session, 'sendMediaGroup', self.media_group_form(batch))
+
+    async def wait_for_group(self):
+        # Уведомления с нескольких камер уходят одной группой: ждём, пока к группе может
+        # присоединиться ещё одно, то есть пока первое не пролежало coalesce_window
+        notifications = self.queues[PRIORITY_NOTIFICATION]
+        if self.stopping or len(notifications) >= MEDIA_GROUP_SIZE:
+            return
+        remaining = self.notifications_since + self.coalesce_window - time.monotonic()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+
+    async def process(self):
+        self.wakeup = asyncio.Event()
+        self.chat_bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self.global_bucket = TokenBucket(self.global_rate, self.global_rate)
+        self.started.set()
+        async with aiohttp.ClientSession() as session:
+            while not self.stopping or self.pending():
+                if not self.pending():
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), 0.5)
+                    except asyncio.TimeoutError:
+                        continue
+                if self.queues[PRIORITY_NOTIFICATION] and not self.queues[PRIORITY_SNAPSHOT]:
+                    await self.wait_for_group()
+                batch = self.next_batch()
+                if batch:
+                    await self.send_batch(session, batch)
+                metrics.set_gauge('queue_depth', self.pending(), queue='telegram')
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.process())
+        except Exception as e:
+            self.logger.error(f"Error in telegram sender: {e}")
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        self.started.wait()
+        self.loop.call_soon_threadsafe(setattr, self, 'stopping', True)
+        self.join(REQUEST_TIMEOUT)
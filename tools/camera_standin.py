@@ -0,0 +1,94 @@
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import socket
+import threading
+import time
+import cv2
+import numpy as np
+
+MODES = ['ok', 'hang', 'drop']
+# Зависший запрос держит соединение, пока не сменится режим, но не дольше HANG_LIMIT
+HANG_LIMIT = 600
+
+
+def test_jpeg(width=640, height=360):
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    cv2.rectangle(image, (width // 3, height // 4), (width // 2, height * 3 // 4), (0, 200, 255), -1)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+# Локальная замена HTTP снимка камеры: ok - отдаёт JPEG, hang - принимает запрос и не отвечает,
+# drop - закрывает соединение без ответа. Режим меняется атрибутом mode или запросом /mode/<режим>
+class CameraStandin:
+    def __init__(self, host='127.0.0.1', port=18080, mode='ok'):
+        self.mode = mode
+        self.requests = 0
+        self.jpeg = test_jpeg()
+        self.mode_changed = threading.Event()
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/mode/'):
+                    standin.set_mode(self.path[len('/mode/'):])
+                    self.send_response(200)
+                    self.end_headers()
+                    self.wfile.write(standin.mode.encode())
+                    return
+                standin.requests += 1
+                if standin.mode == 'hang':
+                    deadline = time.monotonic() + HANG_LIMIT
+                    while standin.mode == 'hang' and time.monotonic() < deadline:
+                        standin.mode_changed.wait(0.5)
+                    self.close_connection = True
+                    return
+                if standin.mode == 'drop':
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    self.close_connection = True
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(standin.jpeg)))
+                self.end_headers()
+                self.wfile.write(standin.jpeg)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.uri = f'http://{host}:{self.server.server_port}/snapshot.jpg'
+
+    def set_mode(self, mode):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode}, expected one of {MODES}")
+        self.mode = mode
+        self.mode_changed.set()
+        self.mode_changed.clear()
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.set_mode('ok')
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP snapshot camera stand-in that can hang and drop '
+                                                 'requests; switch with GET /mode/ok|hang|drop')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--mode', choices=MODES, default='ok')
+    args = parser.parse_args()
+    standin = CameraStandin(args.host, args.port, args.mode)
+    print(f"Snapshot uri {standin.uri}, mode {standin.mode}")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from camera_config import CameraActions, apply_camera_config, diff_cameras
+from transport import CameraQueues, create_queue, get_message
+
+POOLED = {14}
+BASE = [
+    {'ip': 11, 'track': True, 'user': 'admin', 'zones': None},
+    {'ip': 12, 'track': True, 'user': 'admin'},
+    {'ip': 13, 'track': False, 'user': 'admin'},
+    {'ip': 14, 'track': True, 'user': 'admin', 'alarm_url': ''},
+]
+
+
+def check(name, ok):
+    print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def edited(cameras, ip=None, remove=(), add=(), **fields):
+    result = [dict(camera, **fields) if camera['ip'] == ip else dict(camera)
+              for camera in cameras if camera['ip'] not in remove]
+    return result + [{'ip': new_ip, 'track': True, 'user': 'admin'} for new_ip in add]
+
+
+# Вместо процесса камеры: только учёт запусков и остановок
+class StubProcess:
+    def __init__(self, ip):
+        self.ip_suffix = ip
+        self.alive = True
+
+
+# Действия как в main.py, но процессы камер - заглушки
+class StubMain:
+    def __init__(self, cameras, spare):
+        self.command_queue = CameraQueues({camera['ip']: create_queue() for camera in cameras}, spare=spare)
+        self.processes = []
+        self.events = []
+        self.pool_started = set()
+        self.actions = CameraActions(add=self.add, remove=self.remove, start=self.start, stop=self.stop,
+                                     running=self.running, update=self.update,
+                                     pooled=lambda ip: ip in POOLED)
+        for camera in cameras:
+            if camera['track']:
+                self.start(camera)
+        self.events = []
+
+    def add(self, ip):
+        return ip in self.command_queue or self.command_queue.assign(ip) is not None
+
+    def remove(self, ip):
+        self.stop(ip)
+        self.command_queue.release(ip)
+
+    def start(self, camera):
+        self.events.append(('start', camera['ip']))
+        if camera['ip'] in POOLED:
+            self.pool_started.add(camera['ip'])
+            return
+        self.processes.append(StubProcess(camera['ip']))
+
+    def running(self, ip):
+        if ip in POOLED:
+            return ip in self.pool_started
+        return any(process.ip_suffix == ip and process.alive for process in self.processes)
+
+    def stop(self, ip):
+        if not self.running(ip):
+            return
+        self.events.append(('stop', ip))
+        self.pool_started.discard(ip)
+        for process in self.processes:
+            if process.ip_suffix == ip:
+                process.alive = False
+
+    def update(self, ip, params):
+        self.events.append(('update', ip))
+
+    def live(self):
+        return {process.ip_suffix: process for process in self.processes if process.alive}
+
+
+def read_spare(queues, ready):
+    # Процесс запущен до того, как камере отдана запасная очередь, как бот и инференс в main.py
+    ready.wait(10)
+    message_queue = queues.get(15)
+    if message_queue is not None:
+        message_queue.put('from child')
+
+
+def check_inherited_spare():
+    queues = CameraQueues({11: create_queue()}, spare=1)
+    ready = multiprocessing.Event()
+    child = multiprocessing.Process(target=read_spare, args=(queues, ready))
+    child.start()
+    spare = queues.assign(15)
+    ready.set()
+    message = get_message(spare, 10)
+    child.join(10)
+    return message == 'from child'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Feed a sequence of camera config edits to apply_camera_config '
+                                                 'with stub camera processes and check that only the edited '
+                                                 'cameras are started, stopped or updated')
+    parser.add_argument('--spare', type=int, default=3, help='spare queues, as CAMERA_SPARE_QUEUES')
+    args = parser.parse_args()
+    logger = logging.getLogger('check_camera_config')
+    logger.addHandler(logging.StreamHandler(sys.stdout))
+    logger.setLevel(logging.WARNING)
+    results = []
+
+    stub = StubMain(BASE, args.spare)
+    # config - содержимое файла, cameras - камеры, с которыми работает главный процесс
+    config = cameras = BASE
+    steps = [
+        ('zones of 11 changed', edited(config, 11, zones=[{'area': [0, 0, 10, 10]}]), [('update', 11)]),
+        ('nothing changed, list reordered', None, []),
+        ('camera 15 added', 'add 15', [('start', 15)]),
+        ('camera 15 removed', 'remove 15', [('stop', 15)]),
+        ('camera 15 added again', 'add 15', [('start', 15)]),
+        ('user of 12 changed', 'user 12', [('stop', 12), ('start', 12)]),
+        ('track of 13 switched on', 'track 13', [('start', 13)]),
+        ('alarm_url of pooled 14 changed', 'alarm 14', [('update', 14)]),
+        ('cameras 16, 17, 18 added, no spare queue for 18', 'add 16 17 18', [('start', 16), ('start', 17)]),
+        ('camera 16 removed, 18 still waits', 'remove 16', [('stop', 16)]),
+        ('next edit starts waiting 18', 'user 17', [('start', 18), ('stop', 17), ('start', 17)]),
+    ]
+    for name, edit, expected in steps:
+        if edit is None:
+            config = list(reversed(config))
+        elif isinstance(edit, list):
+            config = edit
+        else:
+            command, *ips = edit.split()
+            ips = [int(ip) for ip in ips]
+            if command == 'add':
+                config = edited(config, add=ips)
+            elif command == 'remove':
+                config = edited(config, remove=ips)
+            elif command == 'user':
+                config = edited(config, ips[0], user='operator')
+            elif command == 'track':
+                config = edited(config, ips[0], track=True)
+            else:
+                config = edited(config, ips[0], alarm_url='http://127.0.0.1/alarm')
+        before = stub.live()
+        stub.events = []
+        cameras = apply_camera_config(cameras, config, stub.actions, logger)
+        touched = {ip for _, ip in stub.events}
+        after = stub.live()
+        untouched = [ip for ip in before if ip not in touched]
+        results.append(check(f"{name}: {stub.events}",
+                             sorted(stub.events) == sorted(expected)
+                             and all(after.get(ip) is before[ip] for ip in untouched)))
+    added, removed, changed = diff_cameras(cameras, list(reversed(cameras)))
+    results.append(check('diff_cameras: reordered list has no changes', not (added or removed or changed)))
+    results.append(check('spare queue assigned after start is found by a running child process',
+                         check_inherited_spare()))
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from camera_pool import CameraFetcher
+from camera_standin import CameraStandin
+from transport import create_queue, get_message
+
+HEALTHY = 99
+
+
+def check(name, ok):
+    print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+# Недоступная камера: запрос ONVIF висит до таймаута
+class OfflineFetcher(CameraFetcher):
+    onvif_delay = 8
+
+    def resolve_snapshot_uri(self, camera):
+        if camera['ip'] == HEALTHY:
+            return super().resolve_snapshot_uri(camera)
+        time.sleep(self.onvif_delay)
+        raise TimeoutError('ONVIF request timed out')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that offline pooled cameras waiting for ONVIF '
+                                                 'do not delay frames of a healthy camera')
+    parser.add_argument('--offline', type=int, default=20, help='cameras whose ONVIF requests hang')
+    parser.add_argument('--onvif-delay', type=float, default=8)
+    parser.add_argument('--duration', type=float, default=12)
+    parser.add_argument('--port', type=int, default=18090)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs('logs', exist_ok=True)
+    standin = CameraStandin(port=args.port)
+    standin.start()
+    # Адрес снимка исправной камеры уже в кэше, как после прошлого запуска
+    os.makedirs('cache')
+    with open(f'cache/snapshot_192.168.1.{HEALTHY}.txt', 'w') as cache_file:
+        cache_file.write(standin.uri)
+    offline = list(range(1, args.offline + 1))
+    cameras = {ip: {'ip': ip, 'user': 'admin', 'passw': ''} for ip in offline + [HEALTHY]}
+    control_queue, worker_queue = create_queue(), create_queue()
+    OfflineFetcher.onvif_delay = args.onvif_delay
+    fetcher = OfflineFetcher(cameras, control_queue, {ip: worker_queue for ip in cameras})
+    fetcher.start()
+    try:
+        for ip in offline:
+            control_queue.put(('start', ip))
+        time.sleep(0.5)
+        control_queue.put(('start', HEALTHY))
+        # Вместо обработчика пула: каждый кадр сразу готов, следующий через 0.2 с
+        frames = 0
+        first_frame = None
+        started = time.monotonic()
+        while time.monotonic() - started < args.duration:
+            message = get_message(worker_queue)
+            if message is None or message[0] != 'frame':
+                continue
+            frames += 1
+            first_frame = first_frame or time.monotonic() - started
+            control_queue.put(('done', message[1], message[2], time.monotonic() + 0.2))
+        print(f"  healthy camera: {frames} frames in {args.duration:.0f} s, first after "
+              f"{first_frame if first_frame is not None else float('nan'):.1f} s")
+        ok = check(f'{args.offline} cameras waiting for ONVIF do not delay the healthy camera',
+                   first_frame is not None and first_frame < 2 and frames >= args.duration / 0.2 * 0.5)
+    finally:
+        fetcher.running.value = False
+        fetcher.join(args.onvif_delay + 10)
+        if fetcher.is_alive():
+            fetcher.kill()
+        standin.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import logging
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from camera_processor import CameraProcessor
+from camera_standin import CameraStandin
+from frame_ring import SHM_DIR, ring_prefix, start_resource_tracker, unlink_rings
+from transport import create_queue, get_message, release_reader_lock
+from watchdog import CameraWatchdog
+
+IP = '57'
+
+
+def check(name, ok):
+    print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def answer_inference(inference_queue, result_queues, stop):
+    # Вместо процесса инференса: на каждый запрос пустой результат, детекций нет
+    while not stop.is_set():
+        message = get_message(inference_queue)
+        if message is not None:
+            ip, request_id = message[1:3]
+            result_queues[ip].put((request_id, (None, None)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check CameraProcessor timeouts, backoff and recovery '
+                                                 'and the CameraWatchdog restart against a local camera stand-in')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--phase', type=float, default=4, help='duration of the hang and drop phases, s')
+    args = parser.parse_args()
+    results = []
+
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs('logs', exist_ok=True)
+    standin = CameraStandin(port=args.port)
+    standin.start()
+    start_resource_tracker()
+    command_queue = create_queue()
+    response_queue = create_queue()
+    inference_queue = create_queue()
+    result_queues = {IP: create_queue()}
+    stop = threading.Event()
+    threading.Thread(target=answer_inference, args=(inference_queue, result_queues, stop), daemon=True).start()
+
+    def create_camera():
+        return CameraProcessor(IP, 'admin', '', command_queue, response_queue, create_queue(),
+                               inference_queue, result_queues[IP], alarm_url='', area=None,
+                               motion_gate=False, snapshot_uri=standin.uri, snapshot_timeout=1)
+
+    def restart_camera(process):
+        # Как restart_camera в main.py
+        unlink_rings(IP, process.pid)
+        release_reader_lock(command_queue)
+        release_reader_lock(result_queues[IP])
+        camera_process = create_camera()
+        camera_process.start()
+        pids.append(camera_process.pid)
+        return camera_process
+
+    logger = logging.getLogger('check_camera_watchdog')
+    logger.addHandler(logging.StreamHandler(sys.stdout))
+    logger.setLevel(logging.INFO)
+    watchdog = CameraWatchdog(logger, restart_camera, stall_timeout=3, interval=0.5, stop_timeout=2)
+    processes = [create_camera()]
+    processes[0].start()
+    pids = [processes[0].pid]
+
+    def supervise(seconds):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            watchdog.check(processes)
+            time.sleep(0.1)
+
+    try:
+        results.append(check('ok: frames arrive', wait_for(lambda: processes[0].last_frame.value > 0, 15)))
+
+        standin.set_mode('hang')
+        started = time.monotonic()
+        supervise(args.phase)
+        frame_age = time.monotonic() - processes[0].last_frame.value
+        heartbeat_age = time.monotonic() - processes[0].heartbeat.value
+        results.append(check(f'hang: no frames for {frame_age:.1f} s, '
+                             f'loop alive (heartbeat {heartbeat_age:.1f} s ago)',
+                             frame_age > args.phase - 1.5 and heartbeat_age < 2))
+
+        standin.set_mode('drop')
+        supervise(args.phase)
+        results.append(check('hang and drop: camera process not restarted',
+                             not watchdog.restarts.get(IP, {}).get('count')))
+
+        standin.set_mode('ok')
+        recovered = time.monotonic()
+        results.append(check('recover: frames resume after backoff',
+                             wait_for(lambda: processes[0].last_frame.value > recovered, 40)))
+        print(f"  frames resumed {time.monotonic() - recovered:.1f} s after the camera came back, "
+              f"{standin.requests} snapshot requests since {time.monotonic() - started:.0f} s ago")
+
+        # Процесс камеры замирает целиком, как при зависшем вызове в C коде
+        os.kill(processes[0].pid, signal.SIGSTOP)
+        stalled = processes[0]
+        supervise(8)
+        results.append(check('stall: watchdog restarted the stopped process',
+                             processes[0] is not stalled and not stalled.is_alive()
+                             and watchdog.restarts.get(IP, {}).get('count') == 1))
+        restarted = time.monotonic()
+        results.append(check('restart: frames from the new process',
+                             wait_for(lambda: processes[0].last_frame.value > restarted, 15)))
+        command_queue.put('gate_stats')
+        response = get_message(response_queue, 5)
+        while response is not None and response[0] != 'camera_status':
+            response = get_message(response_queue, 5)
+        results.append(check('restart: command queue answered by the new process',
+                             response is not None and response[1].startswith(f'camera, {IP}')))
+
+        # Камеры уже нет в конфигурации: restart возвращает None, как restart_camera в main.py
+        removed_watchdog = CameraWatchdog(logger, lambda process: unlink_rings(IP, process.pid) and None,
+                                          stall_timeout=3, interval=0.5, stop_timeout=2)
+        os.kill(processes[0].pid, signal.SIGKILL)
+        processes[0].join(5)
+        removed = processes[0]
+        removed_watchdog.check(processes, force=True)
+        results.append(check('removed: process of a camera no longer configured dropped, not restarted',
+                             not processes and not removed.is_alive()))
+        if os.path.isdir(SHM_DIR):
+            leaked = [name for name in os.listdir(SHM_DIR)
+                      if any(name.startswith(ring_prefix(IP, pid)) for pid in pids)]
+            results.append(check(f'rings of killed processes unlinked, left: {leaked}', not leaked))
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.running.value = False
+                process.join(10)
+        stop.set()
+        standin.stop()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
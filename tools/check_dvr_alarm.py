@@ -0,0 +1,122 @@
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dvr_alarm_listener import DvrAlarmListener, event_address, parse_packets
+from transport import get_message
+
+# Пакеты сервера тревог в том виде, в каком их отправляют камеры XM/Sofia:
+# заголовок 20 байт (message_id 1508, alarmcenter_msg_req), JSON, перевод строки и нулевой байт
+PACKETS = [
+    # движение, начало, камера 192.168.1.11
+    bytes.fromhex('''
+        ff0100001c000000000000000000e405c10000007b224164647265737322203a202230783042303141384330222c2022
+        4368616e6e656c22203a20302c20224465736372697022203a2022222c20224576656e7422203a20224d6f74696f6e44
+        6574656374222c202253657269616c494422203a202261316232633364346535663630373138222c2022537461727454
+        696d6522203a2022323032342d30352d31342030323a31333a3037222c202253746174757322203a2022537461727422
+        2c20225479706522203a2022416c61726d227d0a00'''),
+    # движение, окончание, та же камера
+    bytes.fromhex('''
+        ff0100001c000000010000000000e405c00000007b224164647265737322203a202230783042303141384330222c2022
+        4368616e6e656c22203a20302c20224465736372697022203a2022222c20224576656e7422203a20224d6f74696f6e44
+        6574656374222c202253657269616c494422203a202261316232633364346535663630373138222c2022537461727454
+        696d6522203a2022323032342d30352d31342030323a31333a3139222c202253746174757322203a202253746f70222c
+        20225479706522203a2022416c61726d227d0a00'''),
+    # человек, камера 192.168.1.12
+    bytes.fromhex('''
+        ff01000031000000000000000000e405c00000007b224164647265737322203a202230783043303141384330222c2022
+        4368616e6e656c22203a20302c20224465736372697022203a2022222c20224576656e7422203a202248756d616e4465
+        74656374222c202253657269616c494422203a202230663165326433633462356136393738222c202253746172745469
+        6d6522203a2022323032342d30352d31342030323a31343a3431222c202253746174757322203a20225374617274222c
+        20225479706522203a2022416c61726d227d0a00'''),
+    # потеря видео на регистраторе 192.168.1.99, камеры нет в конфигурации
+    bytes.fromhex('''
+        ff01000045000000000000000000e405be0000007b224164647265737322203a202230783633303141384330222c2022
+        4368616e6e656c22203a20322c20224465736372697022203a2022222c20224576656e7422203a2022566964656f4c6f
+        7373222c202253657269616c494422203a202239396161383862623737636336366464222c2022537461727454696d65
+        22203a2022323032342d30352d31342030323a31353a3032222c202253746174757322203a20225374617274222c2022
+        5479706522203a2022416c61726d227d0a00'''),
+]
+EXPECTED = [
+    ('192.168.1.11', 'MotionDetect', 'Start'),
+    ('192.168.1.11', 'MotionDetect', 'Stop'),
+    ('192.168.1.12', 'HumanDetect', 'Start'),
+    ('192.168.1.99', 'VideoLoss', 'Start'),
+]
+
+
+def check(name, ok):
+    print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def send(port, *chunks):
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as connection:
+        for chunk in chunks:
+            connection.sendall(chunk)
+            time.sleep(0.01)
+
+
+def drain(message_queue, timeout):
+    messages = []
+    message = get_message(message_queue, timeout)
+    while message is not None:
+        messages.append(message)
+        message = get_message(message_queue, 0.2)
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the Sofia alarm parser and DvrAlarmListener '
+                                                 'on recorded alarm server packets')
+    parser.add_argument('--port', type=int, default=15102)
+    args = parser.parse_args()
+    results = []
+
+    events = parse_packets(b''.join(PACKETS))
+    results.append(check('parser: all packets decoded', len(events) == len(EXPECTED)))
+    results.append(check('parser: address, event and status',
+                         [(event_address(e), e['Event'], e['Status']) for e in events] == EXPECTED))
+    results.append(check('listener: camera found by integer and string config ip',
+                         DvrAlarmListener({11: None}).find_camera(events[0], None) == 11
+                         and DvrAlarmListener({'11': None}).find_camera(events[0], None) == '11'))
+
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs('logs', exist_ok=True)
+    # Ключи - числа, как ip камер в CAMERA_IPS и файле конфигурации
+    command_queues = {11: multiprocessing.Queue(), 12: multiprocessing.Queue()}
+    listener = DvrAlarmListener(command_queues, host='127.0.0.1', port=args.port, boost_duration=30)
+    listener.start()
+    time.sleep(1)
+    try:
+        # Заголовок по байту и два пакета в одном соединении: чтение не зависит от разбиения TCP
+        first = PACKETS[0]
+        send(args.port, *[first[i:i + 1] for i in range(20)], first[20:], PACKETS[1])
+        boosts = drain(command_queues[11], 2)
+        results.append(check('listener: MotionDetect Start boosts camera 11 once, Stop ignored',
+                             boosts == [('boost', 30, 'MotionDetect')]))
+        start = time.perf_counter()
+        send(args.port, PACKETS[2])
+        boost = get_message(command_queues[12], 2)
+        latency = time.perf_counter() - start
+        results.append(check('listener: HumanDetect boosts camera 12', boost == ('boost', 30, 'HumanDetect')))
+        # Неизвестная камера и мусор в порту не должны ронять сервер
+        send(args.port, PACKETS[3])
+        send(args.port, b'GET / HTTP/1.0\r\n\r\n' + bytes(20))
+        send(args.port, PACKETS[0])
+        results.append(check('listener: still serving after unknown camera and garbage',
+                             drain(command_queues[11], 2) == [('boost', 30, 'MotionDetect')]))
+        print(f"event to boost command latency {latency * 1000:.1f} ms")
+    finally:
+        listener.running.value = False
+        listener.join()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import glob
+import os
+import sys
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from inference_backend import letterbox, to_tensor
+
+MODELS = ('models/nano_10n_st_11.pt', 'models/heavy_10m_st_11.pt')
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def load_frames(folder, limit=None):
+    paths = sorted(path for pattern in IMAGE_PATTERNS for path in glob.glob(os.path.join(folder, pattern)))
+    frames = []
+    for path in paths[:limit]:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is not None:
+            frames.append((path, image))
+    return frames
+
+
+def export_onnx(path, imgsz, opset, dynamic=False):
+    from ultralytics import YOLOv10
+    return YOLOv10(path).export(format='onnx', imgsz=imgsz, opset=opset, simplify=True, dynamic=dynamic)
+
+
+def quantize_int8(onnx_path, calibration_dir=None, imgsz=640, limit=200):
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+    int8_path = onnx_path.replace('.onnx', '_int8.onnx')
+    if not calibration_dir:
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+        return int8_path
+
+    # Статическая квантизация точнее для свёрток, но нужны реальные кадры с камер
+    class FramesReader(CalibrationDataReader):
+        def __init__(self, input_name):
+            self.input_name = input_name
+            self.frames = iter(load_frames(calibration_dir, limit))
+
+        def get_next(self):
+            frame = next(self.frames, None)
+            if frame is None:
+                return None
+            canvas = letterbox(frame[1], (imgsz, imgsz))[0]
+            return {self.input_name: to_tensor([canvas])}
+
+    import onnxruntime
+    input_name = onnxruntime.InferenceSession(onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    quantize_static(onnx_path, int8_path, FramesReader(input_name), quant_format=QuantFormat.QDQ,
+                    per_channel=True, weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8)
+    return int8_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export YOLOv10 models to ONNX (FP32 and INT8)')
+    parser.add_argument('models', nargs='*', default=MODELS)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--opset', type=int, default=13)
+    parser.add_argument('--dynamic', action='store_true',
+                        help='dynamic batch and input size, needed for the per-camera imgsz setting')
+    parser.add_argument('--int8', action='store_true', help='also write a quantized *_int8.onnx model')
+    parser.add_argument('--calibration', help='folder of saved frames for static INT8 calibration')
+    args = parser.parse_args()
+
+    for path in args.models:
+        onnx_path = export_onnx(path, args.imgsz, args.opset, args.dynamic)
+        print(f"{path} -> {onnx_path}")
+        if args.int8:
+            int8_path = quantize_int8(onnx_path, args.calibration, args.imgsz)
+            print(f"{onnx_path} -> {int8_path}")
+
+
+if __name__ == '__main__':
+    main()
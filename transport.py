@@ -0,0 +1,127 @@
+import asyncio
+import multiprocessing
+import queue
+import threading
+
+# Таймаут блокирующего чтения: за это время процесс замечает сброс флага running
+GET_TIMEOUT = 0.5
+# Запасные очереди для камер, добавленных в конфигурацию после запуска
+SPARE_QUEUES = 4
+FREE_SLOT = -1
+
+
+def create_queue():
+    return multiprocessing.Queue()
+
+
+def get_message(message_queue, timeout=GET_TIMEOUT):
+    try:
+        return message_queue.get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+
+async def get_message_async(message_queue, timeout=GET_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, get_message, message_queue, timeout)
+
+
+# Чтение очереди в своём потоке для цикла asyncio: сообщения передаются в цикл через
+# call_soon_threadsafe, поэтому чтение не ждёт свободного потока в пуле цикла по умолчанию,
+# который могут занять другие блокирующие вызовы. running - флаг процесса (multiprocessing.Value)
+class QueueReader(threading.Thread):
+    def __init__(self, message_queue, running):
+        super().__init__(daemon=True)
+        self.message_queue = message_queue
+        self.running = running
+        self.loop = asyncio.get_running_loop()
+        self.messages = asyncio.Queue()
+
+    def run(self):
+        while self.running.value:
+            message = get_message(self.message_queue)
+            if message is None:
+                continue
+            try:
+                self.loop.call_soon_threadsafe(self.messages.put_nowait, message)
+            except RuntimeError:
+                # Цикл уже закрыт
+                return
+
+    async def get(self, timeout=GET_TIMEOUT):
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+# Очередь команд одной камеры поверх общей очереди обработчика пула:
+# для отправителя (бота) выглядит как обычная очередь камеры
+class TaggedQueue:
+    def __init__(self, message_queue, tag):
+        self.message_queue = message_queue
+        self.tag = tag
+
+    def put(self, message):
+        self.message_queue.put(('command', self.tag, message))
+
+
+def release_reader_lock(message_queue):
+    # Процесс, убитый во время get(), оставляет захваченной блокировку чтения очереди,
+    # и новый читатель уже ничего не получит. Только для очереди с единственным читателем,
+    # когда он завершён: снимает блокировку, если она занята, иначе ничего не меняет
+    message_queue._rlock.acquire(False)
+    message_queue._rlock.release()
+
+
+# Очереди камер по ip. Очередь нельзя передать уже запущенному процессу (боту, инференсу),
+# поэтому для камер, добавленных в конфигурацию на лету, запасные очереди создаются заранее
+# и наследуются вместе со словарём, а какой камере отдана запасная очередь, все процессы
+# видят в общем массиве. Запасные очереди раздаёт и освобождает только главный процесс
+class CameraQueues(dict):
+    def __init__(self, queues, spare=0):
+        super().__init__(queues)
+        self.spare = [create_queue() for _ in range(spare)]
+        self.owners = multiprocessing.Array('i', [FREE_SLOT] * spare)
+
+    def slot(self, ip):
+        key = spare_key(ip)
+        owners = self.owners[:]
+        return owners.index(key) if key is not None and key in owners else None
+
+    def __missing__(self, ip):
+        slot = self.slot(ip)
+        if slot is None:
+            raise KeyError(ip)
+        return self.spare[slot]
+
+    def __contains__(self, ip):
+        return super().__contains__(ip) or self.slot(ip) is not None
+
+    def get(self, ip, default=None):
+        try:
+            return self[ip]
+        except KeyError:
+            return default
+
+    def assign(self, ip):
+        # Запасная очередь для новой камеры, None - если их не осталось или ip не число
+        owners = self.owners[:]
+        if spare_key(ip) is None or FREE_SLOT not in owners:
+            return None
+        slot = owners.index(FREE_SLOT)
+        self.owners[slot] = spare_key(ip)
+        return self.spare[slot]
+
+    def release(self, ip):
+        # Очереди камер из конфигурации при запуске остаются за ними
+        slot = self.slot(ip)
+        if slot is not None and not super().__contains__(ip):
+            self.owners[slot] = FREE_SLOT
+
+
+def spare_key(ip):
+    # В общем массиве только числа: ip камеры - последнее число адреса
+    if isinstance(ip, str) and ip.isdigit():
+        return int(ip)
+    return ip if isinstance(ip, int) and ip >= 0 else None
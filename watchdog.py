@@ -0,0 +1,106 @@
+import time
+import metrics
+
+# Процесс камеры без нового цикла дольше этого считается зависшим. Цикл ограничен таймаутами
+# снимка, ONVIF и инференса (InferenceClient, 30 с), поэтому запас больше их суммы
+STALL_TIMEOUT = 90
+# Камера работает, но кадров нет дольше этого - предупреждение в лог (камера недоступна)
+FRAME_AGE_WARNING = 300
+CHECK_INTERVAL = 5
+STOP_TIMEOUT = 10
+# Повторные перезапуски одной камеры - с растущей паузой
+RESTART_DELAY = 10
+RESTART_MAX_DELAY = 600
+
+
+def stop_process(process, timeout=STOP_TIMEOUT):
+    # Сначала штатная остановка, затем terminate и kill (процесс может быть остановлен SIGSTOP).
+    # Флаг running меняется только если его блокировку не держит зависший процесс
+    lock = process.running.get_lock()
+    if lock.acquire(timeout=1):
+        try:
+            process.running.value = False
+        finally:
+            lock.release()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join(timeout)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+# Следит в главном процессе за отдельными процессами камер по heartbeat и времени последнего кадра.
+# Зависший или упавший процесс останавливается и запускается заново через restart(process),
+# процесс инференса с загруженными моделями при этом не перезапускается. restart возвращает
+# None для камеры, которой уже нет в конфигурации: её процесс убирается из списка.
+class CameraWatchdog:
+    def __init__(self, logger, restart, stall_timeout=STALL_TIMEOUT, frame_age_warning=FRAME_AGE_WARNING,
+                 interval=CHECK_INTERVAL, stop_timeout=STOP_TIMEOUT):
+        self.logger = logger
+        self.restart = restart
+        self.stall_timeout = stall_timeout
+        self.frame_age_warning = frame_age_warning
+        self.interval = interval
+        self.stop_timeout = stop_timeout
+        self.last_check = 0
+        self.restarts = {}
+        self.stale = set()
+
+    def check_frames(self, process, now):
+        ip = process.ip_suffix
+        if not process.last_frame.value:
+            return
+        frame_age = now - process.last_frame.value
+        metrics.set_gauge('camera_frame_age', round(frame_age, 1), camera=ip)
+        if frame_age > self.frame_age_warning and ip not in self.stale:
+            self.stale.add(ip)
+            self.logger.warning(f"Camera {process.ip} process is running, but no frames for {frame_age:.0f} s")
+        elif frame_age <= self.frame_age_warning and ip in self.stale:
+            self.stale.discard(ip)
+            self.logger.info(f"Camera {process.ip} frames resumed")
+
+    def stall_reason(self, process, now):
+        if not process.is_alive():
+            return f"exited with code {process.exitcode}"
+        heartbeat_age = now - process.heartbeat.value
+        if heartbeat_age > self.stall_timeout:
+            return f"no heartbeat for {heartbeat_age:.0f} s"
+        return None
+
+    def check(self, processes, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_check < self.interval:
+            return
+        self.last_check = now
+        dropped = []
+        for i, process in enumerate(processes):
+            # Остановленные командой или при смене конфигурации камеры не перезапускаются.
+            # Флаг читается без блокировки: её может держать зависший процесс
+            if not process.running.get_obj().value:
+                continue
+            self.check_frames(process, now)
+            reason = self.stall_reason(process, now)
+            restart = self.restarts.setdefault(process.ip_suffix, {'count': 0, 'next': 0})
+            if reason is None:
+                if restart['count'] and now > restart['next'] and process.last_frame.value > restart['started']:
+                    restart['count'] = 0
+                continue
+            if now < restart['next']:
+                continue
+            self.logger.warning(f"Camera {process.ip} process {reason}, restarting")
+            metrics.inc('camera_restarts', camera=process.ip_suffix)
+            stop_process(process, self.stop_timeout)
+            restarted = self.restart(process)
+            if restarted is None:
+                self.logger.info(f"Camera {process.ip} is no longer configured, not restarted")
+                dropped.append(process)
+                continue
+            processes[i] = restarted
+            restart['count'] += 1
+            restart['started'] = time.monotonic()
+            restart['next'] = restart['started'] + min(RESTART_DELAY * 2 ** (restart['count'] - 1),
+                                                       RESTART_MAX_DELAY)
+            self.logger.info(f"Camera {process.ip} restarted, restart {restart['count']}")
+        processes[:] = [process for process in processes if process not in dropped]
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+
+
+# Зона камеры: прямоугольник area = [x, y, w, h] или многоугольник polygon = [[x, y], ...]
+# в координатах кадра. Для многоугольника вырезается описанный прямоугольник,
+# а всё вне многоугольника закрашивается чёрным.
+class Zone:
+    def __init__(self, name=None, area=None, polygon=None, alarm_url=None):
+        self.name = name
+        self.alarm_url = alarm_url
+        self.polygon = None
+        self.mask = None
+        self.mask_scale = 1
+        if polygon:
+            points = np.array(polygon, dtype=np.int32).reshape(-1, 2)
+            x, y = points.min(axis=0)
+            x2, y2 = points.max(axis=0)
+            self.area = (int(x), int(y), int(x2 - x) + 1, int(y2 - y) + 1)
+            self.polygon = points - (x, y)
+        else:
+            self.area = tuple(area) if area else None
+
+    def label(self, model_name):
+        return f'{model_name}_{self.name}' if self.name else model_name
+
+    def get_mask(self, shape, scale=1):
+        if self.mask is None or self.mask.shape != shape or self.mask_scale != scale:
+            self.mask = np.zeros(shape, dtype=np.uint8)
+            cv2.fillPoly(self.mask, [self.polygon // scale], 255)
+            self.mask_scale = scale
+        return self.mask
+
+    def size(self, frame_shape):
+        # Ширина и высота зоны в полном кадре
+        if self.area is None:
+            return frame_shape[1], frame_shape[0]
+        return min(self.area[2], frame_shape[1] - self.area[0]), min(self.area[3], frame_shape[0] - self.area[1])
+
+    def crop(self, image, scale=1):
+        # scale - во сколько раз кадр уменьшен при декодировании относительно координат зоны
+        if self.area is None:
+            return image
+        x, y, w, h = self.area
+        x, y, w, h = x // scale, y // scale, -(-w // scale), -(-h // scale)
+        roi = image[y:y + h, x:x + w]
+        if self.polygon is not None:
+            roi = cv2.bitwise_and(roi, roi, mask=self.get_mask(roi.shape[:2], scale))
+        return roi
+
+
+def parse_zones(zones, area=None):
+    # Без списка zones камера работает как раньше: одна безымянная зона area (или весь кадр)
+    if not zones:
+        return [Zone(area=area)]
+    return [Zone(name=zone.get('name', str(i)), area=zone.get('area'), polygon=zone.get('polygon'),
+                 alarm_url=zone.get('alarm_url'))
+            for i, zone in enumerate(zones)]